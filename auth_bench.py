@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark of access token checks, per request
+
+Times the steps get_current_user takes for a bearer token:
+
+- decode: jwt.decode alone, what every request paid before the cache;
+- cached: a TokenCache hit with no revocation store (one worker's memory);
+- memory / sqlite: a cache hit plus the lookup in the shared revocation
+  store of that backend, as the server does now, with --revoked tokens
+  already revoked;
+- revoked: rejecting a token another worker revoked, the first time
+  (decoded for its jti, then read from the store) and after (remembered by
+  the cache);
+- logout: TokenCache.revoke writing the revocation to the store.
+
+    python auth_bench.py
+    python auth_bench.py --revoked 100000 --rounds 50000 --output auth.json
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import jwt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from sqlite_store import SQLiteDatabase  # noqa: E402
+from store import RevocationStore  # noqa: E402
+from tokens import TokenCache  # noqa: E402
+
+SECRET_KEY = "auth-bench-secret-key-of-32-bytes"
+ALGORITHM = "HS256"
+
+
+def make_token(n: int, exp: float) -> str:
+    payload = {"sub": f"user{n}@example.com_9{n:09d}", "iat": int(time.time()), "exp": int(exp),
+               "jti": uuid.uuid4().hex}
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def authenticate(cache: TokenCache, token: str):
+    """get_current_user without FastAPI."""
+    cached = cache.get(token)
+    if cached is not None:
+        user_id, jti = cached
+    else:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id, jti = payload["sub"], payload["jti"]
+        cache.put(token, user_id, jti, payload["exp"])
+    return None if cache.is_revoked(jti) else user_id
+
+
+def per_call_us(function, items, rounds: int) -> float:
+    start = time.perf_counter()
+    for n in range(rounds):
+        function(items[n % len(items)])
+    return round((time.perf_counter() - start) / rounds * 1e6, 2)
+
+
+def run(args, directory: Path) -> dict:
+    exp = time.time() + 3600
+    tokens = [make_token(n, exp) for n in range(args.tokens)]
+    report = {"tokens": args.tokens, "revoked": args.revoked, "rounds": args.rounds}
+    timings = {"decode": per_call_us(lambda t: jwt.decode(t, SECRET_KEY, algorithms=[ALGORITHM]), tokens, args.rounds)}
+
+    cache = TokenCache(max_entries=args.tokens)
+    for token in tokens:
+        authenticate(cache, token)
+    timings["cached"] = per_call_us(lambda t: authenticate(cache, t), tokens, args.rounds)
+
+    database = SQLiteDatabase(str(directory / "auth.db"))
+    for name, store in (("memory", RevocationStore()), ("sqlite", database.revocations)):
+        # Revoked by another worker, so this process's cache has never seen them
+        other_worker = TokenCache(revocations=store)
+        revoked = [make_token(args.tokens + n, exp) for n in range(args.revoked)]
+        revoked_ids = [jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["jti"] for token in revoked]
+        start = time.perf_counter()
+        for jti in revoked_ids:
+            other_worker.revoke(jti, exp)
+        logout_us = round((time.perf_counter() - start) / len(revoked) * 1e6, 2)
+
+        cache = TokenCache(max_entries=args.tokens + args.revoked, revocations=store)
+        for token in tokens:
+            authenticate(cache, token)
+        timings[name] = {
+            "cached": per_call_us(lambda t: authenticate(cache, t), tokens, args.rounds),
+            "revoked_first": per_call_us(lambda t: authenticate(cache, t), revoked, len(revoked)),
+            "revoked_again": per_call_us(lambda t: authenticate(cache, t), revoked, args.rounds),
+            "logout": logout_us,
+        }
+        assert all(authenticate(cache, token) is None for token in revoked[:100])
+    database.close()
+    report["us_per_call"] = timings
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark access token checks")
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct live tokens presented")
+    parser.add_argument("--revoked", type=int, default=10000, help="tokens revoked before timing")
+    parser.add_argument("--rounds", type=int, default=100000, help="checks to time per case")
+    parser.add_argument("--dir", help="where to put the SQLite database (defaults to the system temp directory)")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="auth-bench-", dir=args.dir) as directory:
+        report = run(args, Path(directory))
+
+    timings = report["us_per_call"]
+    print(f"jwt.decode          {timings['decode']:>8} us")
+    print(f"cache hit           {timings['cached']:>8} us  (no shared revocations)")
+    for name in ("memory", "sqlite"):
+        result = timings[name]
+        print(f"{name:<6} cache hit    {result['cached']:>8} us  revoked: first {result['revoked_first']} us,"
+              f" again {result['revoked_again']} us  logout {result['logout']} us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
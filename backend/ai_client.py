@@ -0,0 +1,261 @@
+"""Async client for the will-writing AI assistant."""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+SYSTEM_MESSAGES = {
+    "english": "You are a legal assistant specializing in will writing. Provide clear, helpful advice for creating wills. Always remind users to consult with a qualified attorney for final legal advice.",
+    "hindi": "आप वसीयत लेखन में विशेषज्ञ एक कानूनी सहायक हैं। वसीयत बनाने के लिए स्पष्ट, सहायक सलाह प्रदान करें। हमेशा उपयोगकर्ताओं को अंतिम कानूनी सलाह के लिए एक योग्य वकील से सलाह लेने की याद दिलाएं।",
+    "telugu": "మీరు వీలునామా రాయడంలో ప్రత్యేకత కలిగిన న్యాయ సహాయకుడు. వీలునామాలు రూపొందించడానికి స్పష్టమైన, సహాయకరమైన సలహా అందించండి. చివరి న్యాయ సలహా కోసం అర్హత కలిగిన న్యాయవాదిని సంప్రదించాలని వినియోగదారులకు ఎల్లప్పుడూ గుర్తు చేయండి."
+}
+
+
+class AIError(Exception):
+    """Raised when the LLM call fails or times out."""
+
+
+_END = object()  # end of a streamed reply
+
+
+def system_message_for(language: str) -> str:
+    return SYSTEM_MESSAGES.get(language.lower(), SYSTEM_MESSAGES["english"])
+
+
+def build_prompt(query: str, context: str = "") -> str:
+    return f"Context: {context}\n\nQuery: {query}" if context else query
+
+
+def cache_key(language: str, system_message: str, query: str, context: str) -> str:
+    raw = "\x00".join((language.lower(), system_message, query, context or ""))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU + TTL cache of LLM replies that coalesces identical calls.
+
+    While a key is being computed, further callers for the same key await
+    the one upstream task instead of starting their own. The task is
+    shielded, so a caller that goes away does not cancel it for the rest.
+    Failures are never cached.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+        }
+
+
+class EmergentBackend:
+    """Sends prompts through emergentintegrations' LlmChat."""
+
+    def __init__(self, api_key: str, provider: str = "openai", model: str = "gpt-4o-mini"):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+
+    async def send(self, system_message: str, text: str) -> str:
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=f"will_assist_{datetime.now().timestamp()}",
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+        return await chat.send_message(UserMessage(text=text))
+
+    async def stream(self, system_message: str, text: str):
+        # LlmChat only returns whole replies, so this yields a single chunk.
+        yield await self.send(system_message, text)
+
+
+class AIClient:
+    """Awaitable LLM access with a per-call timeout and bounded concurrency.
+
+    ``backend`` is any object with an ``async send(system_message, text)``
+    method, and optionally an async-generator ``stream`` with the same
+    arguments, so a local fake can stand in for the real LLM. At most
+    ``max_concurrency`` calls are upstream at once; the rest wait on the
+    semaphore without holding up the event loop, and the timeout only
+    starts once a call has its slot. With a ``cache``, replies
+    are reused for identical (language, system message, query, context).
+    ``call_histogram``, if given, observes the duration of each upstream
+    call (cache hits excluded) labelled by operation and outcome.
+    """
+
+    def __init__(self, backend=None, timeout: float = 30.0, max_concurrency: int = 8, cache: ResponseCache = None,
+                 call_histogram=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.cache = cache
+        self.call_histogram = call_histogram
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def available(self) -> bool:
+        return self.backend is not None
+
+    def _observe(self, operation: str, outcome: str, start: float):
+        if self.call_histogram is not None:
+            self.call_histogram.observe(time.perf_counter() - start, operation, outcome)
+
+    async def _call(self, system_message: str, text: str) -> str:
+        async with self._semaphore:
+            # Timed from here, so waiting for a free slot is not an LLM timeout
+            start = time.perf_counter()
+            try:
+                reply = await asyncio.wait_for(self.backend.send(system_message, text), self.timeout)
+            except asyncio.TimeoutError:
+                self._observe("complete", "timeout", start)
+                raise AIError(f"LLM call timed out after {self.timeout}s")
+            except Exception as e:
+                self._observe("complete", "error", start)
+                raise AIError(str(e)) from e
+        self._observe("complete", "ok", start)
+        return reply
+
+    async def complete(self, query: str, language: str, context: str = "") -> str:
+        if self.backend is None:
+            raise AIError("no LLM backend configured")
+        system_message = system_message_for(language)
+        text = build_prompt(query, context)
+        if self.cache is None:
+            return await self._call(system_message, text)
+        key = cache_key(language, system_message, query, context)
+        return await self.cache.get_or_compute(key, lambda: self._call(system_message, text))
+
+    async def _open_stream(self, system_message: str, text: str):
+        if hasattr(self.backend, "stream"):
+            async for chunk in self.backend.stream(system_message, text):
+                yield chunk
+        else:
+            yield await self.backend.send(system_message, text)
+
+    async def _pump(self, system_message: str, text: str, queue: asyncio.Queue):
+        """Read the upstream stream into ``queue``, holding a slot only while upstream is open.
+
+        Ends the queue with ``_END`` or an AIError.
+        """
+        async with self._semaphore:
+            upstream = self._open_stream(system_message, text)
+            start = time.perf_counter()
+            outcome = "cancelled"
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(upstream.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        outcome = "ok"
+                        queue.put_nowait(_END)
+                        return
+                    except asyncio.TimeoutError:
+                        outcome = "timeout"
+                        queue.put_nowait(AIError(f"LLM stream stalled for {self.timeout}s"))
+                        return
+                    except Exception as e:
+                        outcome = "error"
+                        queue.put_nowait(AIError(str(e)))
+                        return
+                    queue.put_nowait(chunk)
+            finally:
+                self._observe("stream", outcome, start)
+                await upstream.aclose()
+
+    async def stream(self, query: str, language: str, context: str = ""):
+        """Yield the reply in chunks as the backend produces them.
+
+        The timeout applies to the wait for each chunk rather than the
+        whole reply. Upstream is read by a separate task, so the concurrency
+        slot is given back as soon as the LLM has finished, however slowly
+        the caller consumes the chunks; closing this generator early closes
+        the upstream stream. A cached reply is yielded as one chunk, and a
+        fully streamed reply is added to the cache.
+        """
+        if self.backend is None:
+            raise AIError("no LLM backend configured")
+        system_message = system_message_for(language)
+        text = build_prompt(query, context)
+        key = None
+        if self.cache is not None:
+            key = cache_key(language, system_message, query, context)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.hits += 1
+                yield cached
+                return
+            self.cache.misses += 1
+
+        chunks = []
+        queue = asyncio.Queue()
+        pump = asyncio.ensure_future(self._pump(system_message, text, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, AIError):
+                    raise item
+                chunks.append(item)
+                yield item
+        finally:
+            pump.cancel()
+            await asyncio.gather(pump, return_exceptions=True)
+
+        if key is not None:
+            self.cache.put(key, "".join(chunks))
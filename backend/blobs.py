@@ -0,0 +1,83 @@
+"""Content-addressed storage for uploaded files.
+
+Blobs are named by their SHA-256 and placed by the storage layout
+(``blobs/ab/cd/abcd...``), so no directory grows without bound. Identical uploads share one blob. Reference
+counts are not kept here: the file metadata store is the source of truth
+(``count_by_sha256``). A blob is removed once no file record points at it;
+legacy records holding a private copy of the same content do not count.
+Reusing a blob and removing it must therefore not interleave, including
+across worker processes sharing the store: both hold ``lock(sha256)``, an
+flock on one of ``LOCK_STRIPES`` lock files. The methods do blocking file
+I/O and are meant to run in a worker thread.
+"""
+import fcntl
+import os
+import uuid
+from pathlib import Path
+
+from layout import StorageLayout
+
+LOCK_STRIPES = 256
+
+
+class BlobStore:
+    def __init__(self, layout: StorageLayout):
+        self.layout = layout
+        self.root = layout.blobs_root
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.locks_dir = self.root / "locks"
+        self.locks_dir.mkdir(exist_ok=True)
+
+    def path_for(self, sha256: str) -> Path:
+        return self.layout.blob_path(sha256)
+
+    def owns(self, path) -> bool:
+        try:
+            Path(path).relative_to(self.root)
+        except ValueError:
+            return False
+        return True
+
+    def lock(self, sha256: str):
+        """Block until this process holds the lock for ``sha256``; close the returned file to release it."""
+        stripe = int(sha256[:4], 16) % LOCK_STRIPES
+        lock_file = open(self.locks_dir / f"{stripe:03d}", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+    def new_tmp_path(self) -> Path:
+        return self.tmp_dir / str(uuid.uuid4())
+
+    def commit(self, tmp_path: Path, sha256: str):
+        """Move a fully written temp file into place under its hash.
+
+        Returns (blob path, created). If the blob already exists the temp
+        file is dropped and nothing new is written.
+        """
+        path = self.path_for(sha256)
+        try:
+            # Touching a reused blob keeps it inside the orphan collector's
+            # grace period while the new file record is being written
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            tmp_path.unlink(missing_ok=True)
+            return path, False
+        self.layout.ensure_dir(path.parent)
+        try:
+            os.replace(tmp_path, path)
+        except FileNotFoundError:
+            # The cached directory was removed underneath us
+            self.layout.dirs.forget(path.parent)
+            self.layout.ensure_dir(path.parent)
+            os.replace(tmp_path, path)
+        return path, True
+
+    def delete(self, sha256: str):
+        self.path_for(sha256).unlink(missing_ok=True)
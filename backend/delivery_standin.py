@@ -0,0 +1,146 @@
+"""Local stand-ins for the SMTP server and the SMS/WhatsApp/voice gateway.
+
+Runs a minimal SMTP server and an HTTP gateway that accept what the outbox
+senders send, optionally slow or flaky, and record every delivery so it
+can be inspected at ``GET /messages`` on the gateway port::
+
+    python delivery_standin.py --smtp-port 1025 --http-port 8025 --fail-rate 0.1
+
+    OUTBOX_SMTP_HOST=127.0.0.1 OUTBOX_SMTP_PORT=1025 \\
+    OUTBOX_WHATSAPP_URL=http://127.0.0.1:8025/send \\
+    OUTBOX_CALL_URL=http://127.0.0.1:8025/send uvicorn server:app
+"""
+import argparse
+import asyncio
+import email
+import random
+from datetime import datetime
+from email import policy
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+class DeliveryStandIn:
+    def __init__(self, fail_rate: float = 0.0, latency: float = 0.0):
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.delivered = []
+        self.rejected = 0
+
+    def _fails(self) -> bool:
+        return random.random() < self.fail_rate
+
+    # SMTP, just enough of RFC 5321 for smtplib
+
+    async def handle_smtp(self, reader, writer):
+        def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 localhost delivery stand-in")
+        recipients = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8", "replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    reply("250-localhost")
+                    reply("250 8BITMIME")
+                elif verb in ("HELO", "NOOP"):
+                    reply("250 OK")
+                elif verb == "MAIL":
+                    recipients = []
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    if self._fails():
+                        self.rejected += 1
+                        reply("550 Mailbox unavailable (stand-in failure)")
+                    else:
+                        recipients.append(command.split(":", 1)[1].strip(" <>"))
+                        reply("250 OK")
+                elif verb == "DATA":
+                    if not recipients:
+                        reply("554 No valid recipients")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    lines = []
+                    while True:
+                        data = await reader.readline()
+                        if data in (b".\r\n", b".\n", b""):
+                            break
+                        lines.append(data[1:] if data.startswith(b"..") else data)
+                    await asyncio.sleep(self.latency)
+                    parsed = email.message_from_bytes(b"".join(lines), policy=policy.default)
+                    self._record("email", {
+                        "id": parsed["Message-ID"],
+                        "to": recipients,
+                        "subject": parsed["Subject"],
+                        "text": parsed.get_content() if not parsed.is_multipart() else "",
+                    })
+                    recipients = []
+                    reply("250 OK")
+                elif verb == "RSET":
+                    recipients = []
+                    reply("250 OK")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    # HTTP gateway for whatsapp / call
+
+    def gateway(self) -> FastAPI:
+        app = FastAPI(title="Delivery stand-in")
+
+        @app.post("/send")
+        async def send(request: Request):
+            batch = await request.json()
+            await asyncio.sleep(self.latency)
+            errors = {}
+            for message in batch.get("messages", []):
+                if self._fails():
+                    self.rejected += 1
+                    errors[message["id"]] = "stand-in failure"
+                else:
+                    self._record(batch.get("channel", "sms"), message)
+            return {"errors": errors}
+
+        @app.get("/messages")
+        async def messages():
+            return {"delivered": self.delivered, "rejected": self.rejected}
+
+        return app
+
+    def _record(self, channel: str, message: dict):
+        self.delivered.append({"channel": channel, "received_at": datetime.now().isoformat(), **message})
+        print(f"[{channel}] delivered {message.get('id')} to {message.get('to')}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local SMTP and SMS gateway stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument("--http-port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of messages to reject")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay per SMTP message / gateway batch")
+    args = parser.parse_args()
+
+    standin = DeliveryStandIn(args.fail_rate, args.latency_ms / 1000)
+    smtp = await asyncio.start_server(standin.handle_smtp, args.host, args.smtp_port)
+    http = uvicorn.Server(uvicorn.Config(standin.gateway(), host=args.host, port=args.http_port, log_level="warning"))
+    print(f"SMTP on {args.host}:{args.smtp_port}, gateway on http://{args.host}:{args.http_port}/send")
+    async with smtp:
+        await http.serve()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
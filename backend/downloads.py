@@ -0,0 +1,189 @@
+"""File responses with validators, conditional GET and byte ranges.
+
+Starlette's FileResponse sends the whole file every time. Browsers seeking
+in audio/video need ``Range`` requests (206, including multipart/byteranges),
+and repeat views should get a 304 from ``If-None-Match`` or
+``If-Modified-Since`` instead of the full body again.
+"""
+import os
+import secrets
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+
+READ_CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def parse_range(header: str, size: int):
+    """Parse a ``bytes=`` Range header into inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored (malformed, other unit or
+    too many ranges) and [] when no range is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start:
+                first = int(start)
+                last = int(end) if end else None
+            else:
+                # Suffix range: the last N bytes
+                length = int(end)
+                if length < 0:
+                    # "bytes=--5": int() accepted the second minus sign
+                    return None
+                if length == 0:
+                    continue
+                first, last = max(size - length, 0), None
+        except ValueError:
+            return None
+        if first < 0 or (last is not None and last < first):
+            return None
+        if first < size:
+            ranges.append((first, size - 1 if last is None else min(last, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def _not_modified(request_headers, etag: str, mtime: float) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+async def _read_ranges(path, ranges, parts=None, io_histogram=None):
+    # Only time spent reading counts as I/O, not time waiting on the client
+    io_seconds = 0.0
+    try:
+        with open(path, "rb") as f:
+            for index, (first, last) in enumerate(ranges):
+                if parts is not None:
+                    yield parts[index]
+                await run_in_threadpool(f.seek, first)
+                remaining = last - first + 1
+                while remaining > 0:
+                    start = time.perf_counter()
+                    chunk = await run_in_threadpool(f.read, min(READ_CHUNK_SIZE, remaining))
+                    io_seconds += time.perf_counter() - start
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    yield chunk
+                if parts is not None:
+                    yield b"\r\n"
+            if parts is not None:
+                yield parts[-1]
+    finally:
+        if io_histogram is not None:
+            io_histogram.observe(io_seconds, "download")
+
+
+def file_response(request_headers, path, filename: str, media_type: str = None, etag: str = None,
+                  io_histogram=None):
+    """Serve ``path`` honouring conditional and Range request headers.
+
+    ``etag`` should be a strong validator computed when the file was stored.
+    Without one, a weak tag is derived from size and mtime. ``io_histogram``
+    observes the total read time of each response body.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    media_type = media_type or "application/octet-stream"
+    if etag is None:
+        etag = f'W/"{size:x}-{int(stat.st_mtime):x}"'
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "accept-ranges": "bytes",
+        "cache-control": "private, no-cache",
+        "content-disposition": content_disposition(filename),
+    }
+
+    if _not_modified(request_headers, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request_headers.get("range")
+    if range_header:
+        if_range = request_headers.get("if-range")
+        # A stale If-Range validator means the client wants the whole new file
+        if if_range is None or (if_range.strip() == etag and not etag.startswith("W/")):
+            ranges = parse_range(range_header, size)
+
+    if ranges == []:
+        headers["content-range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if not ranges:
+        headers["content-length"] = str(size)
+        return StreamingResponse(_read_ranges(path, [(0, size - 1)] if size else [], io_histogram=io_histogram), media_type=media_type, headers=headers)
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        headers["content-range"] = f"bytes {first}-{last}/{size}"
+        headers["content-length"] = str(last - first + 1)
+        return StreamingResponse(_read_ranges(path, ranges, io_histogram=io_histogram), status_code=206, media_type=media_type, headers=headers)
+
+    boundary = secrets.token_hex(16)
+    parts = [
+        (f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+         f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n").encode()
+        for first, last in ranges
+    ]
+    parts.append(f"--{boundary}--\r\n".encode())
+    headers["content-length"] = str(
+        sum(len(part) for part in parts) + sum(last - first + 1 + 2 for first, last in ranges)
+    )
+    return StreamingResponse(
+        _read_ranges(path, ranges, parts, io_histogram),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
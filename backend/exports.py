@@ -0,0 +1,140 @@
+"""Streaming ZIP export of a will with its attachments.
+
+The archive is written by ``zipfile`` into a sink that is emptied after
+every chunk, so the response streams while it is being built: memory stays
+at about one read chunk whatever the size of the attachments, and nothing
+is written to disk. Because the output cannot seek back, each entry's sizes
+and CRC follow its data in a data descriptor, which every unzip tool reads.
+
+Media that is already compressed (audio/video containers, images, archives)
+is stored as is; text and documents are deflated. Reading and compressing
+run in worker threads, one chunk at a time.
+"""
+import json
+import os
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+
+from fastapi.concurrency import run_in_threadpool
+
+READ_CHUNK_SIZE = 256 * 1024
+STORED_SUFFIXES = {
+    ".webm", ".mp4", ".m4a", ".mp3", ".ogg", ".opus", ".aac", ".mov", ".mkv",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".zip", ".gz", ".7z",
+}
+
+
+class _Sink:
+    """Write-only stream for ZipFile that hands data back to the generator."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_info(name: str, modified: float, compress: bool, size: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, time.localtime(modified)[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    # A known size lets zipfile decide up front whether the entry needs ZIP64
+    info.file_size = size
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _archive_name(file_info: dict, taken: set) -> str:
+    # Only the base name of the uploaded filename, never a path from the client
+    filename = PurePosixPath(file_info["filename"].replace("\\", "/")).name or file_info["id"]
+    name = f"files/{file_info['file_type']}/{filename}"
+    stem, suffix = os.path.splitext(name)
+    number = 2
+    while name in taken:
+        name = f"{stem} ({number}){suffix}"
+        number += 1
+    taken.add(name)
+    return name
+
+
+def _copy_chunk(source, destination) -> bool:
+    chunk = source.read(READ_CHUNK_SIZE)
+    if chunk:
+        destination.write(chunk)
+    return bool(chunk)
+
+
+def _plan(will: dict, files: list):
+    """Stat every attachment up front; returns (entries, metadata)."""
+    taken = set()
+    entries = []
+    listed = []
+    missing = []
+    for file_info in files:
+        path = Path(file_info["file_path"])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            missing.append({"id": file_info["id"], "filename": file_info["filename"]})
+            continue
+        name = _archive_name(file_info, taken)
+        entries.append((name, path, stat.st_mtime, stat.st_size))
+        listed.append({
+            "id": file_info["id"],
+            "filename": file_info["filename"],
+            "file_type": file_info["file_type"],
+            "size": stat.st_size,
+            "sha256": file_info.get("sha256"),
+            "created_at": file_info["created_at"],
+            "path": name,
+        })
+    metadata = {
+        "will": {key: value for key, value in will.items() if key != "content"},
+        "files": listed,
+        "missing_files": missing,
+        "exported_at": datetime.now().isoformat(),
+    }
+    return entries, metadata
+
+
+async def will_archive(will: dict, files: list):
+    """Yield a ZIP of the will text, ``metadata.json`` and every attachment.
+
+    Attachments whose file is gone from disk are skipped and listed under
+    ``missing_files`` in the metadata.
+    """
+    entries, metadata = await run_in_threadpool(_plan, will, files)
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w")
+    now = time.time()
+
+    documents = [
+        ("will.txt", (will.get("content") or "").encode("utf-8")),
+        ("metadata.json", json.dumps(metadata, ensure_ascii=False, indent=2).encode("utf-8")),
+    ]
+    for name, data in documents:
+        archive.writestr(_zip_info(name, now, True, len(data)), data)
+        yield sink.drain()
+
+    for name, path, modified, size in entries:
+        # Blobs are named by hash, so the type comes from the archive name
+        compress = os.path.splitext(name)[1].lower() not in STORED_SUFFIXES
+        with open(path, "rb") as source, archive.open(_zip_info(name, modified, compress, size), "w") as destination:
+            while await run_in_threadpool(_copy_chunk, source, destination):
+                data = sink.drain()
+                if data:
+                    yield data
+        yield sink.drain()
+
+    archive.close()
+    yield sink.drain()
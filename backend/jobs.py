@@ -0,0 +1,116 @@
+"""Background job queue with a bounded worker pool and retries."""
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+QUEUED = "queued"
+RUNNING = "running"
+RETRYING = "retrying"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueue:
+    """Runs async jobs on ``workers`` tasks, retrying failures with backoff.
+
+    A job is an async callable plus optional ``on_success(job, result)`` and
+    ``on_failure(job, error)`` callbacks. Workers are started lazily on the
+    first submit, so the queue needs no lifespan wiring to work. Retries
+    are scheduled with ``call_later`` and do not hold a worker while they
+    wait. Only the most recent ``max_jobs`` records are kept for status
+    queries.
+    """
+
+    def __init__(self, workers: int = 4, max_attempts: int = 3, backoff: float = 1.0, max_jobs: int = 10000):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_jobs = max_jobs
+        self._queue = None
+        self._tasks = []
+        self._jobs = OrderedDict()
+        self._callables = {}
+
+    def _ensure_workers(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind: str, func, owner: str = None, on_success=None, on_failure=None,
+               job_id: str = None, **meta) -> dict:
+        """Queue ``func``; ``job_id`` resubmits a job under the id it had before a restart."""
+        self._ensure_workers()
+        job_id = job_id or str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "owner": owner,
+            "status": QUEUED,
+            "attempts": 0,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+            **meta,
+        }
+        self._jobs[job_id] = job
+        self._callables[job_id] = (func, on_success, on_failure)
+        self._trim()
+        self._queue.put_nowait(job_id)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        return len(self._callables)
+
+    def _trim(self):
+        while len(self._jobs) > self.max_jobs:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest_id in self._callables:
+                break
+            del self._jobs[oldest_id]
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self._jobs[job_id]
+        func, on_success, on_failure = self._callables[job_id]
+        job["status"] = RUNNING
+        job["attempts"] += 1
+        try:
+            result = await func()
+        except Exception as e:
+            job["error"] = str(e)
+            if job["attempts"] < self.max_attempts:
+                job["status"] = RETRYING
+                delay = self.backoff * 2 ** (job["attempts"] - 1)
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+                return
+            job["status"] = FAILED
+            callback, outcome = on_failure, e
+        else:
+            job["status"] = SUCCEEDED
+            job["error"] = None
+            callback, outcome = on_success, result
+        job["finished_at"] = datetime.now().isoformat()
+        del self._callables[job_id]
+        if callback is not None:
+            try:
+                callback(job, outcome)
+            except Exception as e:
+                print(f"Job {job_id} callback error: {e}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,91 @@
+"""On-disk layout for per-user directories and content-addressed blobs.
+
+Everything under ``user_data/`` is sharded by a hex digest into a fixed
+fan-out tree, ``ab/cd/abcd...``: two levels of 256 directories, so no single
+directory holds more than 256 entries until a leaf does, and a leaf only
+sees about one in 65,536 of the keys. Users are keyed by a hash of their id
+rather than the raw ``email_mobile`` string; blobs are keyed by their
+SHA-256.
+
+Directories known to exist are remembered, so putting a file in place costs
+no ``mkdir`` once its directory has been seen. The layout is fixed: stored
+file paths depend on it, and ``migrate_storage.py`` moves trees written by
+the old flat layout.
+"""
+import hashlib
+from pathlib import Path
+
+FANOUT_LEVELS = 2
+FANOUT_WIDTH = 2
+USER_SUBDIRS = ("audio", "video", "documents")
+
+
+class DirectoryCache:
+    """Directories known to exist, by key; the oldest entry is dropped when full."""
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._known = {}
+
+    def __len__(self):
+        return len(self._known)
+
+    def get(self, key):
+        return self._known.get(key)
+
+    def add(self, key, path: Path):
+        if len(self._known) >= self.max_entries:
+            del self._known[next(iter(self._known))]
+        self._known[key] = path
+
+    def ensure(self, path: Path) -> Path:
+        if path not in self._known:
+            path.mkdir(parents=True, exist_ok=True)
+            self.add(path, path)
+        return path
+
+    def forget(self, key):
+        """Drop an entry after its directory was removed, e.g. by garbage collection."""
+        self._known.pop(key, None)
+
+
+class StorageLayout:
+    def __init__(self, root, cache_size: int = 20_000):
+        self.root = Path(root)
+        self.users_root = self.root / "users"
+        self.blobs_root = self.root / "blobs"
+        self.quarantine_root = self.root / "quarantine"
+        self.dirs = DirectoryCache(cache_size)
+
+    @staticmethod
+    def shard(digest: str) -> Path:
+        parts = [digest[i * FANOUT_WIDTH:(i + 1) * FANOUT_WIDTH] for i in range(FANOUT_LEVELS)]
+        return Path(*parts, digest)
+
+    @staticmethod
+    def user_key(user_id: str) -> str:
+        return hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+
+    def user_dir(self, user_id: str) -> Path:
+        return self.users_root / self.shard(self.user_key(user_id))
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blobs_root / self.shard(sha256)
+
+    def ensure_dir(self, path: Path) -> Path:
+        return self.dirs.ensure(path)
+
+    def ensure_user_dir(self, user_id: str) -> Path:
+        """The user's directory with its per-type subdirectories in place.
+
+        Cached by user id, so after the first call it is one dict lookup
+        with no hashing, path building or syscalls.
+        """
+        key = ("user", user_id)
+        user_dir = self.dirs.get(key)
+        if user_dir is None:
+            user_dir = self.user_dir(user_id)
+            for name in USER_SUBDIRS:
+                (user_dir / name).mkdir(parents=True, exist_ok=True)
+            self.dirs.add(key, user_dir)
+        return user_dir
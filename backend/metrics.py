@@ -0,0 +1,204 @@
+"""Request and timing metrics in the Prometheus text format.
+
+A small in-process registry rather than a client library: counters, gauges
+and histograms keyed by label values, rendered on demand. Observations are
+made from the event loop, so there is no locking. Each worker process keeps
+its own numbers.
+"""
+import bisect
+import re
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Latency histogram; ``observe`` is one bisect and two additions."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf) and the sum
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Counts, in-flight gauges and latency per route template.
+
+    Requests are labelled with the route's path template (``/api/wills/{will_id}``),
+    never the raw path, so label cardinality is bounded by the number of
+    routes. Paths that match no route share the label ``unmatched``. Latency
+    runs until the app returns, which includes streamed response bodies.
+    """
+
+    def __init__(self, app, registry: Registry):
+        self.app = app
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "HTTP requests currently being served.", ("method", "route"))
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+        self._routes = None
+        self._matchers = {}
+
+    def _matcher(self, method):
+        """One alternation over the route patterns that accept ``method``.
+
+        The first matching alternative is the route Starlette would pick, and
+        a single regex search costs far less than trying each route in turn.
+        Routes that match with another method are still labelled (as a 405).
+        """
+        patterns = []
+        paths = []
+        for route in self._routes:
+            if method is None or method in route.methods:
+                parts = re.split(r"({[^}]+})", route.path)
+                patterns.append("".join(
+                    (".*" if part.endswith(":path}") else "[^/]+") if part.startswith("{") else re.escape(part)
+                    for part in parts
+                ))
+                paths.append(route.path)
+        regex = re.compile("|".join(f"({pattern})" for pattern in patterns)) if patterns else None
+        return regex, paths
+
+    def _route_for(self, scope) -> str:
+        if self._routes is None:
+            self._routes = [route for route in scope["app"].router.routes if getattr(route, "methods", None)]
+        for method in (scope["method"], None):
+            matcher = self._matchers.get(method)
+            if matcher is None:
+                matcher = self._matchers[method] = self._matcher(method)
+            regex, paths = matcher
+            match = regex.fullmatch(scope["path"]) if regex else None
+            if match:
+                return paths[match.lastindex - 1]
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route_for(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.duration.observe(time.perf_counter() - start, method, route)
+            self.in_flight.dec(method, route)
+            self.requests.inc(method, route, str(status))
@@ -0,0 +1,114 @@
+"""Move user directories from the old flat layout into the sharded one.
+
+Before the storage layout, each user had ``user_data/<email>_<mobile>/``
+directly under ``user_data/``. This moves every such directory to its place
+in the hashed fan-out tree (one rename per user, so file contents are never
+copied) and rewrites the ``file_path`` of file records that pointed into it.
+Blobs are already sharded and stay where they are.
+
+Run it from the backend directory with the same STORAGE_BACKEND / DATA_DIR
+settings as the server, while the server is stopped::
+
+    python migrate_storage.py --dry-run
+    python migrate_storage.py
+
+It can be re-run after an interruption: directories already moved are
+skipped and records still pointing at the old location are fixed.
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+
+def reserved_names(layout) -> set:
+    return {layout.users_root.name, layout.blobs_root.name, layout.quarantine_root.name}
+
+
+def legacy_directories(root: Path, layout) -> list:
+    reserved = reserved_names(layout)
+    return sorted(entry for entry in root.iterdir() if entry.is_dir() and entry.name not in reserved)
+
+
+def merge_directory(source: Path, destination: Path) -> list:
+    """Move the contents of ``source`` into an existing ``destination``.
+
+    Returns the paths left behind because the destination already had them.
+    """
+    conflicts = []
+    for entry in source.iterdir():
+        target = destination / entry.name
+        if not target.exists():
+            os.replace(entry, target)
+        elif entry.is_dir() and target.is_dir():
+            conflicts += merge_directory(entry, target)
+        else:
+            conflicts.append(entry)
+    if not conflicts:
+        source.rmdir()
+    return conflicts
+
+
+def migrated_path(file_path: str, root: Path, layout):
+    """New location for a path under a legacy user directory, else None."""
+    path = Path(file_path)
+    for base in (root, root.resolve()):
+        try:
+            relative = path.relative_to(base)
+            break
+        except ValueError:
+            continue
+    else:
+        return None
+    if len(relative.parts) < 2 or relative.parts[0] in reserved_names(layout):
+        return None
+    new_path = layout.user_dir(relative.parts[0]).joinpath(*relative.parts[1:])
+    return new_path.resolve() if path.is_absolute() else new_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move user_data/ into the sharded storage layout")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+    args = parser.parse_args()
+
+    import server
+
+    root = server.USER_DATA_DIR
+    layout = server.storage_layout
+    moved = merged = 0
+    conflicts = []
+    try:
+        for source in legacy_directories(root, layout):
+            destination = layout.user_dir(source.name)
+            print(f"{source} -> {destination}")
+            if args.dry_run:
+                continue
+            if destination.exists():
+                conflicts += merge_directory(source, destination)
+                merged += 1
+            else:
+                layout.ensure_dir(destination.parent)
+                os.replace(source, destination)
+                moved += 1
+
+        rewritten = 0
+        for file_info in server.files_db.all():
+            new_path = migrated_path(file_info["file_path"], root, layout)
+            if new_path is None:
+                continue
+            rewritten += 1
+            if not args.dry_run:
+                server.files_db.update(file_info["id"], {"file_path": str(new_path)})
+    finally:
+        if server.journal is not None:
+            server.journal.close()
+
+    print(f"{moved} directories moved, {merged} merged, {rewritten} file records rewritten"
+          + (" (dry run)" if args.dry_run else ""))
+    for path in conflicts:
+        print(f"left in place, already exists at the destination: {path}")
+    return 1 if conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Persistent outbox for messages to will beneficiaries.
+
+``send_message`` only appends a record to the message store. One delivery
+task per channel (email, whatsapp, call) claims due messages in batches and
+hands each batch to that channel's sender. A claim is a lease: it marks the
+messages ``sending`` and pushes their ``next_attempt_at`` past the lease, so
+if the process dies mid-delivery they become due again once the lease
+expires. With the SQLite store the claim is a single transaction, so
+several worker processes never deliver the same message twice at once.
+Failed deliveries are retried with exponential backoff until
+``max_attempts``.
+"""
+import asyncio
+import json
+import random
+import smtplib
+import time
+import urllib.request
+from datetime import datetime
+from email.message import EmailMessage
+
+from fastapi.concurrency import run_in_threadpool
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class SMTPSender:
+    """Sends a batch of emails over one SMTP connection."""
+
+    def __init__(self, host: str, port: int = 25, from_address: str = "noreply@localhost",
+                 username: str = None, password: str = None, starttls: bool = False, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.from_address = from_address
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def _email(self, message: dict) -> EmailMessage:
+        email = EmailMessage()
+        email["From"] = self.from_address
+        email["To"] = message["recipient_email"]
+        email["Subject"] = f"A message for {message['recipient_name']}"
+        email["Message-ID"] = f"<{message['id']}@willwriting>"
+        email.set_content(message["message_text"])
+        return email
+
+    def _send(self, messages: list) -> dict:
+        errors = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for message in messages:
+                try:
+                    smtp.send_message(self._email(message))
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                    errors[message["id"]] = str(e)
+        return errors
+
+    async def send_batch(self, messages: list) -> dict:
+        """Return {message_id: error} for the messages that failed."""
+        return await run_in_threadpool(self._send, messages)
+
+
+class HTTPGatewaySender:
+    """Posts a batch to an SMS/WhatsApp/voice gateway as one JSON request.
+
+    The gateway answers with ``{"errors": {message_id: reason}}`` for the
+    messages it rejected; any other 2xx answer means all were accepted.
+    """
+
+    def __init__(self, url: str, channel: str, timeout: float = 30.0):
+        self.url = url
+        self.channel = channel
+        self.timeout = timeout
+
+    def _send(self, messages: list) -> dict:
+        payload = {
+            "channel": self.channel,
+            "messages": [
+                {"id": m["id"], "to": m["recipient_phone"], "name": m["recipient_name"], "text": m["message_text"]}
+                for m in messages
+            ],
+        }
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = response.read()
+        try:
+            return json.loads(body or b"{}").get("errors") or {}
+        except ValueError:
+            return {}
+
+    async def send_batch(self, messages: list) -> dict:
+        return await run_in_threadpool(self._send, messages)
+
+
+class Outbox:
+    """Delivery workers over a message store, one per configured channel.
+
+    ``senders`` maps a channel to an object with ``async send_batch(messages)``
+    returning {message_id: error} for failures; raising fails the whole
+    batch. Messages for a channel without a sender stay pending.
+    """
+
+    def __init__(self, store, senders: dict, batch_size: int = 50, max_attempts: int = 5,
+                 retry_delay: float = 30.0, lease: float = 300.0, poll_interval: float = 5.0):
+        self.store = store
+        self.senders = senders
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._wakeups = {}
+        self._tasks = []
+
+    def submit(self, message: dict) -> dict:
+        """Store a new message for delivery; O(1) and never waits on delivery."""
+        now = time.time()
+        record = {
+            **message,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "last_error": None,
+            "delivered_at": None,
+            "updated_at": datetime.now().isoformat(),
+        }
+        self.store.add(record)
+        wakeup = self._wakeups.get(record["channel"])
+        if wakeup is not None:
+            wakeup.set()
+        return record
+
+    def start(self):
+        for channel in self.senders:
+            self._wakeups[channel] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._deliver_forever(channel)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _deliver_forever(self, channel: str):
+        wakeup = self._wakeups[channel]
+        while True:
+            try:
+                delivered = await self.deliver(channel)
+            except Exception as e:
+                print(f"Outbox {channel} delivery error: {e}")
+                delivered = 0
+            # A full batch means more may be waiting; otherwise sleep until
+            # a new message arrives or retries may have come due
+            if delivered < self.batch_size:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def deliver(self, channel: str) -> int:
+        """Claim and send one batch for ``channel``; returns its size."""
+        now = time.time()
+        batch = self.store.claim(channel, now, now + self.lease, self.batch_size)
+        if not batch:
+            return 0
+        try:
+            errors = await self.senders[channel].send_batch(batch)
+        except Exception as e:
+            errors = {message["id"]: str(e) or type(e).__name__ for message in batch}
+
+        for message in batch:
+            error = errors.get(message["id"])
+            if error is None:
+                fields = {"status": SENT, "last_error": None, "delivered_at": datetime.now().isoformat()}
+            elif message["attempts"] >= self.max_attempts:
+                fields = {"status": FAILED, "last_error": error}
+            else:
+                delay = self.retry_delay * 2 ** (message["attempts"] - 1)
+                fields = {
+                    "status": PENDING,
+                    "last_error": error,
+                    "next_attempt_at": time.time() + delay * random.uniform(0.8, 1.2),
+                }
+            fields["updated_at"] = datetime.now().isoformat()
+            self.store.update(message["id"], fields)
+        return len(batch)
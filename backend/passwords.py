@@ -0,0 +1,46 @@
+"""Password hashing on a bounded worker pool."""
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+
+class PasswordHasher:
+    """PBKDF2-SHA256 hashing that never runs on the event loop.
+
+    hashlib's PBKDF2 releases the GIL, so a thread pool of ``workers``
+    threads spreads hashing across cores without pickling overhead. Hashes
+    from before this scheme (bare hex SHA-256) and PBKDF2 hashes with fewer
+    than ``rounds`` iterations still verify. ``verify_and_update`` then
+    returns a replacement hash so the caller can upgrade the stored value.
+
+    ``dummy_hash`` is a hash of a random password at the current rounds.
+    Verifying against it costs the same as verifying a real user's, so a
+    login for an unknown username can take as long as a wrong password.
+    """
+
+    def __init__(self, rounds: int = 29000, workers: int = None):
+        self.context = CryptContext(
+            schemes=["pbkdf2_sha256", "hex_sha256"],
+            deprecated=["hex_sha256"],
+            pbkdf2_sha256__rounds=rounds,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.dummy_hash = self.context.hash(secrets.token_hex(16))
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """Return (valid, new_hash); new_hash is None unless an upgrade is due."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self.context.verify_and_update, password, hashed)
+        except ValueError:
+            # Unrecognised hash format
+            return False, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
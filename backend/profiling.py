@@ -0,0 +1,210 @@
+"""Opt-in sampling profiler for individual requests.
+
+While a selected request runs, a thread samples the Python stacks of every
+other thread (event loop, threadpool and hashing workers, journal flusher)
+every ``interval`` seconds. Each sample is counted as a folded stack
+(``thread;caller;callee count``), the format flamegraph.pl, speedscope and
+inferno read directly. Samples whose innermost frame is an idle wait (the
+selector, a lock, a queue or an idle pool worker) are dropped, so the
+profile shows where CPU time went.
+
+The event loop is shared, so a profile also contains work done for other
+requests served at the same time. Only one request is profiled at a time.
+"""
+import hmac
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+
+IDLE_MODULES = ("selectors.py", "threading.py", "queue.py", "futures/thread.py")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+    return name.replace(";", ":")
+
+
+def fold(frame, root: str):
+    """Folded stack for ``frame``, or None if the thread is idle."""
+    if frame.f_code.co_filename.endswith(IDLE_MODULES):
+        return None
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, loop_thread: int, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.loop_thread = loop_thread
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.started = time.perf_counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                if thread_id == self.loop_thread:
+                    root = "event-loop"
+                else:
+                    # Pool threads differ only by a trailing number; merge them
+                    root = re.sub(r"[_-]?\d+$", "", names.get(thread_id, "thread"))
+                stack = fold(frame, root)
+                if stack is not None:
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class Profiler:
+    """Selects requests to profile and keeps the newest ``keep`` profiles.
+
+    A request is profiled when it carries ``X-Profile-Token`` equal to
+    ``token`` or, independently, with probability ``sample_rate``. Profiles
+    are written to ``directory`` as ``<id>.folded`` with a ``<id>.json``
+    summary beside each one.
+    """
+
+    def __init__(self, directory, token: str = None, sample_rate: float = 0.0,
+                 interval: float = 0.005, keep: int = 100):
+        self.directory = Path(directory)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self._active = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def is_admin(self, presented) -> bool:
+        """Constant-time check of an ``X-Profile-Token`` value (str or raw bytes)."""
+        if not self.token or presented is None:
+            return False
+        if isinstance(presented, str):
+            presented = presented.encode("latin-1")
+        return hmac.compare_digest(presented, self.token.encode())
+
+    def start(self):
+        """Begin sampling, or return None if a profile is already running."""
+        if self._active:
+            return None
+        self._active = True
+        sampler = _Sampler(threading.get_ident(), self.interval)
+        sampler.start()
+        return sampler
+
+    async def finish(self, sampler, profile_id: str, method: str, path: str, status: int) -> dict:
+        duration = time.perf_counter() - sampler.started
+        try:
+            await run_in_threadpool(sampler.stop)
+        finally:
+            self._active = False
+        summary = {
+            "id": profile_id,
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "samples": sampler.samples,
+            "interval_ms": self.interval * 1000,
+            "created_at": time.time(),
+        }
+        await run_in_threadpool(self._write, summary, sampler.stacks)
+        return summary
+
+    def _write(self, summary: dict, stacks: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lines = "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+        (self.directory / f"{summary['id']}.folded").write_text(lines, encoding="utf-8")
+        (self.directory / f"{summary['id']}.json").write_text(json.dumps(summary), encoding="utf-8")
+        summaries = sorted(self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime)
+        for old in summaries[:max(len(summaries) - self.keep, 0)]:
+            old.with_suffix(".folded").unlink(missing_ok=True)
+            old.unlink(missing_ok=True)
+
+    def list(self) -> list:
+        summaries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                summaries.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return sorted(summaries, key=lambda summary: summary["created_at"], reverse=True)
+
+    def path_for(self, profile_id: str):
+        try:
+            uuid.UUID(profile_id)
+        except ValueError:
+            return None
+        path = self.directory / f"{profile_id}.folded"
+        return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """Profiles requests chosen by a ``Profiler``.
+
+    Only install it when the profiler is enabled, so that a disabled
+    profiler adds no per-request work at all. The profile id is returned in
+    ``X-Profile-Id`` only to callers who sent the admin token.
+    """
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        presented = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile-token":
+                presented = value
+                break
+        admin = self.profiler.is_admin(presented)
+        if not admin and not (self.profiler.sample_rate and random.random() < self.profiler.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = self.profiler.start()
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = str(uuid.uuid4())
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if admin:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await self.profiler.finish(sampler, profile_id, scope["method"], scope["path"], status)
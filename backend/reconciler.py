@@ -0,0 +1,306 @@
+"""Background reconciliation of stored files against file metadata.
+
+A pass has five phases, each walked a batch at a time:
+
+1. every file record: is its file on disk? Missing files are restored from
+   quarantine when a copy is there, otherwise reported;
+2. blobs: a blob no file record points at is an orphan;
+3. per-user directories: files from before the blob store that no record
+   points at are orphans;
+4. the blob store's temp directory: leftovers of uploads that failed
+   halfway are orphans;
+5. quarantine: entries older than the retention period are deleted, or put
+   back if a record points at them again.
+
+Only entries older than ``grace`` seconds are considered, so files being
+written or just committed are never touched. Orphans are first moved to
+``user_data/quarantine/`` (same relative path, so they can go back) and
+only deleted on a later pass. Filesystem operations are rate limited to
+``io_budget`` per ``interval`` seconds and run in worker threads;
+metadata lookups stay on the event loop.
+
+With several worker processes sharing a database, a lock file makes sure
+only one of them reconciles at a time.
+"""
+import asyncio
+import fcntl
+import os
+import time
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+
+MISSING_REPORT_LIMIT = 100
+
+
+def _list_dir(path: Path) -> list:
+    try:
+        return sorted(os.listdir(path))
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
+def _stat_entries(path: Path) -> list:
+    """(name, is_dir, mtime) of each entry in ``path``."""
+    entries = []
+    try:
+        with os.scandir(path) as scan:
+            for entry in scan:
+                try:
+                    entries.append((entry.name, entry.is_dir(follow_symlinks=False), entry.stat().st_mtime))
+                except FileNotFoundError:
+                    continue
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return sorted(entries)
+
+
+def _move(source: Path, destination: Path, touch: bool = False) -> bool:
+    try:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, destination)
+        if touch:
+            os.utime(destination)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class StorageReconciler:
+    def __init__(self, layout, files_db, lock_path, lock_for=None, registry=None,
+                 io_budget: int = 200, interval: float = 1.0, grace: float = 3600.0,
+                 retention: float = 7 * 86400.0, pass_interval: float = 600.0):
+        self.layout = layout
+        self.files_db = files_db
+        self.lock_path = Path(lock_path)
+        self.lock_for = lock_for
+        self.io_budget = io_budget
+        self.interval = interval
+        self.grace = grace
+        self.retention = retention
+        self.pass_interval = pass_interval
+        self.last_report = None
+        self._tokens = io_budget
+        self._lock_file = None
+        self._task = None
+        self._orphans = self._missing = None
+        if registry is not None:
+            self._orphans = registry.counter(
+                "storage_orphans_total", "Orphaned files handled by the storage reconciler.", ("action",))
+            self._missing = registry.gauge(
+                "storage_missing_files", "File records whose file was missing in the last reconcile pass.")
+
+    @property
+    def enabled(self) -> bool:
+        return self.io_budget > 0
+
+    def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire(self) -> bool:
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                if self._acquire():
+                    report = await self.run_pass()
+                    print(f"Storage reconcile: {report['files_checked']} files checked, "
+                          f"{report['missing_count']} missing, {report['quarantined']} quarantined, "
+                          f"{report['deleted']} deleted, {report['restored']} restored")
+                    for file_info in report["missing"]:
+                        print(f"Storage reconcile: missing {file_info['file_path']} for file {file_info['id']}")
+            except Exception as e:
+                print(f"Storage reconcile error: {e}")
+            await asyncio.sleep(self.pass_interval)
+
+    async def _spend(self, operations: int):
+        """Wait until ``operations`` more filesystem operations fit the budget."""
+        self._tokens -= operations
+        while self._tokens <= 0:
+            await asyncio.sleep(self.interval)
+            self._tokens += self.io_budget
+
+    def _quarantine_path(self, path: Path) -> Path:
+        return self.layout.quarantine_root / Path(path).relative_to(self.layout.root)
+
+    def _count(self, report: dict, action: str):
+        report[action] += 1
+        if self._orphans is not None:
+            self._orphans.inc(action)
+
+    async def run_pass(self) -> dict:
+        report = {
+            "started_at": time.time(),
+            "files_checked": 0,
+            "missing": [],
+            "missing_count": 0,
+            "quarantined": 0,
+            "deleted": 0,
+            "restored": 0,
+        }
+        referenced = await self._check_records(report)
+        await self._collect_blobs(report)
+        await self._collect_user_files(report, referenced)
+        await self._collect_tmp(report)
+        await self._sweep_quarantine(report, referenced)
+        report["finished_at"] = time.time()
+        if self._missing is not None:
+            self._missing.set(report["missing_count"])
+        self.last_report = report
+        return report
+
+    # Phase 1: metadata -> disk
+
+    async def _check_records(self, report: dict) -> set:
+        """Report missing files; returns the paths of files outside the blob store."""
+        referenced = set()
+        cursor = None
+        while True:
+            records, cursor = self.files_db.scan(cursor, self.io_budget)
+            paths = [Path(file_info["file_path"]) for file_info in records]
+            exists = await run_in_threadpool(lambda: [path.exists() for path in paths])
+            await self._spend(len(paths))
+            for file_info, path, present in zip(records, paths, exists):
+                report["files_checked"] += 1
+                if not self._in_blob_store(path):
+                    referenced.add(os.path.abspath(path))
+                if present:
+                    continue
+                if await self._restore(path):
+                    self._count(report, "restored")
+                    continue
+                report["missing_count"] += 1
+                if len(report["missing"]) < MISSING_REPORT_LIMIT:
+                    report["missing"].append({"id": file_info["id"], "file_path": file_info["file_path"]})
+            if cursor is None:
+                return referenced
+
+    def _in_blob_store(self, path: Path) -> bool:
+        return os.path.abspath(path).startswith(os.path.abspath(self.layout.blobs_root) + os.sep)
+
+    async def _restore(self, path: Path) -> bool:
+        try:
+            quarantined = self._quarantine_path(path)
+        except ValueError:
+            return False
+        await self._spend(1)
+        return await run_in_threadpool(_move, quarantined, path)
+
+    # Phases 2-4: disk -> metadata
+
+    async def _walk_shards(self, root: Path):
+        """Yield (path, mtime) of old enough files in a two-level fan-out tree."""
+        cutoff = time.time() - self.grace
+        for first in await run_in_threadpool(_list_dir, root):
+            if len(first) != 2:
+                continue
+            await self._spend(1)
+            for second in await run_in_threadpool(_list_dir, root / first):
+                entries = await run_in_threadpool(_stat_entries, root / first / second)
+                await self._spend(1 + len(entries))
+                for name, is_dir, mtime in entries:
+                    yield root / first / second / name, is_dir, mtime < cutoff
+
+    async def _quarantine(self, path: Path, report: dict, still_orphaned=None):
+        await self._spend(1)
+        if await run_in_threadpool(_move, path, self._quarantine_path(path), True):
+            if still_orphaned is not None and not still_orphaned():
+                # Referenced again while moving, e.g. by another worker
+                await run_in_threadpool(_move, self._quarantine_path(path), path)
+                return
+            self._count(report, "quarantined")
+
+    async def _collect_blobs(self, report: dict):
+        async for path, is_dir, old in self._walk_shards(self.layout.blobs_root):
+            sha256 = path.name
+            if is_dir or not old or self.files_db.count_by_sha256(sha256):
+                continue
+            still_orphaned = lambda: self.files_db.count_by_sha256(sha256) == 0  # noqa: E731
+            if self.lock_for is None:
+                await self._quarantine(path, report, still_orphaned)
+                continue
+            # Same lock as storing and deleting files, so neither can race the move
+            async with self.lock_for(f"blob:{sha256}"):
+                if still_orphaned():
+                    await self._quarantine(path, report, still_orphaned)
+
+    async def _collect_user_files(self, report: dict, referenced: set):
+        cutoff = time.time() - self.grace
+        async for user_dir, is_dir, _ in self._walk_shards(self.layout.users_root):
+            if not is_dir:
+                continue
+            for file_type in await run_in_threadpool(_list_dir, user_dir):
+                entries = await run_in_threadpool(_stat_entries, user_dir / file_type)
+                await self._spend(1 + len(entries))
+                for name, entry_is_dir, mtime in entries:
+                    path = user_dir / file_type / name
+                    if entry_is_dir or mtime >= cutoff or os.path.abspath(path) in referenced:
+                        continue
+                    await self._quarantine(path, report)
+
+    async def _collect_tmp(self, report: dict):
+        cutoff = time.time() - self.grace
+        entries = await run_in_threadpool(_stat_entries, self.layout.blobs_root / "tmp")
+        await self._spend(1 + len(entries))
+        for name, is_dir, mtime in entries:
+            if not is_dir and mtime < cutoff:
+                await self._quarantine(self.layout.blobs_root / "tmp" / name, report)
+
+    # Phase 5: quarantine
+
+    def _still_needed(self, original: Path, referenced: set) -> bool:
+        if self._in_blob_store(original):
+            return original.parent.name != "tmp" and self.files_db.count_by_sha256(original.name) > 0
+        return os.path.abspath(original) in referenced
+
+    async def _sweep_quarantine(self, report: dict, referenced: set):
+        cutoff = time.time() - self.retention
+        root = self.layout.quarantine_root
+        walked = await run_in_threadpool(lambda: list(os.walk(root, topdown=False)))
+        await self._spend(len(walked))
+        for directory, _, names in walked:
+            directory = Path(directory)
+            for name in names:
+                path = directory / name
+                original = self.layout.root / path.relative_to(root)
+                if self._still_needed(original, referenced):
+                    await self._spend(1)
+                    if await run_in_threadpool(_move, path, original):
+                        self._count(report, "restored")
+                    continue
+                try:
+                    mtime = await run_in_threadpool(os.path.getmtime, path)
+                except FileNotFoundError:
+                    continue
+                await self._spend(2)
+                if mtime < cutoff:
+                    await run_in_threadpool(Path.unlink, path, True)
+                    self._count(report, "deleted")
+            if directory != root:
+                await run_in_threadpool(self._remove_if_empty, directory)
+
+    @staticmethod
+    def _remove_if_empty(directory: Path):
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
@@ -0,0 +1,181 @@
+"""Compact record types for the in-memory user, will and file stores.
+
+A dict per record repeats its keys in every record's hash table and keeps
+its own copy of every value. These records are ``__slots__`` objects
+instead: the field names live on the class, strings that repeat across
+records (owner ids, languages, file types, blob hashes) are interned so
+all records share one copy, and ISO timestamps are held as integer
+microseconds. Record ids are unique, so interning them would save nothing.
+
+Records are read-only Mappings with the same keys as the dicts they stand
+for, so handlers index them exactly as before. Timestamps turn back into
+the original ISO strings when read, so a record becomes its JSON shape only
+when a response or a snapshot is encoded. Keys outside ``FIELDS`` are kept
+in a small per-record dict, so new fields need no change here.
+"""
+import sys
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_ABSENT = object()
+_setattr = object.__setattr__
+_intern = sys.intern
+_PLAIN, _TIMESTAMP, _INTERNED = "plain", "timestamp", "interned"
+
+
+def _round_trips(value, moment):
+    """``moment.isoformat() == value``, without formatting in the usual case."""
+    # This runs for every timestamp replayed from the journal. Text in the
+    # layout isoformat() writes, with every field parsed from a fixed
+    # position, round-trips unless it spells zero microseconds.
+    size = len(value)
+    if (size == 19 or (size == 26 and value[19] == "." and moment.microsecond)) and value.isascii() \
+            and value[4] == value[7] == "-" and value[10] == "T" and value[13] == value[16] == ":" \
+            and value[11:13] != "24":
+        return True
+    return moment.isoformat() == value
+
+
+def encode_timestamp(value):
+    """Integer microseconds for a naive ISO timestamp, if it round-trips exactly."""
+    if type(value) is not str:
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    # Aware times and other spellings of the same instant stay strings
+    if moment.tzinfo is not None or not _round_trips(value, moment):
+        return value
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def decode_timestamp(value):
+    if type(value) is not int:
+        return value
+    return (_EPOCH + timedelta(0, 0, value)).isoformat()
+
+
+def sort_key(value):
+    """Comparable form of a timestamp; encoded ones order like their ISO text."""
+    value = encode_timestamp(value)
+    return (0, value) if type(value) is int else (1, value)
+
+
+class _Record(Mapping):
+    __slots__ = ("_extra",)
+
+    FIELDS = ()
+    _kinds = {}
+
+    def __init__(self, data):
+        # _set inlined: this runs for every record replayed from the journal
+        kinds = self._kinds
+        extra = None
+        for key, value in data.items():
+            kind = kinds.get(key)
+            if kind is _PLAIN:
+                _setattr(self, key, value)
+            elif kind is _TIMESTAMP:
+                _setattr(self, key, encode_timestamp(value))
+            elif kind is _INTERNED:
+                _setattr(self, key, _intern(value) if type(value) is str else value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        _setattr(self, "_extra", extra)
+
+    def _set(self, key, value):
+        kind = self._kinds.get(key)
+        if kind is None:
+            if self._extra is None:
+                _setattr(self, "_extra", {})
+            self._extra[key] = value
+            return
+        if kind is _TIMESTAMP:
+            value = encode_timestamp(value)
+        elif kind is _INTERNED and type(value) is str:
+            value = _intern(value)
+        _setattr(self, key, value)
+
+    def replace(self, fields: dict):
+        """A copy with ``fields`` updated; records are never changed in place."""
+        record = object.__new__(type(self))
+        for key in self.FIELDS:
+            value = getattr(self, key, _ABSENT)
+            if value is not _ABSENT:
+                _setattr(record, key, value)
+        _setattr(record, "_extra", dict(self._extra) if self._extra else None)
+        for key, value in fields.items():
+            record._set(key, value)
+        return record
+
+    def __getitem__(self, key):
+        kind = self._kinds.get(key)
+        if kind is not None:
+            value = getattr(self, key, _ABSENT)
+            if value is not _ABSENT:
+                return decode_timestamp(value) if kind is _TIMESTAMP else value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._kinds:
+            return getattr(self, key, _ABSENT) is not _ABSENT
+        return self._extra is not None and key in self._extra
+
+    def sort_key(self, key):
+        """``sort_key(self[key])`` without decoding the timestamp."""
+        if self._kinds.get(key) is not _TIMESTAMP:
+            return sort_key(self.get(key))
+        value = getattr(self, key, None)
+        return (0, value) if type(value) is int else (1, value)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if getattr(self, key, _ABSENT) is not _ABSENT:
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is read-only; use replace()")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+def _record_type(name: str, fields: tuple, timestamps=(), interned=()):
+    """A record class with a slot per field; other keys go to ``_extra``."""
+    kinds = {}
+    for key in fields:
+        kinds[key] = _TIMESTAMP if key in timestamps else _INTERNED if key in interned else _PLAIN
+    return type(name, (_Record,), {"__slots__": fields, "FIELDS": fields, "_kinds": kinds})
+
+
+UserRecord = _record_type(
+    "UserRecord",
+    ("id", "email", "mobile", "password", "created_at"),
+    timestamps=("created_at",),
+)
+WillRecord = _record_type(
+    "WillRecord",
+    ("id", "user_id", "title", "language", "content", "ai_suggestions", "ai_job_id", "ai_status", "created_at",
+     "updated_at"),
+    timestamps=("created_at", "updated_at"),
+    interned=("user_id", "language", "ai_status"),
+)
+FileRecord = _record_type(
+    "FileRecord",
+    ("id", "user_id", "will_id", "filename", "stored_filename", "file_type", "file_path", "size", "sha256",
+     "created_at"),
+    timestamps=("created_at",),
+    interned=("user_id", "will_id", "stored_filename", "file_type", "file_path", "sha256"),
+)
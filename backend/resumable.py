@@ -0,0 +1,165 @@
+"""Resumable chunked uploads that survive restarts.
+
+Each session is a directory under the upload root holding ``data`` (the
+file being assembled, written at arbitrary offsets) and ``meta.json``
+(owner, declared size and the byte ranges received so far). A chunk's
+bytes are fsynced before ``meta.json`` records them. After a crash the
+recorded ranges are therefore never ahead of the data. Clients ask for
+the missing ranges and resend only those. Updates to a session hold an
+flock on its ``lock`` file, so worker processes sharing the upload root
+cannot lose each other's ranges. The methods here do blocking file I/O
+and are meant to run in a worker thread.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def merge_ranges(ranges, start: int, end: int):
+    """Add the half-open range [start, end) to sorted, disjoint ``ranges``."""
+    merged = []
+    for lo, hi in ranges:
+        if hi < start or lo > end:
+            merged.append([lo, hi])
+        else:
+            start, end = min(lo, start), max(hi, end)
+    merged.append([start, end])
+    return sorted(merged)
+
+
+def missing_ranges(ranges, size: int):
+    missing = []
+    position = 0
+    for lo, hi in ranges:
+        if lo > position:
+            missing.append([position, lo])
+        position = max(position, hi)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+class ResumableUploads:
+    def __init__(self, directory, ttl: float = 24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def _session_dir(self, upload_id: str) -> Path:
+        # Only canonical UUIDs map to a directory, so ids cannot escape the root
+        return self.directory / str(uuid.UUID(upload_id))
+
+    def _save_meta(self, session_dir: Path, meta: dict):
+        tmp_path = session_dir / "meta.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, session_dir / "meta.json")
+
+    @contextmanager
+    def _locked(self, upload_id: str):
+        """Hold the session's lock and yield its meta, or None if it is gone."""
+        try:
+            fd = os.open(self._session_dir(upload_id) / "lock", os.O_RDWR | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            yield None
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Read under the lock: another worker may have added ranges since
+            yield self.load(upload_id)
+        finally:
+            os.close(fd)
+
+    def create(self, user_id: str, will_id: str, filename: str, file_type: str, size: int) -> dict:
+        upload_id = str(uuid.uuid4())
+        session_dir = self._session_dir(upload_id)
+        session_dir.mkdir()
+        with open(session_dir / "data", "wb") as f:
+            f.truncate(size)
+        now = time.time()
+        meta = {
+            "id": upload_id,
+            "user_id": user_id,
+            "will_id": will_id,
+            "filename": filename,
+            "file_type": file_type,
+            "size": size,
+            "ranges": [],
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._save_meta(session_dir, meta)
+        return meta
+
+    def load(self, upload_id: str):
+        try:
+            session_dir = self._session_dir(upload_id)
+            with open(session_dir / "meta.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return None
+
+    def write_chunk(self, upload_id: str, offset: int, data: bytes):
+        """Write and record a chunk; returns the new meta, or None if the session is gone."""
+        with self._locked(upload_id) as meta:
+            if meta is None:
+                return None
+            session_dir = self._session_dir(upload_id)
+            fd = os.open(session_dir / "data", os.O_WRONLY)
+            try:
+                os.pwrite(fd, data, offset)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            meta["ranges"] = merge_ranges(meta["ranges"], offset, offset + len(data))
+            meta["updated_at"] = time.time()
+            self._save_meta(session_dir, meta)
+            return meta
+
+    def finalize(self, upload_id: str, destination: Path):
+        """Move the assembled file to ``destination``; returns (size, sha256).
+
+        Returns None if the session is gone, e.g. finalized by another worker.
+        """
+        with self._locked(upload_id) as meta:
+            if meta is None:
+                return None
+            session_dir = self._session_dir(upload_id)
+            data_path = session_dir / "data"
+            digest = hashlib.sha256()
+            with open(data_path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            shutil.move(str(data_path), str(destination))
+            shutil.rmtree(session_dir, ignore_errors=True)
+            return meta["size"], digest.hexdigest()
+
+    def discard(self, upload_id: str):
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def collect_expired(self, now: float = None) -> int:
+        """Remove sessions untouched for longer than the TTL."""
+        now = time.time() if now is None else now
+        removed = 0
+        for session_dir in self.directory.iterdir():
+            if not session_dir.is_dir():
+                continue
+            try:
+                idle_since = (session_dir / "meta.json").stat().st_mtime
+            except OSError:
+                # A session that never got its meta file written
+                idle_since = session_dir.stat().st_mtime
+            if now - idle_since > self.ttl:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                removed += 1
+        return removed
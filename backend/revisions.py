@@ -0,0 +1,169 @@
+"""Will revision history stored as text deltas with periodic checkpoints.
+
+Each revision records the will content either in full (a checkpoint) or as
+a delta against the revision before it. A delta is a list whose items are
+``[start, end]`` (copy that slice of the previous text) or a string
+(insert it). Revisions point at the checkpoint their chain starts from, so
+rebuilding any revision applies at most ``checkpoint_every - 1`` deltas.
+"""
+import difflib
+
+
+def _common_length(a: str, b: str, from_end: bool = False) -> int:
+    # Binary search with slice comparisons, which run at C speed; a plain
+    # character loop costs milliseconds on a long will
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if (a[len(a) - mid:] == b[len(b) - mid:]) if from_end else (a[:mid] == b[:mid]):
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def make_delta(old: str, new: str) -> list:
+    """Describe ``new`` as copies from ``old`` plus inserted text."""
+    prefix = _common_length(old, new)
+    suffix = _common_length(old[prefix:], new[prefix:], from_end=True)
+
+    delta = []
+
+    def copy(start, end):
+        if start == end:
+            return
+        if delta and isinstance(delta[-1], list) and delta[-1][1] == start:
+            delta[-1][1] = end
+        else:
+            delta.append([start, end])
+
+    def insert(text):
+        if not text:
+            return
+        if delta and isinstance(delta[-1], str):
+            delta[-1] += text
+        else:
+            delta.append(text)
+
+    copy(0, prefix)
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    if old_middle and new_middle:
+        # Match whole lines inside the changed region; edits are usually local
+        # so this region is small even for long wills
+        old_lines = old_middle.splitlines(keepends=True)
+        new_lines = new_middle.splitlines(keepends=True)
+        old_offsets = [prefix]
+        for line in old_lines:
+            old_offsets.append(old_offsets[-1] + len(line))
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                copy(old_offsets[i1], old_offsets[i2])
+            else:
+                insert("".join(new_lines[j1:j2]))
+    else:
+        insert(new_middle)
+    copy(len(old) - suffix, len(old))
+    return delta
+
+
+def apply_delta(old: str, delta: list) -> str:
+    return "".join(old[item[0]:item[1]] if isinstance(item, list) else item for item in delta)
+
+
+def _delta_size(delta: list) -> int:
+    return sum(len(item) if isinstance(item, str) else 2 for item in delta)
+
+
+def _lines(text: str) -> list:
+    """Lines ending at "\\n" only, as diff and patch split them, endings kept."""
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def unified_diff(old: str, new: str, old_label: str, new_label: str) -> str:
+    lines = difflib.unified_diff(
+        _lines(old),
+        _lines(new),
+        fromfile=old_label,
+        tofile=new_label,
+    )
+    # A last line without a newline gets the marker diff and patch use,
+    # instead of running into the next line of the output
+    return "".join(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n" for line in lines)
+
+
+class StaleRevisionError(Exception):
+    """The will changed after the caller read it; its latest revision is not the one being updated."""
+
+
+class RevisionHistory:
+    """Records and rebuilds will revisions on top of a revision store.
+
+    The store only keeps records; this class decides what each record holds.
+    A revision is a checkpoint when it is the first one, when its chain has
+    reached ``checkpoint_every`` revisions, or when the delta would not be
+    smaller than the text itself.
+    """
+
+    def __init__(self, store, checkpoint_every: int = 32):
+        self.store = store
+        self.checkpoint_every = checkpoint_every
+
+    def record(self, will: dict, previous: dict = None) -> dict:
+        """Store the will's current state as its next revision.
+
+        ``previous`` is the will as it was before this update. Wills created
+        before revisions were kept get it recorded first as revision 1.
+        The delta is taken against ``previous``, so if another save has
+        recorded a revision since ``previous`` was read, StaleRevisionError
+        is raised rather than storing a delta against the wrong base.
+        """
+        latest = self.store.latest(will["id"])
+        if latest is None and previous is not None:
+            latest = self._add(previous, 1, None, None)
+        elif latest is not None and previous is not None and latest["created_at"] != previous["updated_at"]:
+            raise StaleRevisionError(f"will {will['id']} has revision {latest['number']} newer than the one read")
+        number = latest["number"] + 1 if latest else 1
+        previous_content = previous["content"] if previous is not None else None
+        return self._add(will, number, latest, previous_content)
+
+    def _add(self, will, number, latest, previous_content):
+        revision = {
+            "will_id": will["id"],
+            "number": number,
+            "title": will["title"],
+            "language": will["language"],
+            "size": len(will["content"]),
+            "created_at": will["updated_at"],
+        }
+        if latest is not None and previous_content is not None and number - latest["base"] < self.checkpoint_every:
+            delta = make_delta(previous_content, will["content"])
+            if _delta_size(delta) < len(will["content"]):
+                revision["base"] = latest["base"]
+                revision["delta"] = delta
+                return self.store.add(revision)
+        revision["base"] = number
+        revision["content"] = will["content"]
+        return self.store.add(revision)
+
+    def list(self, will_id: str) -> list:
+        """Revision metadata, newest first, without content."""
+        return [
+            {key: value for key, value in revision.items() if key not in ("content", "delta", "base")}
+            for revision in reversed(self.store.list_for_will(will_id))
+        ]
+
+    def get(self, will_id: str, number: int):
+        """Revision ``number`` with its text rebuilt, or None if it does not exist."""
+        chain = self.store.chain(will_id, number)
+        if not chain:
+            return None
+        text = chain[0]["content"]
+        for revision in chain[1:]:
+            text = apply_delta(text, revision["delta"])
+        revision = {key: value for key, value in chain[-1].items() if key not in ("content", "delta", "base")}
+        revision["content"] = text
+        return revision
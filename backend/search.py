@@ -0,0 +1,186 @@
+"""Full-text search over a user's wills.
+
+Wills are written in Telugu, Hindi and English. Python's ``\\w`` stops at
+the vowel signs and viramas of Indic scripts (they are combining marks,
+not letters), which would split most Telugu and Devanagari words. The
+tokenizer therefore also accepts the Indic blocks and the combining
+diacritics, excluding only the danda punctuation marks. Text is NFC
+normalized and case-folded. Zero-width joiners are dropped so that spelling
+variants typed with and without them match.
+
+Each user has their own inverted index, so a query only touches that user's
+postings and its cost does not grow with the total number of wills.
+Results are ranked with BM25. Title terms count ``TITLE_WEIGHT`` times, and
+a query term ending in ``*`` matches every term with that prefix.
+"""
+import bisect
+import math
+import re
+import unicodedata
+
+TITLE_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[\w\u0300-\u036f\u0900-\u0963\u0966-\u0dff\u200c\u200d]+")
+_JOINERS = str.maketrans("", "", "\u200c\u200d")
+
+
+def tokenize(text: str) -> list:
+    text = unicodedata.normalize("NFC", text).casefold()
+    tokens = []
+    for token in _TOKEN.findall(text):
+        token = token.translate(_JOINERS).strip("_")
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def will_terms(will: dict) -> dict:
+    """Term -> weight for a will's title and content."""
+    terms = {}
+    for token in tokenize(will.get("title") or ""):
+        terms[token] = terms.get(token, 0) + TITLE_WEIGHT
+    for token in tokenize(will.get("content") or ""):
+        terms[token] = terms.get(token, 0) + 1
+    return terms
+
+
+def parse_query(query: str) -> list:
+    """Return (term, is_prefix) pairs; ``term*`` is a prefix query."""
+    parsed = []
+    for part in query.split():
+        prefix = part.endswith("*")
+        for token in tokenize(part):
+            parsed.append((token, False))
+        if prefix and parsed:
+            parsed[-1] = (parsed[-1][0], True)
+    return list(dict.fromkeys(parsed))
+
+
+def search(index, user_id: str, query: str, limit: int = 20) -> list:
+    """Rank the user's wills for ``query``; returns (will_id, score) pairs.
+
+    ``index`` is a SearchIndex or SQLiteSearchIndex. A prefix term scores
+    as one term whose frequency sums over every term it matches.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return []
+    doc_count, total_length = index.stats(user_id)
+    if not doc_count:
+        return []
+    average_length = total_length / doc_count
+
+    scores = {}
+    for term, prefix in terms:
+        weights = {}
+        lengths = {}
+        for will_id, weight, length in index.postings(user_id, term, prefix):
+            weights[will_id] = weights.get(will_id, 0) + weight
+            lengths[will_id] = length
+        if not weights:
+            continue
+        idf = math.log(1 + (doc_count - len(weights) + 0.5) / (len(weights) + 0.5))
+        for will_id, weight in weights.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[will_id] / average_length)
+            scores[will_id] = scores.get(will_id, 0.0) + idf * weight * (BM25_K1 + 1) / (weight + norm)
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+class _UserIndex:
+    __slots__ = ("postings", "terms", "docs", "total_length")
+
+    def __init__(self):
+        self.postings = {}  # term -> {will_id: weight}
+        self.terms = []  # sorted vocabulary, for prefix queries
+        self.docs = {}  # will_id -> (length, terms)
+        self.total_length = 0
+
+
+class SearchIndex:
+    """In-memory inverted index, partitioned by will owner.
+
+    It is derived data, so it is not journaled. Given ``load``, a function
+    returning one user's wills from the will store, each user's index is
+    built on that user's first search, so startup does not tokenize every
+    will and users who never search cost nothing. Without it the index
+    holds whatever ``build`` and ``update`` put in.
+    """
+
+    def __init__(self, load=None):
+        self._users = {}
+        self._load = load
+
+    def __len__(self):
+        """Wills indexed so far; with ``load``, only those of users who searched."""
+        return sum(len(user.docs) for user in self._users.values())
+
+    def build(self, wills):
+        for will in wills:
+            self.update(will)
+
+    def _user(self, user_id):
+        user = self._users.get(user_id)
+        if user is None and self._load is not None:
+            user = self._users[user_id] = _UserIndex()
+            for will in self._load(user_id):
+                self._index(user, will)
+        return user
+
+    def update(self, will: dict):
+        """Index a will, replacing whatever was indexed for it before."""
+        user = self._users.get(will["user_id"])
+        if user is None:
+            if self._load is not None:
+                # Not searched yet: the first search loads the stored will
+                return
+            user = self._users[will["user_id"]] = _UserIndex()
+        self._remove(user, will["id"])
+        self._index(user, will)
+
+    def _index(self, user, will):
+        terms = will_terms(will)
+        length = sum(terms.values())
+        for term, weight in terms.items():
+            postings = user.postings.get(term)
+            if postings is None:
+                postings = user.postings[term] = {}
+                bisect.insort(user.terms, term)
+            postings[will["id"]] = weight
+        user.docs[will["id"]] = (length, terms)
+        user.total_length += length
+
+    def _remove(self, user, will_id):
+        doc = user.docs.pop(will_id, None)
+        if doc is None:
+            return
+        length, terms = doc
+        user.total_length -= length
+        for term in terms:
+            postings = user.postings[term]
+            del postings[will_id]
+            if not postings:
+                del user.postings[term]
+                del user.terms[bisect.bisect_left(user.terms, term)]
+
+    def stats(self, user_id):
+        user = self._user(user_id)
+        return (len(user.docs), user.total_length) if user else (0, 0)
+
+    def postings(self, user_id, term, prefix=False):
+        user = self._user(user_id)
+        if user is None:
+            return
+        if prefix:
+            start = end = bisect.bisect_left(user.terms, term)
+            while end < len(user.terms) and user.terms[end].startswith(term):
+                end += 1
+            matched = user.terms[start:end]
+        else:
+            matched = [term] if term in user.postings else []
+        for candidate in matched:
+            for will_id, weight in user.postings[candidate].items():
+                yield will_id, weight, user.docs[will_id][0]
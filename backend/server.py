@@ -1,11 +1,13 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, status
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Dict, Any
 import os
 import json
+import base64
 import uuid
 import hashlib
 import jwt
@@ -13,13 +15,50 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import asyncio
 from pathlib import Path
-import shutil
 import mimetypes
+import weakref
+from contextlib import aclosing, asynccontextmanager
+
+from store import UserStore, WillStore, FileStore, RevisionStore, MessageStore, RevocationStore, DuplicateError
+from ai_client import AIClient, AIError, EmergentBackend, ResponseCache
+from jobs import JobQueue, QUEUED, RUNNING, SUCCEEDED, FAILED
+from journal import Journal, DurableWritesMiddleware
+from sqlite_store import SQLiteDatabase, DatabaseBusyError
+from resumable import ResumableUploads, missing_ranges
+from blobs import BlobStore
+from layout import StorageLayout
+from downloads import file_response, content_disposition
+from exports import will_archive
+from tokens import TokenCache
+from uploads import UploadLimitMiddleware
+from passwords import PasswordHasher
+from revisions import RevisionHistory, StaleRevisionError, unified_diff
+from search import SearchIndex, search
+from metrics import Registry, MetricsMiddleware
+from profiling import Profiler, ProfilingMiddleware
+from outbox import Outbox, SMTPSender, HTTPGatewaySender
+from reconciler import StorageReconciler
 
 load_dotenv()
 
 app = FastAPI(title="Will Writing App", version="1.0.0")
 
+# Uploads are copied in fixed-size chunks; limits are per file_type
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = {
+    "audio": 200 * 1024 * 1024,
+    "video": 1024 * 1024 * 1024,
+    "documents": 25 * 1024 * 1024,
+}
+
+# Bodies over their type's limit (?file_type=..., else the largest) are
+# refused before they are spooled; added before CORS so the 413 still
+# carries its headers. 64 kB leaves room for the multipart framing.
+UPLOAD_FRAMING_BYTES = 64 * 1024
+app.add_middleware(UploadLimitMiddleware, prefix="/api/files/upload/",
+                   max_bytes=max(MAX_UPLOAD_BYTES.values()) + UPLOAD_FRAMING_BYTES,
+                   limits={file_type: limit + UPLOAD_FRAMING_BYTES for file_type, limit in MAX_UPLOAD_BYTES.items()})
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -29,11 +68,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metrics, served in the Prometheus text format on /api/metrics
+metrics = Registry()
+llm_call_seconds = metrics.histogram(
+    "ai_llm_call_seconds", "Upstream LLM call latency.", ("operation", "outcome"))
+disk_io_seconds = metrics.histogram(
+    "disk_io_seconds", "Time spent reading or writing file content, per request.", ("operation",))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # if set, scrapes must send it as a bearer token
+
 # Security
 security = HTTPBearer()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv("PASSWORD_HASH_ROUNDS", "29000")),
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1))),
+)
+
+# AI assistance
+EMERGENT_LLM_KEY = os.getenv("EMERGENT_LLM_KEY")
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1024"))  # 0 disables the cache
+ai_client = AIClient(
+    backend=EmergentBackend(EMERGENT_LLM_KEY) if EMERGENT_LLM_KEY else None,
+    timeout=float(os.getenv("AI_TIMEOUT_SECONDS", "30")),
+    max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "8")),
+    cache=ResponseCache(
+        max_entries=AI_CACHE_SIZE,
+        ttl=float(os.getenv("AI_CACHE_TTL_SECONDS", "3600")),
+    ) if AI_CACHE_SIZE > 0 else None,
+    call_histogram=llm_call_seconds,
+)
+ai_jobs = JobQueue(
+    workers=int(os.getenv("AI_JOB_WORKERS", "4")),
+    max_attempts=int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3")),
+)
 
 # File storage paths
 UPLOAD_DIR = Path("uploads")
@@ -41,10 +110,147 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 USER_DATA_DIR = Path("user_data")
 USER_DATA_DIR.mkdir(exist_ok=True)
 
-# In-memory storage (replace with database in production)
-users_db = {}
-wills_db = {}
-files_db = {}
+# User directories and blobs are sharded by hash under USER_DATA_DIR.
+# Uploaded bytes are stored once per distinct SHA-256, shared across files
+storage_layout = StorageLayout(USER_DATA_DIR)
+blob_store = BlobStore(storage_layout)
+
+# Resumable upload sessions live under UPLOAD_DIR until finalized
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+resumable_uploads = ResumableUploads(
+    UPLOAD_DIR / "sessions",
+    ttl=float(os.getenv("RESUMABLE_UPLOAD_TTL_HOURS", "24")) * 3600,
+)
+_locks = weakref.WeakValueDictionary()
+
+# Storage backend: "memory" keeps records in-process, made durable by an
+# append-only journal plus snapshots; "sqlite" shares one WAL-mode database
+# file so several worker processes can serve traffic. SQLITE_SYNCHRONOUS=NORMAL
+# (the default) keeps fsync off the event loop: commits survive a crash of
+# the process, but a power loss can drop those since the last checkpoint,
+# run every SQLITE_CHECKPOINT_INTERVAL_MS in a background thread. FULL keeps
+# every acknowledged write, like the journal, at one fsync per commit. A
+# request that waits longer than SQLITE_BUSY_TIMEOUT_MS for another worker's
+# write lock gets a 503.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+DATA_DIR.mkdir(exist_ok=True)
+journal = None
+
+if STORAGE_BACKEND == "sqlite":
+    database = SQLiteDatabase(
+        os.getenv("SQLITE_PATH", str(DATA_DIR / "willwriting.db")),
+        busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "200")) / 1000,
+        synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper(),
+        checkpoint_interval=float(os.getenv("SQLITE_CHECKPOINT_INTERVAL_MS", "1000")) / 1000,
+    )
+    users_db, wills_db, files_db = database.users, database.wills, database.files
+    revisions_db = database.revisions
+    messages_db = database.messages
+    revocations_db = database.revocations
+    search_index = database.search
+    search_index.build()
+elif STORAGE_BACKEND == "memory":
+    users_db = UserStore()
+    wills_db = WillStore()
+    files_db = FileStore()
+    revisions_db = RevisionStore()
+    messages_db = MessageStore()
+    revocations_db = RevocationStore()
+    journal = Journal(
+        DATA_DIR,
+        [users_db, wills_db, files_db, revisions_db, messages_db, revocations_db],
+        flush_interval=float(os.getenv("JOURNAL_FLUSH_INTERVAL_MS", "10")) / 1000,
+        snapshot_every=int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "100000")),
+        retry_interval=float(os.getenv("JOURNAL_RETRY_SECONDS", "1")),
+    )
+    journal.open()
+    app.add_middleware(DurableWritesMiddleware, journal=journal)
+    # The search index is derived from the wills, so it is rebuilt rather than
+    # journaled: per user, on their first search, not for everyone at startup
+    search_index = SearchIndex(load=wills_db.list_for_owner)
+else:
+    raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+@app.exception_handler(DatabaseBusyError)
+async def database_busy(request: Request, exc: DatabaseBusyError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Storage is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+# Logouts are recorded in the storage backend so every worker rejects the
+# token; the cache keeps verified and revoked tokens off the slow path
+token_cache = TokenCache(
+    max_entries=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    revocations=revocations_db,
+)
+
+# Messages: send_message only writes to the outbox and a task per configured
+# channel delivers them in batches. Channels without a sender stay pending.
+MESSAGE_CHANNELS = ("email", "whatsapp", "call")
+message_senders = {}
+if os.getenv("OUTBOX_SMTP_HOST"):
+    message_senders["email"] = SMTPSender(
+        host=os.getenv("OUTBOX_SMTP_HOST"),
+        port=int(os.getenv("OUTBOX_SMTP_PORT", "25")),
+        from_address=os.getenv("OUTBOX_EMAIL_FROM", "noreply@localhost"),
+        username=os.getenv("OUTBOX_SMTP_USER") or None,
+        password=os.getenv("OUTBOX_SMTP_PASSWORD") or None,
+        starttls=os.getenv("OUTBOX_SMTP_STARTTLS", "false").lower() == "true",
+    )
+for channel in ("whatsapp", "call"):
+    if os.getenv(f"OUTBOX_{channel.upper()}_URL"):
+        message_senders[channel] = HTTPGatewaySender(os.getenv(f"OUTBOX_{channel.upper()}_URL"), channel)
+outbox = Outbox(
+    messages_db,
+    message_senders,
+    batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "50")),
+    max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5")),
+    retry_delay=float(os.getenv("OUTBOX_RETRY_SECONDS", "30")),
+    poll_interval=float(os.getenv("OUTBOX_POLL_SECONDS", "5")),
+)
+
+# Orphaned files under USER_DATA_DIR are quarantined, then deleted, by a
+# rate-limited background walk; RECONCILE_IO_BUDGET=0 turns it off
+storage_reconciler = StorageReconciler(
+    storage_layout,
+    files_db,
+    lock_path=DATA_DIR / "reconciler.lock",
+    lock_for=lambda key: _blob_lock(key),
+    registry=metrics,
+    io_budget=int(os.getenv("RECONCILE_IO_BUDGET", "200")),
+    interval=float(os.getenv("RECONCILE_INTERVAL_SECONDS", "1")),
+    grace=float(os.getenv("ORPHAN_GRACE_HOURS", "1")) * 3600,
+    retention=float(os.getenv("QUARANTINE_RETENTION_DAYS", "7")) * 86400,
+    pass_interval=float(os.getenv("RECONCILE_PASS_INTERVAL_SECONDS", "600")),
+)
+
+# Request profiling is off unless an admin token or a sampling rate is set;
+# when off the middleware is not installed at all
+profiler = Profiler(
+    DATA_DIR / "profiles",
+    token=os.getenv("PROFILING_TOKEN") or None,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    keep=int(os.getenv("PROFILE_KEEP", "100")),
+)
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Outermost, so request latency includes waiting for durable writes
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
+# Every saved version of a will, as deltas with a full copy every N revisions
+will_history = RevisionHistory(revisions_db, checkpoint_every=int(os.getenv("REVISION_CHECKPOINT_EVERY", "32")))
+
+# List endpoints return newest-first pages and leave large text fields out
+# unless asked for with fields=... (or fields=all)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+WILL_LIST_FIELDS = ("id", "user_id", "title", "language", "ai_job_id", "ai_status", "created_at", "updated_at")
+FILE_LIST_FIELDS = ("id", "user_id", "will_id", "filename", "file_type", "size", "sha256", "created_at")
 
 # Pydantic models
 class UserSignup(BaseModel):
@@ -71,82 +277,212 @@ class MessageSend(BaseModel):
     preference: str  # whatsapp, email, call
     will_id: Optional[str] = None
 
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    file_type: str  # audio, video, documents
+    size: int
+
 class AIAssistRequest(BaseModel):
     query: str
     language: str
     will_context: Optional[str] = ""
 
 # Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
-
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    # jti makes every token distinct, even two logins in the same second, so
+    # a logout revokes only the session it came from
+    to_encode.update({"iat": now, "exp": now + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Async so it runs on the event loop instead of a threadpool hop per request
+    token = credentials.credentials
+    cached = token_cache.get(token)
+    if cached is not None:
+        user_id, jti = cached
+    else:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.PyJWTError:
+            raise HTTPException(status_code=401, detail="submit")
+        user_id, jti = payload.get("sub"), payload.get("jti")
+        # Tokens without a jti could not be revoked on their own
+        if user_id is None or jti is None:
             raise HTTPException(status_code=401, detail="submit")
-        return user_id
-    except jwt.PyJWTError:
+        token_cache.put(token, user_id, jti, payload["exp"])
+    if token_cache.is_revoked(jti):
         raise HTTPException(status_code=401, detail="submit")
+    return user_id
 
 def create_user_directory(user_id: str):
-    user_dir = USER_DATA_DIR / user_id
-    user_dir.mkdir(exist_ok=True)
-    (user_dir / "audio").mkdir(exist_ok=True)
-    (user_dir / "video").mkdir(exist_ok=True)
-    (user_dir / "documents").mkdir(exist_ok=True)
-    return user_dir
-
-def get_ai_assistance(query: str, language: str, context: str = "") -> str:
+    return storage_layout.ensure_user_dir(user_id)
+
+def _lock_for(key: str) -> asyncio.Lock:
+    # One lock per key, dropped once nobody holds a reference to it
+    lock = _locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[key] = lock
+    return lock
+
+@asynccontextmanager
+async def _blob_lock(key: str):
+    # The blob store's file lock on top, so other worker processes are excluded too
+    async with _lock_for(key):
+        lock_file = await run_in_threadpool(blob_store.lock, key.removeprefix("blob:"))
+        try:
+            yield
+        finally:
+            lock_file.close()
+
+def register_file(user_id: str, will_id: str, filename: str, stored_filename: str,
+                  file_type: str, file_path: Path, size: int, sha256: str) -> dict:
+    file_info = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "will_id": will_id,
+        "filename": filename,
+        "stored_filename": stored_filename,
+        "file_type": file_type,
+        "file_path": str(file_path),
+        "size": size,
+        "sha256": sha256,
+        "created_at": datetime.now().isoformat()
+    }
+    return files_db.add(file_info)
+
+async def store_file(user_id: str, will_id: str, filename: str, file_type: str,
+                     tmp_path: Path, size: int, sha256: str) -> dict:
+    """Move a hashed temp file into the blob store and record the new file"""
+    # Held with delete_file so a blob cannot be removed between reuse and registration
+    async with _blob_lock(f"blob:{sha256}"):
+        with disk_io_seconds.time("blob_commit"):
+            blob_path, _ = await run_in_threadpool(blob_store.commit, tmp_path, sha256)
+        return register_file(user_id, will_id, filename, sha256, file_type, blob_path, size, sha256)
+
+def save_upload(source, destination: Path, max_bytes: int):
+    """Copy an upload to disk in chunks, hashing it in the same pass.
+
+    Returns (size, sha256 hex digest), or None if the upload exceeds
+    ``max_bytes``, in which case the partial file is removed. Runs in a
+    worker thread so large uploads never block the event loop.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(destination, "wb") as buffer:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            digest.update(chunk)
+            buffer.write(chunk)
+    if size > max_bytes:
+        destination.unlink(missing_ok=True)
+        return None
+    return size, digest.hexdigest()
+
+def encode_cursor(record: dict, sort_key: str) -> str:
+    raw = json.dumps([record[sort_key], record["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        sort_value, record_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(sort_value), str(record_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str], default: tuple):
+    """Fields to return: the defaults, a comma list, or None for all"""
+    if not fields:
+        return default
+    if fields == "all":
+        return None
+    return ("id",) + tuple(name.strip() for name in fields.split(",") if name.strip() and name.strip() != "id")
+
+def project(record: dict, fields) -> dict:
+    if fields is None:
+        return dict(record)
+    return {name: record[name] for name in fields if name in record}
+
+async def get_ai_assistance(query: str, language: str, context: str = "") -> str:
     """Get AI assistance for will writing"""
+    if not ai_client.available:
+        return "AI assistance is currently unavailable. Please contact support."
     try:
-        # Import emergentintegrations
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
-        # Get API key from environment
-        api_key = os.getenv('EMERGENT_LLM_KEY')
-        if not api_key:
-            return "AI assistance is currently unavailable. Please contact support."
-        
-        # Create system message based on language
-        system_messages = {
-            "english": "You are a legal assistant specializing in will writing. Provide clear, helpful advice for creating wills. Always remind users to consult with a qualified attorney for final legal advice.",
-            "hindi": "आप वसीयत लेखन में विशेषज्ञ एक कानूनी सहायक हैं। वसीयत बनाने के लिए स्पष्ट, सहायक सलाह प्रदान करें। हमेशा उपयोगकर्ताओं को अंतिम कानूनी सलाह के लिए एक योग्य वकील से सलाह लेने की याद दिलाएं।",
-            "telugu": "మీరు వీలునామా రాయడంలో ప్రత్యేకత కలిగిన న్యాయ సహాయకుడు. వీలునామాలు రూపొందించడానికి స్పష్టమైన, సహాయకరమైన సలహా అందించండి. చివరి న్యాయ సలహా కోసం అర్హత కలిగిన న్యాయవాదిని సంప్రదించాలని వినియోగదారులకు ఎల్లప్పుడూ గుర్తు చేయండి."
-        }
-        
-        system_message = system_messages.get(language.lower(), system_messages["english"])
-        
-        # Create chat instance
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"will_assist_{datetime.now().timestamp()}",
-            system_message=system_message
-        ).with_model("openai", "gpt-4o-mini")
-        
-        # Prepare user message
-        full_query = f"Context: {context}\n\nQuery: {query}" if context else query
-        user_message = UserMessage(text=full_query)
-        
-        # Get response
-        response = asyncio.run(chat.send_message(user_message))
-        return response
-        
-    except Exception as e:
+        return await ai_client.complete(query, language, context)
+    except AIError as e:
         print(f"AI assistance error: {e}")
         return "AI assistance is currently unavailable. Please try again later."
 
+def _store_will_suggestions(job: dict, suggestions: str, job_status: str = SUCCEEDED):
+    will_info = wills_db.get(job["will_id"])
+    # A later save may have queued a newer job; only the latest one wins
+    if will_info and will_info.get("ai_job_id") == job["id"]:
+        wills_db.update(job["will_id"], {"ai_suggestions": suggestions, "ai_status": job_status})
+
+def _will_suggestions_failed(job: dict, error: Exception):
+    print(f"AI assistance error: {error}")
+    _store_will_suggestions(job, "AI assistance is currently unavailable. Please try again later.", FAILED)
+
+def _job_from_will(job_id: str) -> Optional[dict]:
+    """Status of a will's AI job as recorded on the will, for jobs queued by another worker"""
+    will_info = wills_db.find_by_ai_job(job_id)
+    if will_info is None:
+        return None
+    job_status = will_info.get("ai_status") or (SUCCEEDED if will_info.get("ai_suggestions") else QUEUED)
+    return {
+        "id": job_id,
+        "kind": "will_ai_suggestions",
+        "owner": will_info["user_id"],
+        "status": job_status,
+        "will_id": will_info["id"],
+    }
+
+def enqueue_will_suggestions(will_id: str, user_id: str, content: str, language: str,
+                             job_id: Optional[str] = None) -> Optional[str]:
+    """Queue an AI review of a will's content and return the job id"""
+    if not ai_client.available:
+        wills_db.update(will_id, {
+            "ai_suggestions": "AI assistance is currently unavailable. Please contact support.",
+            "ai_status": FAILED,
+        })
+        return None
+    ai_query = f"Help me improve this will content: {content}"
+    job = ai_jobs.submit(
+        "will_ai_suggestions",
+        lambda: ai_client.complete(ai_query, language),
+        owner=user_id,
+        on_success=_store_will_suggestions,
+        on_failure=_will_suggestions_failed,
+        job_id=job_id,
+        will_id=will_id,
+    )
+    wills_db.update(will_id, {"ai_job_id": job["id"], "ai_status": QUEUED})
+    return job["id"]
+
+def resume_will_suggestions() -> int:
+    """Queue again, under their old ids, the AI jobs lost when the server stopped.
+
+    Jobs live in process memory, so without this their wills would report
+    "queued" forever. With several SQLite workers a restarting worker also
+    picks up jobs still running in the others; both results go to the same
+    will and the suggestions are kept either way.
+    """
+    wills = wills_db.list_by_ai_status((QUEUED, RUNNING))
+    for will_info in wills:
+        enqueue_will_suggestions(will_info["id"], will_info["user_id"], will_info["content"],
+                                 will_info["language"], job_id=will_info["ai_job_id"])
+    return len(wills)
+
 # API Routes
 
 @app.post("/api/auth/signup")
@@ -157,18 +493,21 @@ async def signup(user_data: UserSignup):
     
     # Check if user already exists
     user_id = f"{user_data.email}_{user_data.mobile}"
-    if user_id in users_db:
+    if users_db.exists(user_id, user_data.email, user_data.mobile):
         raise HTTPException(status_code=400, detail="User already exists")
     
     # Create user
-    hashed_password = hash_password(user_data.password)
-    users_db[user_id] = {
-        "id": user_id,
-        "email": user_data.email,
-        "mobile": user_data.mobile,
-        "password": hashed_password,
-        "created_at": datetime.now().isoformat()
-    }
+    hashed_password = await password_hasher.hash(user_data.password)
+    try:
+        users_db.add({
+            "id": user_id,
+            "email": user_data.email,
+            "mobile": user_data.mobile,
+            "password": hashed_password,
+            "created_at": datetime.now().isoformat()
+        })
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail="User already exists")
     
     # Create user directory
     create_user_directory(user_id)
@@ -186,15 +525,20 @@ async def signup(user_data: UserSignup):
 @app.post("/api/auth/login")
 async def login(login_data: UserLogin):
     # Find user by email or mobile
-    user = None
-    for user_id, user_info in users_db.items():
-        if user_info["email"] == login_data.username or user_info["mobile"] == login_data.username:
-            user = user_info
-            break
+    user = users_db.find_by_login(login_data.username)
     
-    if not user or not verify_password(login_data.password, user["password"]):
+    if not user:
+        # Hash anyway, so the response time does not tell which usernames exist
+        await password_hasher.verify_and_update(login_data.password, password_hasher.dummy_hash)
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await password_hasher.verify_and_update(login_data.password, user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade legacy SHA-256 or under-strength hashes now that we know the password
+    if new_hash:
+        users_db.update(user["id"], {"password": new_hash})
+    
     # Create access token
     access_token = create_access_token({"sub": user["id"]})
     
@@ -205,6 +549,21 @@ async def login(login_data: UserLogin):
         "user_id": user["id"]
     }
 
+@app.post("/api/auth/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security),
+                 current_user: str = Depends(get_current_user)):
+    payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    token_cache.revoke(payload["jti"], payload["exp"])
+    
+    return {
+        "success": True,
+        "message": "Logged out successfully"
+    }
+
+@app.get("/api/auth/token-cache/stats")
+async def token_cache_stats(current_user: str = Depends(get_current_user)):
+    return {"success": True, **token_cache.stats()}
+
 @app.get("/api/user/profile")
 async def get_profile(current_user: str = Depends(get_current_user)):
     user = users_db.get(current_user)
@@ -218,42 +577,93 @@ async def get_profile(current_user: str = Depends(get_current_user)):
         "created_at": user["created_at"]
     }
 
+@app.get("/api/user/storage")
+async def get_storage_usage(current_user: str = Depends(get_current_user)):
+    # Maintained as files are added and removed, never by scanning
+    return {
+        "success": True,
+        **files_db.usage(current_user)
+    }
+
 @app.post("/api/wills/create")
 async def create_will(will_data: WillCreate, current_user: str = Depends(get_current_user)):
     will_id = str(uuid.uuid4())
     
-    # Get AI assistance if requested
-    ai_content = ""
-    if will_data.ai_assisted and will_data.content:
-        ai_query = f"Help me improve this will content: {will_data.content}"
-        ai_content = get_ai_assistance(ai_query, will_data.language)
-    
     will_info = {
         "id": will_id,
         "user_id": current_user,
         "title": will_data.title,
         "language": will_data.language,
         "content": will_data.content,
-        "ai_suggestions": ai_content,
+        "ai_suggestions": "",
+        "ai_job_id": None,
+        "ai_status": None,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat()
     }
     
-    wills_db[will_id] = will_info
+    wills_db.add(will_info)
+    will_history.record(will_info)
+    search_index.update(will_info)
+    
+    # Queue AI assistance if requested; the will is saved without waiting for it
+    ai_job_id = None
+    if will_data.ai_assisted and will_data.content:
+        ai_job_id = enqueue_will_suggestions(will_id, current_user, will_data.content, will_data.language)
     
     return {
         "success": True,
         "message": "Will created successfully",
         "will_id": will_id,
-        "ai_suggestions": ai_content if will_data.ai_assisted else None
+        "ai_suggestions": None,
+        "ai_job_id": ai_job_id
     }
 
 @app.get("/api/wills/list")
-async def list_wills(current_user: str = Depends(get_current_user)):
-    user_wills = [will for will in wills_db.values() if will["user_id"] == current_user]
+async def list_wills(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    page = wills_db.page_for_owner(current_user, limit + 1, decode_cursor(cursor))
+    has_more = len(page) > limit
+    page = page[:limit]
+    selected = parse_fields(fields, WILL_LIST_FIELDS)
+    
+    user_wills = []
+    for will in page:
+        item = project(will, selected)
+        # Lets the dashboard badge AI-assisted wills without the suggestion text
+        item["ai_assisted"] = bool(will.get("ai_suggestions"))
+        user_wills.append(item)
+    
     return {
         "success": True,
-        "wills": user_wills
+        "wills": user_wills,
+        "next_cursor": encode_cursor(page[-1], "updated_at") if has_more else None
+    }
+
+@app.get("/api/wills/search")
+async def search_wills(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: str = Depends(get_current_user)
+):
+    results = []
+    for will_id, score in search(search_index, current_user, q, limit):
+        will = wills_db.get(will_id)
+        if will is None:
+            continue
+        item = project(will, WILL_LIST_FIELDS)
+        item["ai_assisted"] = bool(will.get("ai_suggestions"))
+        item["score"] = round(score, 4)
+        results.append(item)
+    
+    return {
+        "success": True,
+        "query": q,
+        "wills": results
     }
 
 @app.get("/api/wills/{will_id}")
@@ -273,31 +683,101 @@ async def update_will(will_id: str, will_data: WillCreate, current_user: str = D
     if not will_info or will_info["user_id"] != current_user:
         raise HTTPException(status_code=404, detail="Will not found")
     
-    # Get AI assistance if requested
-    ai_content = ""
-    if will_data.ai_assisted and will_data.content:
-        ai_query = f"Help me improve this will content: {will_data.content}"
-        ai_content = get_ai_assistance(ai_query, will_data.language)
-    
-    will_info.update({
+    fields = {
         "title": will_data.title,
         "language": will_data.language,
         "content": will_data.content,
-        "ai_suggestions": ai_content if will_data.ai_assisted else will_info.get("ai_suggestions", ""),
+        "ai_suggestions": "" if will_data.ai_assisted else will_info.get("ai_suggestions", ""),
         "updated_at": datetime.now().isoformat()
-    })
+    }
+    # Record the revision first so a conflicting concurrent save changes nothing
+    try:
+        revision = will_history.record({**will_info, **fields}, previous=will_info)
+    except (DuplicateError, StaleRevisionError):
+        raise HTTPException(status_code=409, detail="Will was changed by another request, please retry")
+    will_info = wills_db.update(will_id, fields)
+    search_index.update(will_info)
+    
+    # Queue AI assistance if requested; the will is saved without waiting for it
+    ai_job_id = None
+    if will_data.ai_assisted and will_data.content:
+        ai_job_id = enqueue_will_suggestions(will_id, current_user, will_data.content, will_data.language)
     
     return {
         "success": True,
         "message": "Will updated successfully",
-        "ai_suggestions": ai_content if will_data.ai_assisted else None
+        "revision": revision["number"],
+        "ai_suggestions": None,
+        "ai_job_id": ai_job_id
+    }
+
+@app.get("/api/wills/{will_id}/revisions")
+async def list_revisions(will_id: str, current_user: str = Depends(get_current_user)):
+    will_data = wills_db.get(will_id)
+    if not will_data or will_data["user_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Will not found")
+    
+    return {
+        "success": True,
+        "revisions": will_history.list(will_id)
+    }
+
+@app.get("/api/wills/{will_id}/revisions/{number}")
+async def get_revision(will_id: str, number: int, current_user: str = Depends(get_current_user)):
+    will_data = wills_db.get(will_id)
+    if not will_data or will_data["user_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Will not found")
+    
+    revision = will_history.get(will_id, number)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    return {
+        "success": True,
+        "revision": revision
+    }
+
+@app.get("/api/wills/{will_id}/revisions/{old}/diff/{new}")
+async def diff_revisions(will_id: str, old: int, new: int, current_user: str = Depends(get_current_user)):
+    will_data = wills_db.get(will_id)
+    if not will_data or will_data["user_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Will not found")
+    
+    old_revision = will_history.get(will_id, old)
+    new_revision = will_history.get(will_id, new)
+    if old_revision is None or new_revision is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    return {
+        "success": True,
+        "from": old,
+        "to": new,
+        "diff": unified_diff(old_revision["content"], new_revision["content"], f"revision {old}", f"revision {new}")
     }
 
+@app.get("/api/wills/{will_id}/export")
+async def export_will(will_id: str, current_user: str = Depends(get_current_user)):
+    will_data = wills_db.get(will_id)
+    if not will_data or will_data["user_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Will not found")
+    
+    # Built while it streams: no Content-Length, no temp file
+    title = "".join(c if c.isprintable() and c not in '\\/:*?"<>|' else "_" for c in will_data["title"]).strip()
+    return StreamingResponse(
+        will_archive(will_data, files_db.list_for_will(will_id)),
+        media_type="application/zip",
+        headers={
+            "content-disposition": content_disposition(f"{title or 'will'}.zip"),
+            "cache-control": "no-store"
+        }
+    )
+
 @app.post("/api/files/upload/{will_id}")
 async def upload_file(
     will_id: str,
     file: UploadFile = File(...),
     file_type: str = Form(...),  # audio, video, document
+    declared_type: Optional[str] = Query(None, alias="file_type"),  # picks the upload limit before the body is read
     current_user: str = Depends(get_current_user)
 ):
     # Check if will belongs to user
@@ -305,61 +785,165 @@ async def upload_file(
     if not will_data or will_data["user_id"] != current_user:
         raise HTTPException(status_code=404, detail="Will not found")
     
-    # Create user directory
-    user_dir = create_user_directory(current_user)
-    file_dir = user_dir / file_type
+    max_bytes = MAX_UPLOAD_BYTES.get(file_type)
+    if max_bytes is None:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    if declared_type is not None and declared_type != file_type:
+        raise HTTPException(status_code=400, detail="file_type in the query does not match the form")
     
-    # Generate unique filename
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = file_dir / unique_filename
+    # Save file off the event loop, enforcing the size limit as it streams
+    tmp_path = blob_store.new_tmp_path()
+    with disk_io_seconds.time("upload"):
+        saved = await run_in_threadpool(save_upload, file.file, tmp_path, max_bytes)
+    if saved is None:
+        raise HTTPException(status_code=413, detail=f"File too large; {file_type} uploads are limited to {max_bytes // (1024 * 1024)} MB")
+    size, sha256 = saved
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Store the content once and record the file against it
+    file_info = await store_file(current_user, will_id, file.filename, file_type, tmp_path, size, sha256)
     
-    # Store file info
-    file_id = str(uuid.uuid4())
-    file_info = {
-        "id": file_id,
-        "user_id": current_user,
-        "will_id": will_id,
+    return {
+        "success": True,
+        "message": "File uploaded successfully",
+        "file_id": file_info["id"],
         "filename": file.filename,
-        "stored_filename": unique_filename,
-        "file_type": file_type,
-        "file_path": str(file_path),
-        "size": file_path.stat().st_size,
-        "created_at": datetime.now().isoformat()
+        "size": file_info["size"]
+    }
+
+def _resumable_status(meta: dict) -> dict:
+    received = sum(hi - lo for lo, hi in meta["ranges"])
+    return {
+        "success": True,
+        "upload_id": meta["id"],
+        "size": meta["size"],
+        "received": received,
+        "ranges": meta["ranges"],
+        "missing": missing_ranges(meta["ranges"], meta["size"]),
+        "chunk_size": RESUMABLE_CHUNK_SIZE
     }
+
+def _load_upload_session(upload_id: str, current_user: str) -> dict:
+    # meta["id"] is the canonical spelling; lock on that, not the raw path value
+    try:
+        upload_id = str(uuid.UUID(upload_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    meta = resumable_uploads.load(upload_id)
+    if not meta or meta["user_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta
+
+@app.post("/api/files/resumable/{will_id}")
+async def create_resumable_upload(will_id: str, upload: ResumableUploadCreate, current_user: str = Depends(get_current_user)):
+    will_data = wills_db.get(will_id)
+    if not will_data or will_data["user_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Will not found")
+    
+    max_bytes = MAX_UPLOAD_BYTES.get(upload.file_type)
+    if max_bytes is None:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    if upload.size <= 0 or upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large; {upload.file_type} uploads are limited to {max_bytes // (1024 * 1024)} MB")
     
-    files_db[file_id] = file_info
+    meta = await run_in_threadpool(resumable_uploads.create, current_user, will_id,
+                                   upload.filename, upload.file_type, upload.size)
+    return _resumable_status(meta)
+
+@app.get("/api/files/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str, current_user: str = Depends(get_current_user)):
+    meta = await run_in_threadpool(_load_upload_session, upload_id, current_user)
+    return _resumable_status(meta)
+
+@app.put("/api/files/resumable/{upload_id}")
+async def put_resumable_chunk(upload_id: str, offset: int, request: Request, current_user: str = Depends(get_current_user)):
+    meta = await run_in_threadpool(_load_upload_session, upload_id, current_user)
+    
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > RESUMABLE_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Chunks are limited to {RESUMABLE_CHUNK_SIZE} bytes")
+    
+    if offset < 0 or offset + len(data) > meta["size"]:
+        raise HTTPException(status_code=416, detail="Chunk lies outside the declared file size")
+    
+    # Serialize chunk writes per session so concurrent PUTs cannot lose ranges;
+    # write_chunk also takes the session's file lock for other workers
+    if data:
+        async with _lock_for(f"upload:{meta['id']}"):
+            with disk_io_seconds.time("upload_chunk"):
+                meta = await run_in_threadpool(resumable_uploads.write_chunk, meta["id"], offset, bytes(data))
+        if meta is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+    return _resumable_status(meta)
+
+@app.post("/api/files/resumable/{upload_id}/finalize")
+async def finalize_resumable_upload(upload_id: str, current_user: str = Depends(get_current_user)):
+    meta = await run_in_threadpool(_load_upload_session, upload_id, current_user)
+    async with _lock_for(f"upload:{meta['id']}"):
+        meta = await run_in_threadpool(_load_upload_session, meta["id"], current_user)
+        if missing_ranges(meta["ranges"], meta["size"]):
+            raise HTTPException(status_code=409, detail="Upload is incomplete")
+        
+        will_data = wills_db.get(meta["will_id"])
+        if not will_data or will_data["user_id"] != current_user:
+            await run_in_threadpool(resumable_uploads.discard, meta["id"])
+            raise HTTPException(status_code=404, detail="Will not found")
+        
+        tmp_path = blob_store.new_tmp_path()
+        with disk_io_seconds.time("upload_finalize"):
+            finalized = await run_in_threadpool(resumable_uploads.finalize, meta["id"], tmp_path)
+        if finalized is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        size, sha256 = finalized
+    file_info = await store_file(current_user, meta["will_id"], meta["filename"], meta["file_type"],
+                                 tmp_path, size, sha256)
     
     return {
         "success": True,
         "message": "File uploaded successfully",
-        "file_id": file_id,
-        "filename": file.filename,
-        "size": file_info["size"]
+        "file_id": file_info["id"],
+        "filename": file_info["filename"],
+        "size": size
+    }
+
+@app.delete("/api/files/resumable/{upload_id}")
+async def abort_resumable_upload(upload_id: str, current_user: str = Depends(get_current_user)):
+    meta = await run_in_threadpool(_load_upload_session, upload_id, current_user)
+    await run_in_threadpool(resumable_uploads.discard, meta["id"])
+    return {
+        "success": True,
+        "message": "Upload cancelled"
     }
 
 @app.get("/api/files/list/{will_id}")
-async def list_files(will_id: str, current_user: str = Depends(get_current_user)):
+async def list_files(
+    will_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
     # Check if will belongs to user
     will_data = wills_db.get(will_id)
     if not will_data or will_data["user_id"] != current_user:
         raise HTTPException(status_code=404, detail="Will not found")
     
     # Get files for this will
-    will_files = [file for file in files_db.values() 
-                  if file["will_id"] == will_id and file["user_id"] == current_user]
+    page = files_db.page_for_will(will_id, limit + 1, decode_cursor(cursor))
+    has_more = len(page) > limit
+    page = page[:limit]
+    selected = parse_fields(fields, FILE_LIST_FIELDS)
+    will_files = [project(file, selected) for file in page if file["user_id"] == current_user]
     
     return {
         "success": True,
-        "files": will_files
+        "files": will_files,
+        "next_cursor": encode_cursor(page[-1], "created_at") if has_more else None
     }
 
 @app.get("/api/files/download/{file_id}")
-async def download_file(file_id: str, current_user: str = Depends(get_current_user)):
+async def download_file(file_id: str, request: Request, current_user: str = Depends(get_current_user)):
     file_info = files_db.get(file_id)
     if not file_info or file_info["user_id"] != current_user:
         raise HTTPException(status_code=404, detail="File not found")
@@ -368,10 +952,15 @@ async def download_file(file_id: str, current_user: str = Depends(get_current_us
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found on disk")
     
-    return FileResponse(
-        path=file_path,
+    # The upload-time SHA-256 is a strong validator for ETag, If-None-Match and If-Range
+    sha256 = file_info.get("sha256")
+    return file_response(
+        request.headers,
+        file_path,
         filename=file_info["filename"],
-        media_type=mimetypes.guess_type(file_info["filename"])[0]
+        media_type=mimetypes.guess_type(file_info["filename"])[0],
+        etag=f'"{sha256}"' if sha256 else None,
+        io_histogram=disk_io_seconds
     )
 
 @app.delete("/api/files/{file_id}")
@@ -380,13 +969,19 @@ async def delete_file(file_id: str, current_user: str = Depends(get_current_user
     if not file_info or file_info["user_id"] != current_user:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete physical file
     file_path = Path(file_info["file_path"])
-    if file_path.exists():
-        file_path.unlink()
-    
-    # Remove from database
-    del files_db[file_id]
+    sha256 = file_info.get("sha256")
+    if sha256 and blob_store.owns(file_path):
+        # Drop this reference; the blob goes when no other file shares it
+        async with _blob_lock(f"blob:{sha256}"):
+            files_db.remove(file_id)
+            if files_db.count_by_sha256(sha256) == 0:
+                await run_in_threadpool(blob_store.delete, sha256)
+    else:
+        # Files stored before the blob store have a private copy
+        if file_path.exists():
+            file_path.unlink()
+        files_db.remove(file_id)
     
     return {
         "success": True,
@@ -396,7 +991,7 @@ async def delete_file(file_id: str, current_user: str = Depends(get_current_user
 @app.post("/api/ai/assist")
 async def ai_assist(request: AIAssistRequest, current_user: str = Depends(get_current_user)):
     try:
-        response = get_ai_assistance(request.query, request.language, request.will_context)
+        response = await get_ai_assistance(request.query, request.language, request.will_context)
         return {
             "success": True,
             "response": response
@@ -407,9 +1002,59 @@ async def ai_assist(request: AIAssistRequest, current_user: str = Depends(get_cu
             "error": str(e)
         }
 
+@app.post("/api/ai/assist/stream")
+async def ai_assist_stream(request: AIAssistRequest, http_request: Request, current_user: str = Depends(get_current_user)):
+    """Stream the AI reply as Server-Sent Events.
+
+    Each chunk arrives as a ``data: {"delta": ...}`` event, followed by an
+    ``event: done`` or ``event: error``. When the client disconnects the
+    generator is cancelled, which closes the upstream LLM stream.
+    """
+    if not ai_client.available:
+        raise HTTPException(status_code=503, detail="AI assistance is currently unavailable. Please contact support.")
+
+    async def event_stream():
+        try:
+            async with aclosing(ai_client.stream(request.query, request.language, request.will_context)) as chunks:
+                async for chunk in chunks:
+                    if await http_request.is_disconnected():
+                        return
+                    yield f"data: {json.dumps({'delta': chunk}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except AIError as e:
+            print(f"AI assistance error: {e}")
+            message = "AI assistance is currently unavailable. Please try again later."
+            yield f"event: error\ndata: {json.dumps({'error': message})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/ai/cache/stats")
+async def ai_cache_stats(current_user: str = Depends(get_current_user)):
+    if ai_client.cache is None:
+        return {"success": True, "enabled": False}
+    return {"success": True, "enabled": True, **ai_client.cache.stats()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, current_user: str = Depends(get_current_user)):
+    # Jobs run in the worker that queued them; other workers read the will
+    job = ai_jobs.get(job_id) or _job_from_will(job_id)
+    if not job or job["owner"] != current_user:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "success": True,
+        "job": job
+    }
+
 @app.post("/api/messages/send")
 async def send_message(message: MessageSend, current_user: str = Depends(get_current_user)):
-    # For now, just store the message (in production, integrate with email service)
+    if message.preference not in MESSAGE_CHANNELS:
+        raise HTTPException(status_code=400, detail="Invalid preference")
+    
     message_id = str(uuid.uuid4())
     
     # Create message record
@@ -422,12 +1067,12 @@ async def send_message(message: MessageSend, current_user: str = Depends(get_cur
         "message_text": message.message_text,
         "preference": message.preference,
         "will_id": message.will_id,
-        "sent_at": datetime.now().isoformat(),
-        "status": "pending"  # In production: sent, delivered, failed
+        "channel": message.preference,
+        "sent_at": datetime.now().isoformat()
     }
     
-    # Here you would integrate with email service, SMS service, etc.
-    # For now, we'll just return success
+    # Only stored here; delivery happens in the background
+    outbox.submit(message_record)
     
     return {
         "success": True,
@@ -435,10 +1080,85 @@ async def send_message(message: MessageSend, current_user: str = Depends(get_cur
         "message_id": message_id
     }
 
+@app.get("/api/messages/{message_id}")
+async def get_message_status(message_id: str, current_user: str = Depends(get_current_user)):
+    message = messages_db.get(message_id)
+    if not message or message["sender_id"] != current_user:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    return {
+        "success": True,
+        "message_id": message_id,
+        "channel": message["channel"],
+        "status": message["status"],
+        "attempts": message["attempts"],
+        "last_error": message["last_error"],
+        "sent_at": message["sent_at"],
+        "delivered_at": message["delivered_at"],
+        "updated_at": message["updated_at"]
+    }
+
+async def collect_expired_uploads():
+    while True:
+        try:
+            removed = await run_in_threadpool(resumable_uploads.collect_expired)
+            if removed:
+                print(f"Removed {removed} abandoned upload sessions")
+        except OSError as e:
+            print(f"Upload session cleanup error: {e}")
+        await asyncio.sleep(3600)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.upload_gc = asyncio.create_task(collect_expired_uploads())
+    outbox.start()
+    storage_reconciler.start()
+    resumed = resume_will_suggestions()
+    if resumed:
+        print(f"Resumed {resumed} AI suggestion jobs")
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    app.state.upload_gc.cancel()
+    await ai_jobs.stop()
+    await outbox.stop()
+    await storage_reconciler.stop()
+    password_hasher.shutdown()
+    if journal is not None:
+        journal.close()
+
+@app.get("/api/metrics")
+async def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def require_profiling_admin(request: Request):
+    # Looks like any unknown route to everyone without the token
+    if not profiler.is_admin(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_profiling_admin)])
+async def list_profiles():
+    return {
+        "success": True,
+        "profiles": await run_in_threadpool(profiler.list)
+    }
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_profiling_admin)])
+async def download_profile(profile_id: str):
+    path = profiler.path_for(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{profile_id}.folded")
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and STORAGE_BACKEND != "sqlite":
+        raise SystemExit("Multiple workers need a shared store; set STORAGE_BACKEND=sqlite")
+    uvicorn.run("server:app", host="0.0.0.0", port=8001, workers=workers)
@@ -0,0 +1,550 @@
+"""SQLite (WAL mode) implementation of the record stores.
+
+Several uvicorn worker processes can share one database file: WAL lets
+readers run alongside the single writer, and every read sees the latest
+committed write. Records are kept as JSON documents next to the columns
+that are indexed, so the stores return the same dicts as the in-memory
+ones and new fields need no migration.
+
+Store calls run on the caller's thread, which in the server is the event
+loop, so nothing slow may happen inside one. A call that finds the write
+lock taken waits at most ``busy_timeout`` seconds and then raises
+``DatabaseBusyError`` instead of stalling every other request in the
+process. ``synchronous`` defaults to NORMAL: under WAL a commit is an
+append to the WAL with no fsync, and the fsyncs happen when the WAL is
+checkpointed into the database, which a background thread does every
+``checkpoint_interval`` seconds instead of whichever request's commit
+crosses the autocheckpoint threshold. The trade-off is durability: a
+process crash loses nothing, but a power loss or OS crash can roll back
+the commits made since the last checkpoint, which the memory backend's
+journal (fsynced before each write is acknowledged) does not. FULL fsyncs
+the WAL on every commit, on the event loop, and keeps every acknowledged
+write.
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from store import DuplicateError
+from search import will_terms
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    mobile TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wills (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wills_user_id ON wills (user_id);
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    will_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS files_will_id ON files (will_id);
+CREATE TABLE IF NOT EXISTS revisions (
+    will_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    base INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (will_id, number)
+);
+CREATE TABLE IF NOT EXISTS search_terms (
+    user_id TEXT NOT NULL,
+    term TEXT NOT NULL,
+    will_id TEXT NOT NULL,
+    weight INTEGER NOT NULL,
+    PRIMARY KEY (user_id, term, will_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS search_terms_will_id ON search_terms (will_id);
+CREATE TABLE IF NOT EXISTS search_docs (
+    will_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_docs_user_id ON search_docs (user_id);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    status TEXT NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_due ON messages (channel, next_attempt_at)
+    WHERE status IN ('pending', 'sending');
+CREATE TABLE IF NOT EXISTS token_revocations (
+    jti TEXT PRIMARY KEY,
+    exp REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS token_revocations_exp ON token_revocations (exp);
+"""
+
+# Columns added after the first release, created on databases that predate
+# them. New databases get them from SCHEMA
+MIGRATIONS = [
+    ("files", "sha256", "ALTER TABLE files ADD COLUMN sha256 TEXT"),
+]
+# Per-user storage usage, kept in step with ``files`` by triggers. Created
+# together with a backfill from existing rows, in one transaction
+USAGE_SCHEMA = [
+    """CREATE TABLE storage_usage (
+        user_id TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        files INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        PRIMARY KEY (user_id, file_type)
+    ) WITHOUT ROWID""",
+    """INSERT INTO storage_usage
+        SELECT json_extract(data, '$.user_id'), json_extract(data, '$.file_type'),
+               COUNT(*), COALESCE(SUM(json_extract(data, '$.size')), 0)
+        FROM files GROUP BY 1, 2""",
+    """CREATE TRIGGER files_usage_insert AFTER INSERT ON files BEGIN
+        INSERT INTO storage_usage VALUES (
+            json_extract(NEW.data, '$.user_id'), json_extract(NEW.data, '$.file_type'),
+            1, COALESCE(json_extract(NEW.data, '$.size'), 0))
+        ON CONFLICT (user_id, file_type) DO UPDATE
+            SET files = files + 1, bytes = bytes + excluded.bytes;
+    END""",
+    """CREATE TRIGGER files_usage_delete AFTER DELETE ON files BEGIN
+        UPDATE storage_usage
+            SET files = files - 1, bytes = bytes - COALESCE(json_extract(OLD.data, '$.size'), 0)
+            WHERE user_id = json_extract(OLD.data, '$.user_id')
+              AND file_type = json_extract(OLD.data, '$.file_type');
+        DELETE FROM storage_usage
+            WHERE user_id = json_extract(OLD.data, '$.user_id') AND files <= 0;
+    END""",
+]
+INDEXES = """
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+CREATE INDEX IF NOT EXISTS wills_user_updated ON wills (user_id, json_extract(data, '$.updated_at'), id);
+CREATE INDEX IF NOT EXISTS files_will_created ON files (will_id, json_extract(data, '$.created_at'), id);
+CREATE INDEX IF NOT EXISTS wills_ai_job_id ON wills (json_extract(data, '$.ai_job_id'));
+CREATE INDEX IF NOT EXISTS wills_ai_status ON wills (json_extract(data, '$.ai_status'));
+"""
+
+
+SYNCHRONOUS_MODES = ("NORMAL", "FULL", "EXTRA")
+
+
+class DatabaseBusyError(Exception):
+    """Another process held the write lock for longer than the busy timeout."""
+
+
+def _dumps(record) -> str:
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+
+@contextmanager
+def _busy_as_error():
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if "locked" in str(e) or "busy" in str(e):
+            raise DatabaseBusyError(str(e)) from e
+        raise
+
+
+class SQLiteDatabase:
+    """One connection per process, shared by the stores."""
+
+    def __init__(self, path: str, busy_timeout: float = 0.2, synchronous: str = "NORMAL",
+                 checkpoint_interval: float = 1.0):
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {', '.join(SYNCHRONOUS_MODES)}")
+        self.path = path
+        self.synchronous = synchronous
+        self.checkpoint_interval = checkpoint_interval
+        # Schema setup may wait behind other workers starting at the same time
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        self.conn.executescript(SCHEMA)
+        # One transaction holding the write lock, so workers starting together
+        # on a fresh database run each check-then-alter one at a time
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, column, ddl in MIGRATIONS:
+                columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    try:
+                        self.conn.execute(ddl)
+                    except sqlite3.OperationalError as e:
+                        if "duplicate column name" not in str(e):
+                            raise
+            if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'storage_usage'").fetchone():
+                for statement in USAGE_SCHEMA:
+                    self.conn.execute(statement)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.executescript(INDEXES)
+        self.conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self.lock = threading.Lock()
+        self._closed = threading.Event()
+        self._checkpointer = None
+        if checkpoint_interval:
+            # Commits on the event loop never run a checkpoint themselves
+            self.conn.execute("PRAGMA wal_autocheckpoint=0")
+            self._checkpointer = threading.Thread(target=self._checkpoint_loop, name="sqlite-checkpoint",
+                                                  daemon=True)
+            self._checkpointer.start()
+        self.users = SQLiteUserStore(self)
+        self.wills = SQLiteWillStore(self)
+        self.files = SQLiteFileStore(self)
+        self.revisions = SQLiteRevisionStore(self)
+        self.search = SQLiteSearchIndex(self)
+        self.messages = SQLiteMessageStore(self)
+        self.revocations = SQLiteRevocationStore(self)
+
+    def query(self, sql: str, params=()):
+        with self.lock, _busy_as_error():
+            return self.conn.execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params=()):
+        with self.lock, _busy_as_error():
+            return self.conn.execute(sql, params).rowcount
+
+    @contextmanager
+    def transaction(self, immediate: bool = False):
+        """The connection inside BEGIN ... COMMIT, rolled back on error.
+
+        ``immediate`` takes the write lock before the first read.
+        """
+        with self.lock, _busy_as_error():
+            self.conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _checkpoint_loop(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            while not self._closed.wait(self.checkpoint_interval):
+                try:
+                    # PASSIVE never waits for readers or writers; pages it
+                    # cannot copy yet are left for the next round
+                    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                except sqlite3.OperationalError:
+                    pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self._closed.set()
+        if self._checkpointer is not None:
+            self._checkpointer.join()
+        self.conn.close()
+
+
+class _SQLiteStore:
+    table = None
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def __len__(self):
+        return self.db.query(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+
+    def __contains__(self, record_id):
+        return bool(self.db.query(f"SELECT 1 FROM {self.table} WHERE id = ?", (record_id,)))
+
+    def get(self, record_id):
+        rows = self.db.query(f"SELECT data FROM {self.table} WHERE id = ?", (record_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def _list(self, sql: str, params):
+        return [json.loads(data) for (data,) in self.db.query(sql, params)]
+
+    def _page(self, owner_column, owner_id, sort_key, limit, after):
+        # Keyset pagination over the (owner, sort key, id) expression index
+        sort_expr = f"json_extract(data, '$.{sort_key}')"
+        sql = f"SELECT data FROM {self.table} WHERE {owner_column} = ?"
+        params = [owner_id]
+        if after is not None:
+            sql += f" AND ({sort_expr}, id) < (?, ?)"
+            params += list(after)
+        sql += f" ORDER BY {sort_expr} DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return self._list(sql, params)
+
+    def _update(self, record_id, fields, columns=()):
+        # json_set merges in the database, so concurrent workers updating
+        # different fields of the same record do not overwrite each other.
+        # ``columns`` names indexed columns that mirror a field.
+        assignments = ", ".join("?, json(?)" for _ in fields)
+        params = []
+        for key, value in fields.items():
+            params += [f'$."{key}"', _dumps(value)]
+        column_sql = ""
+        for column in columns:
+            if column in fields:
+                column_sql += f", {column} = ?"
+                params.append(fields[column])
+        self.db.execute(
+            f"UPDATE {self.table} SET data = json_set(data, {assignments}){column_sql} WHERE id = ?",
+            (*params, record_id),
+        )
+        return self.get(record_id)
+
+
+class SQLiteUserStore(_SQLiteStore):
+    table = "users"
+
+    def exists(self, user_id, email, mobile):
+        return bool(self.db.query(
+            "SELECT 1 FROM users WHERE id = ? OR email = ? OR mobile = ? LIMIT 1",
+            (user_id, email, mobile),
+        ))
+
+    def add(self, user):
+        try:
+            self.db.execute(
+                "INSERT INTO users (id, email, mobile, data) VALUES (?, ?, ?, ?)",
+                (user["id"], user["email"], user["mobile"], _dumps(user)),
+            )
+        except sqlite3.IntegrityError:
+            raise DuplicateError(user["id"])
+        return user
+
+    def update(self, user_id, fields):
+        """Replace non-indexed fields such as the password hash."""
+        return self._update(user_id, fields)
+
+    def find_by_login(self, username):
+        rows = self.db.query(
+            "SELECT data FROM users WHERE email = ? UNION ALL SELECT data FROM users WHERE mobile = ? LIMIT 1",
+            (username, username),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+
+class SQLiteWillStore(_SQLiteStore):
+    table = "wills"
+
+    def add(self, will):
+        self.db.execute(
+            "INSERT INTO wills (id, user_id, data) VALUES (?, ?, ?)",
+            (will["id"], will["user_id"], _dumps(will)),
+        )
+        return will
+
+    def update(self, will_id, fields):
+        return self._update(will_id, fields)
+
+    def list_for_owner(self, user_id):
+        return self._list("SELECT data FROM wills WHERE user_id = ? ORDER BY rowid", (user_id,))
+
+    def page_for_owner(self, user_id, limit, after=None):
+        return self._page("user_id", user_id, "updated_at", limit, after)
+
+    def find_by_ai_job(self, job_id):
+        rows = self.db.query("SELECT data FROM wills WHERE json_extract(data, '$.ai_job_id') = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def list_by_ai_status(self, statuses):
+        placeholders = ", ".join("?" * len(statuses))
+        return self._list(f"SELECT data FROM wills WHERE json_extract(data, '$.ai_status') IN ({placeholders})",
+                          tuple(statuses))
+
+
+class SQLiteFileStore(_SQLiteStore):
+    table = "files"
+
+    def add(self, file_info):
+        self.db.execute(
+            "INSERT INTO files (id, will_id, sha256, data) VALUES (?, ?, ?, ?)",
+            (file_info["id"], file_info["will_id"], file_info.get("sha256"), _dumps(file_info)),
+        )
+        return file_info
+
+    def remove(self, file_id):
+        file_info = self.get(file_id)
+        if file_info is not None:
+            self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        return file_info
+
+    def update(self, file_id, fields):
+        return self._update(file_id, fields)
+
+    def all(self):
+        return self._list("SELECT data FROM files ORDER BY rowid", ())
+
+    def scan(self, cursor=None, limit=500):
+        rows = self.db.query(
+            "SELECT rowid, data FROM files WHERE rowid > ? ORDER BY rowid LIMIT ?", (cursor or 0, limit)
+        )
+        records = [json.loads(data) for _, data in rows]
+        return records, (rows[-1][0] if len(rows) == limit else None)
+
+    def usage(self, user_id):
+        rows = self.db.query("SELECT file_type, files, bytes FROM storage_usage WHERE user_id = ?", (user_id,))
+        return {
+            "files": sum(files for _, files, _ in rows),
+            "bytes": sum(size for _, _, size in rows),
+            "by_type": {file_type: {"files": files, "bytes": size} for file_type, files, size in rows},
+        }
+
+    def list_for_will(self, will_id):
+        return self._list("SELECT data FROM files WHERE will_id = ? ORDER BY rowid", (will_id,))
+
+    def page_for_will(self, will_id, limit, after=None):
+        return self._page("will_id", will_id, "created_at", limit, after)
+
+    def count_by_sha256(self, sha256):
+        # Only records whose file_path names the blob; see store.blob_sha256
+        return self.db.query(
+            "SELECT COUNT(*) FROM files WHERE sha256 = ? AND json_extract(data, '$.file_path') LIKE ?",
+            (sha256, "%/" + sha256),
+        )[0][0]
+
+
+class SQLiteRevisionStore:
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM revisions")[0][0]
+
+    def add(self, revision):
+        # The primary key stops two workers from both writing revision N
+        try:
+            self.db.execute(
+                "INSERT INTO revisions (will_id, number, base, data) VALUES (?, ?, ?, ?)",
+                (revision["will_id"], revision["number"], revision["base"], _dumps(revision)),
+            )
+        except sqlite3.IntegrityError:
+            raise DuplicateError(f"{revision['will_id']}#{revision['number']}")
+        return revision
+
+    def latest(self, will_id):
+        rows = self.db.query(
+            "SELECT data FROM revisions WHERE will_id = ? ORDER BY number DESC LIMIT 1", (will_id,)
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def list_for_will(self, will_id):
+        rows = self.db.query("SELECT data FROM revisions WHERE will_id = ? ORDER BY number", (will_id,))
+        return [json.loads(data) for (data,) in rows]
+
+    def chain(self, will_id, number):
+        rows = self.db.query(
+            "SELECT data FROM revisions WHERE will_id = ? AND number <= ? AND number >= "
+            "(SELECT base FROM revisions WHERE will_id = ? AND number = ?) ORDER BY number",
+            (will_id, number, will_id, number),
+        )
+        return [json.loads(data) for (data,) in rows]
+
+
+class SQLiteRevocationStore:
+    """Revoked token ids, visible to every worker; expired rows are pruned on insert."""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM token_revocations")[0][0]
+
+    def get(self, jti):
+        rows = self.db.query("SELECT exp FROM token_revocations WHERE jti = ?", (jti,))
+        return {"jti": jti, "exp": rows[0][0]} if rows else None
+
+    def add(self, revocation):
+        with self.db.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO token_revocations (jti, exp) VALUES (?, ?)",
+                         (revocation["jti"], revocation["exp"]))
+            conn.execute("DELETE FROM token_revocations WHERE exp <= ?", (time.time(),))
+        return revocation
+
+
+class SQLiteSearchIndex:
+    """The search index as (user, term, will) rows, shared by all workers."""
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM search_docs")[0][0]
+
+    def build(self):
+        """Index wills that have no index rows yet, e.g. ones saved before search existed."""
+        rows = self.db.query(
+            "SELECT data FROM wills WHERE id NOT IN (SELECT will_id FROM search_docs)"
+        )
+        for (data,) in rows:
+            self.update(json.loads(data))
+
+    def update(self, will: dict):
+        terms = will_terms(will)
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM search_terms WHERE will_id = ?", (will["id"],))
+            conn.executemany(
+                "INSERT INTO search_terms (user_id, term, will_id, weight) VALUES (?, ?, ?, ?)",
+                [(will["user_id"], term, will["id"], weight) for term, weight in terms.items()],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO search_docs (will_id, user_id, length) VALUES (?, ?, ?)",
+                (will["id"], will["user_id"], sum(terms.values())),
+            )
+
+    def stats(self, user_id):
+        count, total = self.db.query(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM search_docs WHERE user_id = ?", (user_id,)
+        )[0]
+        return count, total
+
+    def postings(self, user_id, term, prefix=False):
+        sql = (
+            "SELECT t.will_id, t.weight, d.length FROM search_terms t "
+            "JOIN search_docs d ON d.will_id = t.will_id WHERE t.user_id = ? AND "
+        )
+        if prefix:
+            # Terms sort by code point, so the prefix range ends below term + U+10FFFF
+            return self.db.query(sql + "t.term >= ? AND t.term < ?", (user_id, term, term + "\U0010ffff"))
+        return self.db.query(sql + "t.term = ?", (user_id, term))
+
+
+class SQLiteMessageStore(_SQLiteStore):
+    table = "messages"
+
+    def add(self, message):
+        self.db.execute(
+            "INSERT INTO messages (id, channel, status, next_attempt_at, data) VALUES (?, ?, ?, ?, ?)",
+            (message["id"], message["channel"], message["status"], message["next_attempt_at"], _dumps(message)),
+        )
+        return message
+
+    def update(self, message_id, fields):
+        return self._update(message_id, fields, columns=("status", "next_attempt_at"))
+
+    def claim(self, channel, now, lease_until, limit):
+        # BEGIN IMMEDIATE takes the write lock before reading, so two worker
+        # processes cannot claim the same rows
+        with self.db.transaction(immediate=True) as conn:
+            rows = conn.execute(
+                "SELECT data FROM messages WHERE channel = ? AND status IN ('pending', 'sending') "
+                "AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (channel, now, limit),
+            ).fetchall()
+            claimed = []
+            for (data,) in rows:
+                message = json.loads(data)
+                message.update(status="sending", attempts=message["attempts"] + 1, next_attempt_at=lease_until)
+                claimed.append(message)
+            conn.executemany(
+                "UPDATE messages SET status = ?, next_attempt_at = ?, data = ? WHERE id = ?",
+                [(m["status"], m["next_attempt_at"], _dumps(m), m["id"]) for m in claimed],
+            )
+        return claimed
@@ -0,0 +1,425 @@
+"""In-memory record stores with maintained secondary indexes.
+
+Every mutation is described by an op name and JSON-able arguments. When a
+journal is attached the op is appended to it, and ``apply`` replays the
+same ops on startup, so the write path and the recovery path share code.
+Records are replaced rather than mutated in place, which lets snapshots
+serialize a shallow copy of a store while writes continue. Users, wills and
+files are held as compact read-only records (see ``records``); the journal
+still gets the plain dicts.
+"""
+import heapq
+import os
+import time
+
+from records import FileRecord, UserRecord, WillRecord, sort_key as _sort_key
+
+
+def _page(records, sort_key, limit, after=None):
+    """Newest-first page of ``records`` ordered by (sort_key, id).
+
+    ``after`` is the (sort_key, id) of the last record on the previous page.
+    Costs O(n log limit) in the number of candidate records. Timestamps are
+    compared in their stored integer form, so only the page is decoded.
+    """
+    keyed = ((record.sort_key(sort_key), record["id"], record) for record in records)
+    if after is not None:
+        after = (_sort_key(after[0]), after[1])
+        keyed = (item for item in keyed if item[:2] < after)
+    return [record for _, _, record in heapq.nlargest(limit, keyed, key=lambda item: item[:2])]
+
+
+class DuplicateError(Exception):
+    """Raised when a record would violate a unique index."""
+
+
+class _Store:
+    kind = None
+
+    def __init__(self):
+        self.journal = None
+
+    def _log(self, op, *args):
+        if self.journal is not None:
+            self.journal.append(f"{self.kind}.{op}", *args)
+
+    def apply(self, op, args):
+        """Replay a journaled op without journaling it again."""
+        getattr(self, op)(*args)
+
+    def dump(self):
+        """Return (op, records) that recreate the store, for snapshots."""
+        raise NotImplementedError
+
+
+class UserStore(_Store):
+    """Users keyed by id, with unique email and mobile indexes.
+
+    Lookups by id, email or mobile are all single dict probes, so login cost
+    does not depend on how many accounts exist.
+    """
+
+    kind = "user"
+
+    def __init__(self):
+        super().__init__()
+        self._users = {}
+        self._by_email = {}
+        self._by_mobile = {}
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def get(self, user_id):
+        return self._users.get(user_id)
+
+    def exists(self, user_id, email, mobile):
+        return user_id in self._users or email in self._by_email or mobile in self._by_mobile
+
+    def add(self, user):
+        if self.exists(user["id"], user["email"], user["mobile"]):
+            raise DuplicateError(user["id"])
+        # Indexes read the plain dict: a record lookup is a Python call,
+        # which adds up when the journal replays every record on startup
+        self._users[user["id"]] = record = UserRecord(user)
+        self._by_email[user["email"]] = user["id"]
+        self._by_mobile[user["mobile"]] = user["id"]
+        self._log("add", user)
+        return record
+
+    def update(self, user_id, fields):
+        """Replace non-indexed fields such as the password hash."""
+        user = self._users[user_id].replace(fields)
+        self._users[user_id] = user
+        self._log("update", user_id, fields)
+        return user
+
+    def find_by_login(self, username):
+        """Return the user whose email or mobile equals ``username``."""
+        user_id = self._by_email.get(username)
+        if user_id is None:
+            user_id = self._by_mobile.get(username)
+        return self._users.get(user_id) if user_id is not None else None
+
+    def dump(self):
+        return "add", list(self._users.values())
+
+
+class WillStore(_Store):
+    """Wills keyed by id, with owner -> wills and AI job -> will indexes."""
+
+    kind = "will"
+
+    def __init__(self):
+        super().__init__()
+        self._wills = {}
+        self._by_owner = {}
+        self._by_ai_job = {}
+
+    def __len__(self):
+        return len(self._wills)
+
+    def get(self, will_id):
+        return self._wills.get(will_id)
+
+    def add(self, will):
+        self._wills[will["id"]] = record = WillRecord(will)
+        self._by_owner.setdefault(will["user_id"], {})[will["id"]] = None
+        if will.get("ai_job_id"):
+            self._by_ai_job[will["ai_job_id"]] = will["id"]
+        self._log("add", will)
+        return record
+
+    def update(self, will_id, fields):
+        previous = self._wills[will_id]
+        will = previous.replace(fields)
+        self._wills[will_id] = will
+        if "ai_job_id" in fields:
+            self._by_ai_job.pop(previous.get("ai_job_id"), None)
+            if will["ai_job_id"]:
+                self._by_ai_job[will["ai_job_id"]] = will_id
+        self._log("update", will_id, fields)
+        return will
+
+    def all(self):
+        return list(self._wills.values())
+
+    def list_for_owner(self, user_id):
+        return [self._wills[will_id] for will_id in self._by_owner.get(user_id, ())]
+
+    def find_by_ai_job(self, job_id):
+        """The will whose latest AI job is ``job_id``."""
+        will_id = self._by_ai_job.get(job_id)
+        return self._wills.get(will_id) if will_id is not None else None
+
+    def list_by_ai_status(self, statuses):
+        """Wills whose latest AI job is in one of ``statuses``."""
+        wills = (self._wills[will_id] for will_id in list(self._by_ai_job.values()))
+        return [will for will in wills if will.get("ai_status") in statuses]
+
+    def page_for_owner(self, user_id, limit, after=None):
+        """Owner's wills, most recently updated first."""
+        return _page(self.list_for_owner(user_id), "updated_at", limit, after)
+
+    def dump(self):
+        return "add", list(self._wills.values())
+
+
+def blob_sha256(file_info):
+    """The content hash of the blob a file record points at, or None.
+
+    Blobs are named by their hash. A legacy record may carry a hash while
+    still pointing at a private copy in the user's directory; it holds no
+    reference to the blob with that hash.
+    """
+    sha256 = file_info.get("sha256")
+    if sha256 and os.path.basename(file_info["file_path"]) == sha256:
+        return sha256
+    return None
+
+
+class FileStore(_Store):
+    """File metadata keyed by id, with a will -> files index.
+
+    Also counts the records pointing at each blob, which serves as the
+    reference count for the shared blob store, and keeps each user's file
+    count and bytes per file type as files come and go.
+    """
+
+    kind = "file"
+
+    def __init__(self):
+        super().__init__()
+        self._files = {}
+        self._by_will = {}
+        self._sha256_refs = {}
+        self._usage = {}
+
+    def __len__(self):
+        return len(self._files)
+
+    def _count_usage(self, file_info, sign):
+        by_type = self._usage.setdefault(file_info["user_id"], {})
+        files, size = by_type.get(file_info["file_type"], (0, 0))
+        files += sign
+        size += sign * (file_info.get("size") or 0)
+        if files:
+            by_type[file_info["file_type"]] = (files, size)
+        else:
+            by_type.pop(file_info["file_type"], None)
+            if not by_type:
+                del self._usage[file_info["user_id"]]
+
+    def _count_ref(self, sha256, sign):
+        if sha256:
+            refs = self._sha256_refs.pop(sha256, 0) + sign
+            if refs:
+                self._sha256_refs[sha256] = refs
+
+    def get(self, file_id):
+        return self._files.get(file_id)
+
+    def add(self, file_info):
+        self._files[file_info["id"]] = record = FileRecord(file_info)
+        self._by_will.setdefault(file_info["will_id"], {})[file_info["id"]] = None
+        self._count_ref(blob_sha256(file_info), 1)
+        self._count_usage(file_info, 1)
+        self._log("add", file_info)
+        return record
+
+    def remove(self, file_id):
+        file_info = self._files.pop(file_id, None)
+        if file_info is None:
+            return None
+        will_files = self._by_will.get(file_info["will_id"])
+        if will_files is not None:
+            will_files.pop(file_id, None)
+            if not will_files:
+                del self._by_will[file_info["will_id"]]
+        self._count_ref(blob_sha256(file_info), -1)
+        self._count_usage(file_info, -1)
+        self._log("remove", file_id)
+        return file_info
+
+    def update(self, file_id, fields):
+        """Replace non-indexed fields such as ``file_path``."""
+        previous = self._files[file_id]
+        file_info = previous.replace(fields)
+        self._files[file_id] = file_info
+        self._count_ref(blob_sha256(previous), -1)
+        self._count_ref(blob_sha256(file_info), 1)
+        self._log("update", file_id, fields)
+        return file_info
+
+    def all(self):
+        return list(self._files.values())
+
+    def scan(self, cursor=None, limit=500):
+        """A batch of records in storage order and the cursor for the next one.
+
+        The first call takes the list of ids once; the cursor is that list
+        and a position in it, so each batch costs O(limit). Records removed
+        meanwhile are skipped and ones added are seen by the next scan.
+        """
+        ids, start = cursor or (list(self._files), 0)
+        end = start + limit
+        records = [record for record in map(self._files.get, ids[start:end]) if record is not None]
+        return records, ((ids, end) if end < len(ids) else None)
+
+    def usage(self, user_id):
+        """Files and bytes a user has stored, in total and per file type."""
+        by_type = self._usage.get(user_id, {})
+        return {
+            "files": sum(files for files, _ in by_type.values()),
+            "bytes": sum(size for _, size in by_type.values()),
+            "by_type": {file_type: {"files": files, "bytes": size} for file_type, (files, size) in by_type.items()},
+        }
+
+    def list_for_will(self, will_id):
+        return [self._files[file_id] for file_id in self._by_will.get(will_id, ())]
+
+    def page_for_will(self, will_id, limit, after=None):
+        """Files attached to a will, newest first."""
+        return _page(self.list_for_will(will_id), "created_at", limit, after)
+
+    def count_by_sha256(self, sha256):
+        """How many file records point at the blob for ``sha256``."""
+        return self._sha256_refs.get(sha256, 0)
+
+    def dump(self):
+        return "add", list(self._files.values())
+
+
+class RevisionStore(_Store):
+    """Will revisions, kept per will in revision-number order."""
+
+    kind = "revision"
+
+    def __init__(self):
+        super().__init__()
+        self._by_will = {}
+
+    def __len__(self):
+        return sum(len(revisions) for revisions in self._by_will.values())
+
+    def add(self, revision):
+        revisions = self._by_will.setdefault(revision["will_id"], [])
+        if revision["number"] != len(revisions) + 1:
+            raise DuplicateError(f"{revision['will_id']}#{revision['number']}")
+        revisions.append(revision)
+        self._log("add", revision)
+        return revision
+
+    def latest(self, will_id):
+        revisions = self._by_will.get(will_id)
+        return revisions[-1] if revisions else None
+
+    def list_for_will(self, will_id):
+        return list(self._by_will.get(will_id, ()))
+
+    def chain(self, will_id, number):
+        """Revisions from the checkpoint behind ``number`` up to ``number``."""
+        revisions = self._by_will.get(will_id, ())
+        if not 1 <= number <= len(revisions):
+            return []
+        return revisions[revisions[number - 1]["base"] - 1:number]
+
+    def dump(self):
+        return "add", [revision for revisions in list(self._by_will.values()) for revision in revisions]
+
+
+class MessageStore(_Store):
+    """Outbox messages keyed by id, with a channel -> undelivered index."""
+
+    kind = "message"
+
+    def __init__(self):
+        super().__init__()
+        self._messages = {}
+        self._undelivered = {}
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get(self, message_id):
+        return self._messages.get(message_id)
+
+    def _index(self, message):
+        undelivered = self._undelivered.setdefault(message["channel"], {})
+        if message["status"] in ("pending", "sending"):
+            undelivered[message["id"]] = None
+        else:
+            undelivered.pop(message["id"], None)
+
+    def add(self, message):
+        self._messages[message["id"]] = message
+        self._index(message)
+        self._log("add", message)
+        return message
+
+    def update(self, message_id, fields):
+        message = {**self._messages[message_id], **fields}
+        self._messages[message_id] = message
+        self._index(message)
+        self._log("update", message_id, fields)
+        return message
+
+    def claim(self, channel, now, lease_until, limit):
+        """Lease up to ``limit`` due messages for delivery, oldest first."""
+        due = []
+        for message_id in self._undelivered.get(channel, ()):
+            if self._messages[message_id]["next_attempt_at"] <= now:
+                due.append(message_id)
+                if len(due) == limit:
+                    break
+        return [
+            self.update(message_id, {
+                "status": "sending",
+                "attempts": self._messages[message_id]["attempts"] + 1,
+                "next_attempt_at": lease_until,
+            })
+            for message_id in due
+        ]
+
+    def dump(self):
+        return "add", list(self._messages.values())
+
+
+class RevocationStore(_Store):
+    """Revoked access tokens, keyed by their ``jti`` claim, until they expire."""
+
+    kind = "revocation"
+    PRUNE_EVERY = 1024
+
+    def __init__(self):
+        super().__init__()
+        self._revoked = {}
+        self._prune_at = self.PRUNE_EVERY
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def get(self, jti):
+        return self._revoked.get(jti)
+
+    def add(self, revocation):
+        self._revoked[revocation["jti"]] = revocation
+        self._log("add", revocation)
+        if len(self._revoked) >= self._prune_at:
+            self.prune(time.time())
+        return revocation
+
+    def prune(self, now):
+        """Forget revocations of tokens that have expired anyway.
+
+        Not journaled: replay re-adds them and the next prune drops them again.
+        """
+        self._revoked = {jti: r for jti, r in self._revoked.items() if r["exp"] > now}
+        self._prune_at = max(self.PRUNE_EVERY, 2 * len(self._revoked))
+
+    def dump(self):
+        now = time.time()
+        return "add", [revocation for revocation in list(self._revoked.values()) if revocation["exp"] > now]
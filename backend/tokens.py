@@ -0,0 +1,82 @@
+"""Cache of verified access tokens, with revocation."""
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """Bounded LRU of tokens that already passed signature verification.
+
+    Entries expire at the token's own ``exp``, so a cached token is never
+    accepted after it would have failed ``jwt.decode``. Revocation is by
+    the token's ``jti`` claim, which is unique per issued token: revoked ids
+    are remembered until they expire, so the token is rejected even if
+    re-presented, and another token for the same user is not affected.
+
+    With a ``revocations`` store, revocations are also written there and
+    every token is checked against it, so a logout handled by one worker
+    process holds in all of them. A revocation found there is remembered
+    locally, which keeps revoked tokens on the fast path.
+    """
+
+    def __init__(self, max_entries: int = 10000, revocations=None):
+        self.max_entries = max_entries
+        self.revocations = revocations
+        self._entries = OrderedDict()  # token -> (subject, jti, exp)
+        self._revoked = {}  # jti -> exp
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token: str):
+        """(subject, jti) of a verified token, or None."""
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        subject, jti, exp = entry
+        if exp <= time.time():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return subject, jti
+
+    def put(self, token: str, subject: str, jti: str, exp: float):
+        self._entries[token] = (subject, jti, exp)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def revoke(self, jti: str, exp: float):
+        now = time.time()
+        if exp > now:
+            self._revoked[jti] = exp
+            if self.revocations is not None:
+                self.revocations.add({"jti": jti, "exp": exp})
+        # Forget revocations whose tokens have expired anyway
+        if len(self._revoked) > self.max_entries:
+            self._revoked = {j: e for j, e in self._revoked.items() if e > now}
+
+    def is_revoked(self, jti: str) -> bool:
+        if jti in self._revoked:
+            return True
+        if self.revocations is None:
+            return False
+        revocation = self.revocations.get(jti)
+        if revocation is None or revocation["exp"] <= time.time():
+            return False
+        self._revoked[jti] = revocation["exp"]
+        return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "revoked": len(self._revoked),
+        }
@@ -0,0 +1,90 @@
+"""Request body limit for multipart uploads.
+
+FastAPI parses a multipart form, spooling the file to disk, before the
+handler runs, so a size check in the handler only fires after the whole
+body has been received. This middleware stops oversized uploads earlier:
+a declared Content-Length over the limit is refused before any of the body
+is read, and a body that grows past it (chunked, or a lying header) is cut
+off as soon as the limit is crossed. Both get a 413.
+
+The form's ``file_type`` field arrives with the body, often after the file,
+so it cannot pick the limit in time. Clients send the type in the query
+string as well (``?file_type=documents``) and that type's limit applies;
+without it the largest limit does, and the handler still checks the file
+against its type's limit as it copies it.
+"""
+import json
+from urllib.parse import parse_qs
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadLimitMiddleware:
+    """413 for request bodies over the limit on paths under ``prefix``.
+
+    ``limits`` maps a ``file_type`` query value to its limit in bytes;
+    requests without a known type are held to ``max_bytes``.
+    """
+
+    def __init__(self, app, prefix: str, max_bytes: int, limits: dict = None):
+        self.app = app
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.limits = limits or {}
+
+    def _limit(self, scope) -> int:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        file_type = query.get("file_type", [None])[0]
+        return self.limits.get(file_type, self.max_bytes)
+
+    async def _reject(self, send, max_bytes: int):
+        body = json.dumps({"detail": f"Upload too large; the limit is {max_bytes // (1024 * 1024)} MB"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self._limit(scope)
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > max_bytes:
+            await self._reject(send, max_bytes)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def counting_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # FastAPI turns a failed form parse into a 400; ours replaces it
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if exceeded and not started:
+            await self._reject(send, max_bytes)
@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+"""
+Local load and benchmark suite for the Will Writing App backend
+
+Drives the ASGI app either in-process (httpx's ASGI transport, no sockets)
+or through local uvicorn worker processes, with a fake LLM in place of the
+real one. Each scenario reports throughput and p50/p90/p99 latency, and the
+whole run is saved as JSON so later runs can be compared against it:
+
+    python backend_bench.py --output baseline.json
+    python backend_bench.py --compare baseline.json
+    python backend_bench.py --mode uvicorn --storage sqlite --workers 1,2,4,8 -s login,will_get
+
+The health_under_* scenarios time /api/health while --background requests
+of another kind (AI calls, uploads, will saves) are kept in flight, which
+shows whether that work holds up the event loop. With --health-p99-limit-ms the run fails
+when health p99 under load goes over the limit:
+
+    python backend_bench.py -s health,health_under_ai,health_under_upload,health_under_write --health-p99-limit-ms 50
+
+--metrics both runs every scenario with and without MetricsMiddleware and
+reports the difference, which is the cost of the per-route instrumentation:
+
+    python backend_bench.py --metrics both -s health,will_get,will_list -n 5000
+
+--hash-workers runs everything once per password hashing pool size, which
+shows how login throughput scales with cores:
+
+    python backend_bench.py -s login --hash-workers 1,2,4,8 -c 64 -n 2000
+
+will_list also reports the size of one page with the default projection
+and with fields=all, which is what the projection saves:
+
+    python backend_bench.py -s will_list --wills-per-user 50 --content-size 20000
+
+Uploads are unique by default. --duplicates makes that fraction of them
+repeat content uploaded earlier, and each run then reports how many blobs
+were stored and the bytes deduplication saved:
+
+    python backend_bench.py -s upload --duplicates 0.5 -n 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent
+BACKEND_DIR = ROOT / "backend"
+
+SCENARIOS = [
+    "signup", "login", "will_create", "will_get", "will_update", "will_list",
+    "will_search", "upload", "download", "ai_assist",
+    "health", "health_under_ai", "health_under_upload", "health_under_write",
+]
+# Scenario -> operation kept running in the background while it is measured
+BACKGROUND_LOAD = {
+    "health_under_ai": "ai_assist", "health_under_upload": "upload", "health_under_write": "will_update",
+}
+PASSWORD = "bench-password-1"
+WORDS = "నా ఆస్తి వీలునామా భార్య కుమారుడు मेरी संपत्ति वसीयत पत्नी बेटा house land savings son daughter".split()
+
+
+class FakeLLM:
+    """Stands in for the LLM backend with a fixed latency."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    async def send(self, system_message: str, text: str) -> str:
+        await asyncio.sleep(self.latency)
+        return f"Suggestion for: {text[:80]}"
+
+    async def stream(self, system_message: str, text: str):
+        for chunk in ("Suggestion ", "for: ", text[:80]):
+            await asyncio.sleep(self.latency / 3)
+            yield chunk
+
+
+def bench_app():
+    """uvicorn --factory entry point: the real app with the fake LLM."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    server.ai_client.backend = FakeLLM(float(os.getenv("BENCH_LLM_LATENCY_MS", "50")) / 1000)
+    if os.getenv("BENCH_METRICS") == "0":
+        # The middleware stack is built on the first request, so this removes it entirely
+        server.app.user_middleware = [m for m in server.app.user_middleware if m.cls is not server.MetricsMiddleware]
+    return server.app
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def will_text(size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+class BackendBenchmark:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = None
+        self.process = None
+        self.client = None
+        self.app = None
+        self.users = []  # (username, token, will_id, file_id)
+        self.counter = 0
+        self.uploaded = []  # recent upload contents, reused by --duplicates
+        self.upload_count = 0
+        self.upload_bytes = 0
+
+    # Setup and teardown
+
+    def environment(self, metrics: bool, hash_workers: int = None) -> dict:
+        env = {
+            "STORAGE_BACKEND": self.args.storage,
+            "SECRET_KEY": "bench-secret-key-0123456789abcdef",
+            "DATA_DIR": str(self.workdir / "data"),
+            "PASSWORD_HASH_ROUNDS": str(self.args.password_rounds),
+            "BENCH_LLM_LATENCY_MS": str(self.args.llm_latency_ms),
+            "EMERGENT_LLM_KEY": "",
+            "AI_CACHE_SIZE": "0" if self.args.no_ai_cache else "1024",
+            "BENCH_METRICS": "1" if metrics else "0",
+        }
+        if hash_workers is not None:
+            env["PASSWORD_HASH_WORKERS"] = str(hash_workers)
+        return env
+
+    async def start(self, workers: int, metrics: bool = True, hash_workers: int = None):
+        self.workdir = Path(tempfile.mkdtemp(prefix="willbench-"))
+        env = self.environment(metrics, hash_workers)
+        if self.args.mode == "inprocess":
+            os.environ.update(env)
+            os.chdir(self.workdir)
+            self.app = bench_app()
+            await self.app.router.startup()
+            transport = httpx.ASGITransport(app=self.app)
+            self.client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120)
+        else:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "backend_bench:bench_app", "--factory",
+                 "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+                 "--log-level", "warning", "--app-dir", str(ROOT)],
+                cwd=self.workdir,
+                env={**os.environ, **env, "PYTHONPATH": str(BACKEND_DIR)},
+            )
+            limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+            self.client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits)
+            for _ in range(300):
+                try:
+                    if (await self.client.get("/api/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+
+    async def stop(self):
+        await self.client.aclose()
+        if self.app is not None:
+            await self.app.router.shutdown()
+            os.chdir(ROOT)
+            # A fresh import per run, so each run starts from empty stores
+            for name in [name for name, module in sys.modules.items()
+                         if getattr(module, "__file__", None) and str(BACKEND_DIR) in module.__file__]:
+                del sys.modules[name]
+            self.app = None
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+            self.process = None
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def next_id(self) -> int:
+        self.counter += 1
+        return self.counter
+
+    async def signup(self) -> tuple:
+        n = self.next_id()
+        username = f"bench{n}@example.com"
+        response = await self.client.post("/api/auth/signup", json={
+            "email": username, "mobile": f"9{n:09d}", "password": PASSWORD, "confirm_password": PASSWORD,
+        })
+        response.raise_for_status()
+        return username, response.json()["access_token"]
+
+    def headers(self, token: str) -> dict:
+        return {"Authorization": f"Bearer {token}"}
+
+    async def prepare(self, users: int = None):
+        """One account per concurrent client, each with --wills-per-user wills and a file.
+
+        ``users`` more accounts are inserted afterwards, in-process only.
+        """
+        self.users = []
+        self.uploaded = []
+        self.upload_count = self.upload_bytes = 0
+        for _ in range(self.args.concurrency):
+            username, token = await self.signup()
+            for _ in range(self.args.wills_per_user):
+                response = await self.client.post("/api/wills/create", headers=self.headers(token), json={
+                    "title": "Bench will", "language": "telugu", "content": will_text(self.args.content_size),
+                })
+                response.raise_for_status()
+            will_id = response.json()["will_id"]
+            response = await self.upload(token, will_id)
+            self.users.append((username, token, will_id, response.json()["file_id"]))
+        if users and self.app is not None:
+            self.populate_users(users)
+
+    def populate_users(self, count: int):
+        # Login cost should not depend on how many accounts exist; insert
+        # them straight into the store rather than hashing each password
+        server = sys.modules["server"]
+        hashed = server.users_db.find_by_login(self.users[0][0])["password"]
+        for n in range(count):
+            user_id = f"filler{n}@example.com_8{n:09d}"
+            if user_id not in server.users_db:
+                server.users_db.add({
+                    "id": user_id, "email": f"filler{n}@example.com", "mobile": f"8{n:09d}",
+                    "password": hashed, "created_at": datetime.now().isoformat(),
+                })
+
+    def file_bytes(self) -> bytes:
+        # Unique content unless --duplicates asks for repeats, which the blob store keeps once
+        if self.uploaded and random.random() < self.args.duplicates:
+            return random.choice(self.uploaded)
+        content = self.next_id().to_bytes(8, "big") + os.urandom(max(self.args.file_size - 8, 0))
+        if self.args.duplicates:
+            self.uploaded = self.uploaded[-63:] + [content]
+        return content
+
+    async def upload(self, token: str, will_id: str):
+        content = self.file_bytes()
+        response = await self.client.post(
+            f"/api/files/upload/{will_id}", headers=self.headers(token), params={"file_type": "documents"},
+            files={"file": ("bench.bin", content)}, data={"file_type": "documents"},
+        )
+        response.raise_for_status()
+        self.upload_count += 1
+        self.upload_bytes += len(content)
+        return response
+
+    def storage(self) -> dict:
+        """Blobs on disk against the bytes uploaded, i.e. what deduplication saved."""
+        blobs = [path for path in (self.workdir / "user_data" / "blobs").rglob("*")
+                 if path.is_file() and path.parent.name not in ("tmp", "locks")]
+        blob_bytes = sum(path.stat().st_size for path in blobs)
+        return {
+            "uploads": self.upload_count,
+            "uploaded_bytes": self.upload_bytes,
+            "blobs": len(blobs),
+            "blob_bytes": blob_bytes,
+            "bytes_saved": self.upload_bytes - blob_bytes,
+        }
+
+    async def list_response_bytes(self) -> dict:
+        """Size of one will list page with the default projection and with fields=all."""
+        sizes = {}
+        for name, params in (("default", {}), ("all", {"fields": "all"})):
+            response = await self.client.get("/api/wills/list", headers=self.headers(self.users[0][1]), params=params)
+            response.raise_for_status()
+            sizes[name] = len(response.content)
+            sizes["wills"] = len(response.json()["wills"])
+        return sizes
+
+    # Scenarios: each makes one request for client ``slot``
+
+    async def op_signup(self, slot):
+        await self.signup()
+
+    async def op_login(self, slot):
+        username = self.users[slot][0]
+        response = await self.client.post("/api/auth/login", json={"username": username, "password": PASSWORD})
+        response.raise_for_status()
+
+    async def op_will_create(self, slot):
+        response = await self.client.post("/api/wills/create", headers=self.headers(self.users[slot][1]), json={
+            "title": f"Will {self.next_id()}", "language": "hindi", "content": self.content,
+        })
+        response.raise_for_status()
+
+    async def op_will_get(self, slot):
+        _, token, will_id, _ = self.users[slot]
+        (await self.client.get(f"/api/wills/{will_id}", headers=self.headers(token))).raise_for_status()
+
+    async def op_will_update(self, slot):
+        _, token, will_id, _ = self.users[slot]
+        content = self.content[:-16] + f" edit {self.next_id():09d}"
+        response = await self.client.put(f"/api/wills/{will_id}", headers=self.headers(token), json={
+            "title": "Bench will", "language": "telugu", "content": content,
+        })
+        response.raise_for_status()
+
+    async def op_will_list(self, slot):
+        (await self.client.get("/api/wills/list", headers=self.headers(self.users[slot][1]))).raise_for_status()
+
+    async def op_will_search(self, slot):
+        response = await self.client.get("/api/wills/search", headers=self.headers(self.users[slot][1]),
+                                         params={"q": f"{random.choice(WORDS)} {random.choice(WORDS)[:2]}*"})
+        response.raise_for_status()
+
+    async def op_upload(self, slot):
+        _, token, will_id, _ = self.users[slot]
+        await self.upload(token, will_id)
+
+    async def op_download(self, slot):
+        _, token, _, file_id = self.users[slot]
+        async with self.client.stream("GET", f"/api/files/download/{file_id}", headers=self.headers(token)) as response:
+            response.raise_for_status()
+            async for _ in response.aiter_bytes():
+                pass
+
+    async def op_ai_assist(self, slot):
+        # A distinct query each time, so the reply cache does not answer it
+        response = await self.client.post("/api/ai/assist", headers=self.headers(self.users[slot][1]), json={
+            "query": f"Review clause {self.next_id()}", "language": "english", "will_context": "",
+        })
+        response.raise_for_status()
+        if not response.json().get("success"):
+            raise RuntimeError(response.json().get("error"))
+
+    async def op_health(self, slot):
+        (await self.client.get("/api/health")).raise_for_status()
+
+    op_health_under_ai = op_health_under_upload = op_health_under_write = op_health
+
+    # Measurement
+
+    def start_background(self, operation: str):
+        """Keep --background requests of ``operation`` in flight; returns (stop, tasks, counts)."""
+        operation = getattr(self, f"op_{operation}")
+        stop = asyncio.Event()
+        counts = {"completed": 0, "errors": 0}
+
+        async def loop(slot):
+            while not stop.is_set():
+                try:
+                    await operation(slot % len(self.users))
+                    counts["completed"] += 1
+                except Exception:
+                    counts["errors"] += 1
+                # A request that completes without suspending (e.g. a SQLite-backed
+                # save in-process) would otherwise never let the measured requests run
+                await asyncio.sleep(0)
+
+        tasks = [asyncio.create_task(loop(slot)) for slot in range(self.args.background)]
+        return stop, tasks, counts
+
+    async def run_scenario(self, name: str) -> dict:
+        operation = getattr(self, f"op_{name}")
+        self.content = will_text(self.args.content_size)
+        total = self.args.requests
+        for slot in range(min(self.args.warmup, total)):
+            await operation(slot % len(self.users))
+
+        background = None
+        if name in BACKGROUND_LOAD:
+            background = self.start_background(BACKGROUND_LOAD[name])
+            # Let the background requests get in flight before measuring
+            await asyncio.sleep(self.args.llm_latency_ms / 1000 + 0.1)
+
+        latencies = []
+        errors = []
+        issued = 0
+
+        async def client(slot):
+            nonlocal issued
+            while issued < total:
+                issued += 1
+                start = time.perf_counter()
+                try:
+                    await operation(slot)
+                except Exception as e:
+                    errors.append(repr(e))
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(slot) for slot in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+        extra = {}
+        if background is not None:
+            stop, tasks, counts = background
+            stop.set()
+            await asyncio.gather(*tasks)
+            extra = {"background": BACKGROUND_LOAD[name], "background_in_flight": self.args.background,
+                     "background_completed": counts["completed"], "background_errors": counts["errors"]}
+        if name == "will_list":
+            extra = {"response_bytes": await self.list_response_bytes()}
+
+        latencies.sort()
+        ms = lambda value: round(value * 1000, 3) if value is not None else None
+        return {
+            **extra,
+            "requests": total,
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+            "seconds": round(elapsed, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "p50_ms": ms(percentile(latencies, 0.50)),
+            "p90_ms": ms(percentile(latencies, 0.90)),
+            "p99_ms": ms(percentile(latencies, 0.99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+        }
+
+    async def run(self) -> dict:
+        runs = []
+        variants = {"on": [True], "off": [False], "both": [True, False]}[self.args.metrics]
+        runs_to_do = [(w, m, h, u) for w in self.args.workers for m in variants
+                      for h in self.args.hash_workers or [None] for u in self.args.users or [None]]
+        for workers, metrics, hash_workers, users in runs_to_do:
+            label = f"{workers} worker(s)" + ("" if self.args.metrics == "on" else f", metrics {'on' if metrics else 'off'}")
+            if hash_workers is not None:
+                label += f", {hash_workers} hash worker(s)"
+            if users is not None:
+                label += f", {users} users"
+            await self.start(workers, metrics, hash_workers)
+            try:
+                await self.prepare(users)
+                results = {}
+                for name in self.args.scenarios:
+                    results[name] = await self.run_scenario(name)
+                    r = results[name]
+                    print(f"  [{label}] {name:<12} {r['throughput_rps']:>9} req/s  "
+                          f"p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  errors {r['errors']}"
+                          + (f"  ({r['background_in_flight']} {r['background']} in flight, "
+                             f"{r['background_completed']} done)" if "background" in r else ""))
+                    if "response_bytes" in r:
+                        sizes = r["response_bytes"]
+                        print(f"  [{label}] {name:<12} response {sizes['default'] / 1024:.1f} kB, "
+                              f"{sizes['all'] / 1024:.1f} kB with fields=all ({sizes['wills']} wills)")
+                storage = self.storage()
+                print(f"  [{label}] storage      {storage['uploads']} uploads in {storage['blobs']} blobs, "
+                      f"{storage['bytes_saved'] / 1e6:.1f} MB saved of {storage['uploaded_bytes'] / 1e6:.1f} MB")
+            finally:
+                await self.stop()
+            runs.append({"workers": workers, "metrics": metrics, "hash_workers": hash_workers, "users": users,
+                         "results": results, "storage": storage})
+        return {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "mode": self.args.mode,
+                "storage": self.args.storage,
+                "concurrency": self.args.concurrency,
+                "requests": self.args.requests,
+                "content_size": self.args.content_size,
+                "wills_per_user": self.args.wills_per_user,
+                "file_size": self.args.file_size,
+                "duplicates": self.args.duplicates,
+                "llm_latency_ms": self.args.llm_latency_ms,
+                "password_rounds": self.args.password_rounds,
+                "hash_workers": self.args.hash_workers,
+                "users": self.args.users,
+                "metrics": self.args.metrics,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "runs": runs,
+        }
+
+
+def run_key(run: dict, metrics: bool = None) -> tuple:
+    """What a run varied; runs with equal keys are comparable across reports."""
+    return (run["workers"], run.get("metrics", True) if metrics is None else metrics,
+            run.get("hash_workers"), run.get("users"))
+
+
+def run_label(run: dict) -> str:
+    label = f"{run['workers']} worker(s)"
+    if run.get("hash_workers") is not None:
+        label += f", {run['hash_workers']} hash worker(s)"
+    if run.get("users") is not None:
+        label += f", {run['users']} users"
+    return label
+
+
+def metrics_overhead(report: dict) -> dict:
+    """Per scenario, how much slower it ran with MetricsMiddleware than without."""
+    overhead = {}
+    runs = {run_key(run): run["results"] for run in report["runs"]}
+    for run in report["runs"]:
+        without = runs.get(run_key(run, metrics=False))
+        if not run.get("metrics", True) or without is None:
+            continue
+        for name, result in run["results"].items():
+            base = without.get(name)
+            if not base or not base.get("p50_ms") or not result.get("p50_ms"):
+                continue
+            overhead[f"{name} ({run_label(run)})"] = {
+                "p50_ms": round(result["p50_ms"] - base["p50_ms"], 3),
+                "p50_change": round(result["p50_ms"] / base["p50_ms"] - 1, 4),
+                "p99_change": round(result["p99_ms"] / base["p99_ms"] - 1, 4),
+                "throughput_change": round(result["throughput_rps"] / base["throughput_rps"] - 1, 4),
+            }
+    return overhead
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Scenarios whose p99 or throughput got worse than ``threshold`` (a fraction)."""
+    regressions = []
+    previous = {run_key(run): run["results"] for run in baseline.get("runs", [])}
+    for run in report["runs"]:
+        label = run_label(run)
+        for name, result in run["results"].items():
+            before = previous.get(run_key(run), {}).get(name)
+            if not before or not before.get("p99_ms") or not result.get("p99_ms"):
+                continue
+            p99_change = result["p99_ms"] / before["p99_ms"] - 1
+            rps_change = result["throughput_rps"] / before["throughput_rps"] - 1
+            print(f"  [{label}] {name:<12} p99 {p99_change:+.1%}  throughput {rps_change:+.1%}")
+            if p99_change > threshold or rps_change < -threshold:
+                regressions.append(f"{name} ({label})")
+    return regressions
+
+
+def over_limit(report: dict, limit_ms: float) -> list:
+    """health_under_* scenarios whose p99 went over ``limit_ms``."""
+    failures = []
+    for run in report["runs"]:
+        for name, result in run["results"].items():
+            if name in BACKGROUND_LOAD and (result["p99_ms"] is None or result["p99_ms"] > limit_ms
+                                            or result["errors"]):
+                failures.append(f"{name} ({run_label(run)}): "
+                                f"p99 {result['p99_ms']} ms, "
+                                f"{result['errors']} errors")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Will Writing App backend locally")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--workers", default="1", help="uvicorn worker counts to run, e.g. 1,2,4,8")
+    parser.add_argument("-s", "--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--content-size", type=int, default=4000, help="will text length in characters")
+    parser.add_argument("--wills-per-user", type=int, default=1, help="wills created for each client account")
+    parser.add_argument("--file-size", type=int, default=256 * 1024, help="upload size in bytes")
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="fraction of uploads that repeat earlier content (0 to 1)")
+    parser.add_argument("--users", help="extra account counts to run, e.g. 1000,10000,100000 (in-process only)")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--no-ai-cache", action="store_true")
+    parser.add_argument("--background", type=int, default=50, help="requests kept in flight by health_under_*")
+    parser.add_argument("--health-p99-limit-ms", type=float, help="fail if health p99 under load exceeds this")
+    parser.add_argument("--password-rounds", type=int, default=29000)
+    parser.add_argument("--hash-workers", help="PASSWORD_HASH_WORKERS values to run, e.g. 1,2,4,8 (default: CPU count)")
+    parser.add_argument("--metrics", choices=["on", "off", "both"], default="on",
+                        help="run with MetricsMiddleware, without it, or both to measure its overhead")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression threshold for --compare")
+    args = parser.parse_args()
+    args.workers = [int(w) for w in args.workers.split(",")]
+    args.hash_workers = [int(h) for h in args.hash_workers.split(",")] if args.hash_workers else None
+    args.users = [int(u) for u in args.users.split(",")] if args.users else None
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.mode == "inprocess" and args.workers != [1]:
+        parser.error("--workers needs --mode uvicorn")
+    if args.users and args.mode != "inprocess":
+        parser.error("--users needs --mode inprocess")
+    if max(args.workers) > 1 and args.storage != "sqlite":
+        parser.error("multiple workers need --storage sqlite")
+
+    print(f"🚀 Benchmarking ({args.mode}, {args.storage}, concurrency {args.concurrency}, {args.requests} requests per scenario)")
+    report = asyncio.run(BackendBenchmark(args).run())
+    if args.metrics == "both":
+        report["metrics_overhead"] = metrics_overhead(report)
+        print("📏 MetricsMiddleware overhead")
+        for name, change in report["metrics_overhead"].items():
+            print(f"  {name:<28} p50 {change['p50_ms']:+.3f} ms ({change['p50_change']:+.1%})  "
+                  f"p99 {change['p99_change']:+.1%}  throughput {change['throughput_change']:+.1%}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"📄 Results written to {args.output}")
+    if args.health_p99_limit_ms is not None:
+        failures = over_limit(report, args.health_p99_limit_ms)
+        if failures:
+            print(f"❌ Health latency under load: {'; '.join(failures)}")
+            return 1
+        print(f"✅ Health p99 under load within {args.health_p99_limit_ms} ms")
+    if args.compare:
+        print(f"📊 Compared with {args.compare}")
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressions:
+            print(f"❌ Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -411,7 +411,8 @@ class WillWritingAPITester:
 
 def main():
     """Main test execution"""
-    tester = WillWritingAPITester()
+    # Pass a base URL (e.g. http://localhost:8001) to test a local server
+    tester = WillWritingAPITester(sys.argv[1]) if len(sys.argv) > 1 else WillWritingAPITester()
     
     try:
         success = tester.run_all_tests()
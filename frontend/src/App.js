@@ -4,6 +4,8 @@ import './App.css';
 
 // API Configuration
 const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+const AI_POLL_INTERVAL_MS = 2000;
+const AI_POLL_ATTEMPTS = 60;
 
 const App = () => {
   const [currentView, setCurrentView] = useState('auth');
@@ -202,8 +204,15 @@ const App = () => {
 
   const fetchWills = async () => {
     try {
-      const data = await apiCall('GET', '/wills/list');
-      setWills(data.wills);
+      let allWills = [];
+      let cursor = null;
+      do {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const data = await apiCall('GET', `/wills/list${query}`);
+        allWills = allWills.concat(data.wills);
+        cursor = data.next_cursor;
+      } while (cursor);
+      setWills(allWills);
     } catch (error) {
       console.error('Failed to fetch wills:', error);
     }
@@ -235,6 +244,31 @@ const App = () => {
     }
   };
 
+  // AI suggestions are produced in the background; re-fetch the will until its job is done
+  const waitForAISuggestions = async (willId, jobId) => {
+    for (let attempt = 0; attempt < AI_POLL_ATTEMPTS; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, AI_POLL_INTERVAL_MS));
+      try {
+        const response = await axios.get(`${API_BASE_URL}/api/wills/${willId}`, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        const will = response.data.will;
+        if (will.ai_job_id !== jobId) {
+          return; // a later save queued a newer job
+        }
+        const done = will.ai_status ? will.ai_status !== 'queued' : Boolean(will.ai_suggestions);
+        if (done) {
+          alert(`AI Suggestion: ${will.ai_suggestions}`);
+          fetchWills();
+          return;
+        }
+      } catch (error) {
+        console.error('Failed to fetch AI suggestions:', error);
+        return;
+      }
+    }
+  };
+
   const handleCreateWill = async (e) => {
     e.preventDefault();
     try {
@@ -247,10 +281,10 @@ const App = () => {
       
       if (data.success) {
         alert('Will created successfully!');
-        if (data.ai_suggestions) {
-          alert(`AI Suggestion: ${data.ai_suggestions}`);
-        }
         fetchWills();
+        if (data.ai_job_id) {
+          waitForAISuggestions(data.will_id, data.ai_job_id);
+        }
         setWillForm({ title: '', language: 'english', content: '', aiAssisted: false });
       }
     } catch (error) {
@@ -298,7 +332,8 @@ const App = () => {
         formData.append('file_type', fileType);
 
         const response = await axios.post(
-          `${API_BASE_URL}/api/files/upload/${currentWill.id}`,
+          // file_type in the query lets the server apply its size limit before the body arrives
+          `${API_BASE_URL}/api/files/upload/${currentWill.id}?file_type=${encodeURIComponent(fileType)}`,
           formData,
           {
             headers: {
@@ -536,7 +571,7 @@ const App = () => {
               <h3>{will.title}</h3>
               <p><strong>Language:</strong> {will.language}</p>
               <p><strong>Created:</strong> {new Date(will.created_at).toLocaleDateString()}</p>
-              {will.ai_suggestions && (
+              {will.ai_assisted && (
                 <p className="ai-badge">AI Assisted</p>
               )}
             </div>
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the journal's write throughput and restart time
+
+Drives the in-memory stores with a journal attached, as the server does
+with STORAGE_BACKEND=memory:
+
+- buffered: wills added and updated (one in three ops an update) as fast
+  as the stores take them, then one sync() for all of them;
+- durable: --concurrency writers that each add a will and wait for sync()
+  before the next, as every write request does; fsyncs are shared between
+  the writers waiting at the same time;
+- snapshot: sealing the segment and writing the snapshot of --wills wills;
+- restart: a fresh process's Journal.open() on that snapshot plus a tail
+  of --tail ops written after it.
+
+    python journal_bench.py --wills 1000000
+    python journal_bench.py --wills 100000 --tail 50000 --dir /mnt/ssd/tmp --output journal.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from journal import Journal  # noqa: E402
+from store import FileStore, MessageStore, RevisionStore, UserStore, WillStore  # noqa: E402
+
+LANGUAGES = ("english", "hindi", "telugu")
+
+
+def make_stores():
+    return [UserStore(), WillStore(), FileStore(), RevisionStore(), MessageStore()]
+
+
+def make_will(n: int, content: str) -> dict:
+    created_at = (datetime(2025, 1, 1) + timedelta(seconds=n)).isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": f"user{n % 100000}@example.com_9{n % 100000:09d}",
+        "title": f"Will {n}",
+        "language": LANGUAGES[n % len(LANGUAGES)],
+        "content": content,
+        "ai_suggestions": "",
+        "ai_job_id": None,
+        "ai_status": None,
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def buffered_writes(journal: Journal, wills: WillStore, count: int, content: str) -> dict:
+    start = time.perf_counter()
+    ops = 0
+    for n in range(count):
+        will = wills.add(make_will(n, content))
+        ops += 1
+        if n % 2 == 0:
+            wills.update(will["id"], {"title": f"Will {n} (edited)", "updated_at": datetime.now().isoformat()})
+            ops += 1
+    asyncio.run(journal.sync())
+    elapsed = time.perf_counter() - start
+    return {"ops": ops, "seconds": round(elapsed, 2), "ops_per_s": round(ops / elapsed)}
+
+
+async def durable_writes(journal: Journal, wills: WillStore, count: int, concurrency: int, content: str) -> dict:
+    latencies = []
+    issued = 0
+
+    async def writer():
+        nonlocal issued
+        while issued < count:
+            issued += 1
+            start = time.perf_counter()
+            wills.add(make_will(issued, content))
+            await journal.sync()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "ops": count,
+        "concurrency": concurrency,
+        "ops_per_s": round(count / elapsed),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def run(args, directory: Path) -> dict:
+    content = "x" * args.content_size
+    stores = make_stores()
+    wills = stores[1]
+    # No automatic snapshots while loading; one is taken explicitly below
+    journal = Journal(directory, stores, snapshot_every=1 << 62)
+    journal.open()
+    report = {"wills": args.wills, "content_size": args.content_size}
+
+    report["buffered"] = buffered_writes(journal, wills, args.wills, content)
+    report["durable"] = asyncio.run(durable_writes(journal, wills, args.durable_writes, args.concurrency, content))
+
+    start = time.perf_counter()
+    journal.snapshot()
+    sealed = time.perf_counter() - start
+    journal._snapshotter.join()
+    report["snapshot"] = {"sealing_ms": round(sealed * 1000, 1), "seconds": round(time.perf_counter() - start, 2),
+                          "bytes": sum(path.stat().st_size for path in directory.glob("snapshot-*.jsonl"))}
+
+    ids = list(wills._wills)[:args.tail]
+    for n, will_id in enumerate(ids):
+        wills.update(will_id, {"title": f"Tail edit {n}", "updated_at": datetime.now().isoformat()})
+    asyncio.run(journal.sync())
+    journal.close()
+
+    stores = make_stores()
+    start = time.perf_counter()
+    replayed = Journal(directory, stores, snapshot_every=1 << 62).open()
+    report["restart"] = {"seconds": round(time.perf_counter() - start, 2), "wills": len(stores[1]),
+                         "tail_ops_replayed": replayed}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark journal write throughput and restart time")
+    parser.add_argument("--wills", type=int, default=1_000_000, help="wills written before the snapshot")
+    parser.add_argument("--content-size", type=int, default=200, help="characters of will text per will")
+    parser.add_argument("--durable-writes", type=int, default=20000, help="writes that each wait for fsync")
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent durable writers")
+    parser.add_argument("--tail", type=int, default=100000, help="updates journaled after the snapshot")
+    parser.add_argument("--dir", help="where to put the journal (defaults to the system temp directory)")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="journal-bench-", dir=args.dir) as directory:
+        report = run(args, Path(directory))
+
+    buffered, durable = report["buffered"], report["durable"]
+    print(f"buffered  {buffered['ops']} ops in {buffered['seconds']} s ({buffered['ops_per_s']} ops/s)")
+    print(f"durable   {durable['ops_per_s']} ops/s with {durable['concurrency']} writers"
+          f"  p50 {durable['p50_ms']} ms  p99 {durable['p99_ms']} ms")
+    print(f"snapshot  {report['snapshot']['seconds']} s, {report['snapshot']['bytes'] / 1e6:.0f} MB"
+          f" (writes paused {report['snapshot']['sealing_ms']} ms)")
+    print(f"restart   {report['restart']['seconds']} s for {report['restart']['wills']} wills"
+          f" + {report['restart']['tail_ops_replayed']} tail ops")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the upload path's filesystem work at large user counts
+
+For each user count, builds a user_data tree in both layouts and then times
+what an upload does on disk: make sure the target directory exists, create
+the file, and rename it into place. "flat" is the old layout (one directory
+per raw user id directly under user_data/, four mkdir calls per upload);
+"sharded" is the hashed fan-out tree with its directory cache, starting
+cold as in a freshly started worker. Each chosen user uploads --per-user
+files in a row, as when recording several messages in one session.
+
+    python layout_bench.py --users 10000,100000,300000 --uploads 5000
+    python layout_bench.py --dir /mnt/ext4/tmp --output layout.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from layout import StorageLayout  # noqa: E402
+
+FILE_TYPES = ("audio", "video", "documents")
+
+
+def user_id(n: int) -> str:
+    return f"user{n}@example.com_9{n:09d}"
+
+
+def flat_setup(root: Path, uid: str) -> Path:
+    user_dir = root / uid
+    user_dir.mkdir(exist_ok=True)
+    for file_type in FILE_TYPES:
+        (user_dir / file_type).mkdir(exist_ok=True)
+    return user_dir
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def summarize(timings: list) -> dict:
+    timings = sorted(timings)
+    return {
+        "p50_us": round(percentile(timings, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(timings, 0.99) * 1e6, 1),
+        "mean_us": round(sum(timings) / len(timings) * 1e6, 1),
+    }
+
+
+def time_uploads(setup, users: int, uploads: int, per_user: int, payload: bytes) -> dict:
+    random.seed(users)
+    setups = []
+    totals = []
+    for n in range(uploads):
+        if n % per_user == 0:
+            uid = user_id(random.randrange(users))
+        start = time.perf_counter()
+        user_dir = setup(uid)
+        ready = time.perf_counter()
+        tmp_path = user_dir / f".upload-{n}"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, user_dir / "audio" / f"recording-{n}.webm")
+        end = time.perf_counter()
+        setups.append(ready - start)
+        totals.append(end - start)
+    return {"setup": summarize(setups), "upload": summarize(totals)}
+
+
+def largest_directory(root: Path) -> int:
+    return max(len(os.listdir(path)) for path, _, _ in os.walk(root))
+
+
+def run(users: int, uploads: int, per_user: int, payload: bytes, base: Path) -> dict:
+    result = {"users": users}
+
+    flat_root = base / f"flat-{users}"
+    flat_root.mkdir()
+    start = time.perf_counter()
+    for n in range(users):
+        flat_setup(flat_root, user_id(n))
+    result["flat_populate_s"] = round(time.perf_counter() - start, 2)
+    # Let writeback of the new tree finish so it does not land in the timings
+    os.sync()
+    result["flat"] = time_uploads(lambda uid: flat_setup(flat_root, uid), users, uploads, per_user, payload)
+    result["flat"]["largest_directory"] = len(os.listdir(flat_root))
+    shutil.rmtree(flat_root)
+    os.sync()
+
+    sharded_root = base / f"sharded-{users}"
+    populate = StorageLayout(sharded_root)
+    start = time.perf_counter()
+    for n in range(users):
+        populate.ensure_user_dir(user_id(n))
+    result["sharded_populate_s"] = round(time.perf_counter() - start, 2)
+    os.sync()
+    # A fresh layout, as a newly started worker would have, with its own cache
+    layout = StorageLayout(sharded_root)
+    result["sharded"] = time_uploads(layout.ensure_user_dir, users, uploads, per_user, payload)
+    result["sharded"]["largest_directory"] = largest_directory(sharded_root)
+    shutil.rmtree(sharded_root)
+    os.sync()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upload-path filesystem cost by storage layout")
+    parser.add_argument("--users", default="1000,10000,100000", help="user counts to test, e.g. 10000,300000")
+    parser.add_argument("--uploads", type=int, default=5000, help="timed uploads per layout and user count")
+    parser.add_argument("--per-user", type=int, default=3, help="consecutive uploads by each chosen user")
+    parser.add_argument("--file-size", type=int, default=4096)
+    parser.add_argument("--dir", help="where to build the trees (defaults to the system temp directory)")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.file_size)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="layout-bench-", dir=args.dir) as base:
+        for users in [int(count) for count in args.users.split(",")]:
+            result = run(users, args.uploads, args.per_user, payload, Path(base))
+            results.append(result)
+            print(f"{users} users")
+            for name in ("flat", "sharded"):
+                layout = result[name]
+                print(f"  {name:<8} setup p50 {layout['setup']['p50_us']:>7} us p99 {layout['setup']['p99_us']:>7} us"
+                      f"  upload p50 {layout['upload']['p50_us']:>7} us p99 {layout['upload']['p99_us']:>7} us"
+                      f"  largest dir {layout['largest_directory']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"file_size": args.file_size, "uploads": args.uploads, "per_user": args.per_user,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Benchmark of resident memory per user, will and file record
+
+Generates users, wills and files shaped like the server's, encodes them as
+journal lines and loads them back the two ways a worker can hold them:
+"dict" is what the stores kept before (one dict per record, as decoded from
+the journal on restart) and "record" is the compact slotted records. Memory
+is measured with tracemalloc and includes the values (ids, hashes, paths,
+will text), not only the containers. It also times reading records the way
+the list endpoints do (a newest-first page of an owner's wills and a field
+projection of each) and how long ``Journal.open`` takes to replay them on a
+restart, per record kind and in total, since the records trade replay time
+for memory: building a record costs more than decoding a dict, and that
+slower restart is the accepted price of the memory saved.
+
+    python records_bench.py --users 20000 --wills-per-user 3 --files-per-will 2
+    python records_bench.py --content-size 0 --output records.json
+"""
+
+import argparse
+import gc
+import heapq
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+import store  # noqa: E402
+from journal import Journal  # noqa: E402
+from records import FileRecord, UserRecord, WillRecord  # noqa: E402
+from store import _page  # noqa: E402
+
+LANGUAGES = ("english", "hindi", "telugu", "tamil", "kannada", "marathi")
+FILE_TYPES = {"audio": ".webm", "video": ".mp4", "documents": ".pdf"}
+LIST_FIELDS = ("id", "user_id", "title", "language", "ai_job_id", "created_at", "updated_at")
+
+
+def generate(users: int, wills_per_user: int, files_per_will: int, content_size: int):
+    """Journal lines for every record, as (kind, line) pairs."""
+    random.seed(users)
+    start = datetime(2025, 1, 1)
+    moment = lambda: (start + timedelta(seconds=random.randrange(50_000_000),  # noqa: E731
+                                        microseconds=random.randrange(1_000_000))).isoformat()
+    lines = []
+    for n in range(users):
+        user_id = f"user{n}@example.com_9{n:09d}"
+        lines.append(("user", json.dumps({
+            "id": user_id,
+            "email": f"user{n}@example.com",
+            "mobile": f"9{n:09d}",
+            "password": "$pbkdf2-sha256$29000$" + uuid.uuid4().hex[:22] + "$" + uuid.uuid4().hex + "abc",
+            "created_at": moment(),
+        })))
+        for _ in range(wills_per_user):
+            will_id = str(uuid.uuid4())
+            created_at = moment()
+            lines.append(("will", json.dumps({
+                "id": will_id,
+                "user_id": user_id,
+                "title": f"Will {random.randrange(1000)}",
+                "language": random.choice(LANGUAGES),
+                "content": "x" * content_size,
+                "ai_suggestions": "",
+                "ai_job_id": None,
+                "created_at": created_at,
+                "updated_at": created_at,
+            })))
+            for _ in range(files_per_will):
+                file_type = random.choice(list(FILE_TYPES))
+                sha256 = uuid.uuid4().hex + uuid.uuid4().hex
+                lines.append(("file", json.dumps({
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "will_id": will_id,
+                    "filename": f"recording{FILE_TYPES[file_type]}",
+                    "stored_filename": f"{sha256}{FILE_TYPES[file_type]}",
+                    "file_type": file_type,
+                    "file_path": f"user_data/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}",
+                    "size": random.randrange(1 << 24),
+                    "sha256": sha256,
+                    "created_at": moment(),
+                })))
+    return lines
+
+
+def measure(lines: list, build) -> int:
+    """Bytes still allocated after ``build`` has loaded ``lines``."""
+    gc.collect()
+    tracemalloc.start()
+    held = [build(json.loads(line)) for line in lines]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def dict_page(records, sort_key, limit):
+    """The stores' page function from before the records, for dicts."""
+    keyed = ((record[sort_key], record["id"], record) for record in records)
+    return [record for _, _, record in heapq.nlargest(limit, keyed, key=lambda item: item[:2])]
+
+
+def time_list(owners: dict, page, limit: int, rounds: int) -> float:
+    """Mean seconds for one page of an owner's wills, projected to list fields."""
+    owner_ids = list(owners)
+    start = time.perf_counter()
+    for n in range(rounds):
+        page_ = page(owners[owner_ids[n % len(owner_ids)]], "updated_at", limit)
+        [{name: will[name] for name in LIST_FIELDS if name in will} for will in page_]
+    return (time.perf_counter() - start) / rounds
+
+
+def time_replay(lines: list, records: bool, directory: Path) -> float:
+    """Seconds for ``Journal.open`` to replay the lines, as on a restart.
+
+    Without records the stores are handed plain dicts, as before, so both
+    runs do the same index upkeep.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True)
+    with open(directory / "journal-00000000.jsonl", "w", encoding="utf-8") as f:
+        for kind, line in lines:
+            f.write(f'["{kind}.add",{line}]\n')
+    types = (store.UserRecord, store.WillRecord, store.FileRecord)
+    if not records:
+        store.UserRecord = store.WillRecord = store.FileRecord = dict
+    try:
+        journal = Journal(directory, [store.UserStore(), store.WillStore(), store.FileStore()])
+        gc.collect()
+        start = time.perf_counter()
+        journal.open()
+        elapsed = time.perf_counter() - start
+        journal.close()
+        return elapsed
+    finally:
+        store.UserRecord, store.WillRecord, store.FileRecord = types
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark resident memory of store records")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--wills-per-user", type=int, default=3)
+    parser.add_argument("--files-per-will", type=int, default=2)
+    parser.add_argument("--content-size", type=int, default=2000, help="characters of will text per will")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20000, help="list pages to time")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    lines = generate(args.users, args.wills_per_user, args.files_per_will, args.content_size)
+    by_kind = {}
+    for kind, line in lines:
+        by_kind.setdefault(kind, []).append(line)
+
+    report = {"users": args.users, "wills_per_user": args.wills_per_user,
+              "files_per_will": args.files_per_will, "content_size": args.content_size, "records": {}}
+    scratch = Path(tempfile.mkdtemp(prefix="records_bench-"))
+    for kind, record_type in (("user", UserRecord), ("will", WillRecord), ("file", FileRecord)):
+        count = len(by_kind[kind])
+        before = measure(by_kind[kind], dict)
+        after = measure(by_kind[kind], record_type)
+        kind_lines = [(kind, line) for line in by_kind[kind]]
+        report["records"][kind] = {
+            "count": count,
+            "dict_bytes": round(before / count),
+            "record_bytes": round(after / count),
+            "saved": round(1 - after / before, 3),
+            "dict_replay_s": round(time_replay(kind_lines, False, scratch / "journal"), 3),
+            "record_replay_s": round(time_replay(kind_lines, True, scratch / "journal"), 3),
+        }
+
+    wills = [json.loads(line) for line in by_kind["will"]]
+    timings = {}
+    for name, build, page in (("dict", dict, dict_page), ("record", WillRecord, _page)):
+        owners = {}
+        for will in wills:
+            owners.setdefault(will["user_id"], []).append(build(will))
+        timings[name] = round(time_list(owners, page, args.page_size, args.rounds) * 1e6, 1)
+    report["list_page_us"] = timings
+    report["replay_s"] = {"dict": round(time_replay(lines, False, scratch / "journal"), 2),
+                          "record": round(time_replay(lines, True, scratch / "journal"), 2)}
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    for kind, result in report["records"].items():
+        print(f"{kind:<5} x{result['count']:<7} dict {result['dict_bytes']:>6} B/record"
+              f"  record {result['record_bytes']:>6} B/record  saved {result['saved']:.0%}"
+              f"  replay dict {result['dict_replay_s']} s  record {result['record_replay_s']} s")
+    print(f"list page ({args.page_size} of {args.wills_per_user}) dict {timings['dict']} us  record {timings['record']} us")
+    replay = report["replay_s"]
+    print(f"journal replay of {len(lines)} records: dict {replay['dict']} s  record {replay['record']} s"
+          f"  ({replay['record'] / replay['dict']:.2f}x restart time, traded for the memory saved)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
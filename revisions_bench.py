@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Benchmark of will revision storage: delta chains against full snapshots
+
+Records --edits revisions of each of --wills wills through RevisionHistory,
+once per --checkpoints setting. checkpoint_every 1 stores every revision in
+full, which is what keeping a copy of each draft would cost; larger values
+store deltas with a full checkpoint every N revisions, so a revision is
+rebuilt from at most N - 1 deltas. Edits are small and local (a word
+changed, a line added or removed, now and then a paragraph rewritten), the
+way people revise a will.
+
+For each setting it reports memory held by the in-memory store per revision
+(tracemalloc, values included), bytes per revision in the SQLite database,
+the time to record an update and the time to rebuild a revision: the latest
+one, and any revision chosen at random.
+
+    python revisions_bench.py
+    python revisions_bench.py --wills 20 --edits 1000 --checkpoints 1,16,32,64 --output revisions.json
+"""
+
+import argparse
+import gc
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+
+from revisions import RevisionHistory  # noqa: E402
+from sqlite_store import SQLiteDatabase  # noqa: E402
+from store import RevisionStore  # noqa: E402
+
+WORDS = ("I bequeath my house land savings jewellery shares to my wife son daughter "
+         "executor trustee guardian estate residue share equally absolutely").split()
+
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+
+def edit(rng: random.Random, text: str) -> str:
+    lines = text.split("\n")
+    roll = rng.random()
+    n = rng.randrange(len(lines))
+    if roll < 0.6:
+        words = lines[n].split(" ")
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+        lines[n] = " ".join(words)
+    elif roll < 0.8:
+        lines.insert(n, sentence(rng))
+    elif roll < 0.95 and len(lines) > 1:
+        del lines[n]
+    else:
+        lines[n:n + 5] = [sentence(rng) for _ in range(5)]
+    return "\n".join(lines)
+
+
+def generate(wills: int, edits: int, content_size: int, seed: int = 0) -> list:
+    """Per will, the text of every revision in order."""
+    rng = random.Random(seed)
+    histories = []
+    for _ in range(wills):
+        lines = []
+        while sum(len(line) + 1 for line in lines) < content_size:
+            lines.append(sentence(rng))
+        texts = ["\n".join(lines)]
+        for _ in range(edits - 1):
+            texts.append(edit(rng, texts[-1]))
+        histories.append(texts)
+    return histories
+
+
+def record_all(history: RevisionHistory, histories: list) -> tuple:
+    """Record every revision; returns (will ids, seconds per record)."""
+    start_time = datetime(2025, 1, 1)
+    will_ids = []
+    elapsed = 0.0
+    records = 0
+    for texts in histories:
+        will_id = str(uuid.uuid4())
+        will_ids.append(will_id)
+        previous = None
+        for n, text in enumerate(texts):
+            # A fresh copy, as a request body would be, so the store's memory counts the text it keeps
+            will = {"id": will_id, "title": "My will", "language": "english", "content": text.encode().decode(),
+                    "updated_at": (start_time + timedelta(minutes=n)).isoformat()}
+            start = time.perf_counter()
+            history.record(will, previous=previous)
+            elapsed += time.perf_counter() - start
+            records += 1
+            previous = will
+    return will_ids, elapsed / records
+
+
+def time_gets(history: RevisionHistory, will_ids: list, numbers, rounds: int, expected: list = None) -> dict:
+    """Microseconds to rebuild revisions; ``numbers(n)`` picks the revision for round n."""
+    latencies = []
+    for n in range(rounds):
+        index = n % len(will_ids)
+        number = numbers(n)
+        start = time.perf_counter()
+        revision = history.get(will_ids[index], number)
+        latencies.append(time.perf_counter() - start)
+        if expected is not None:
+            assert revision["content"] == expected[index][number - 1]
+    latencies.sort()
+    us = lambda value: round(value * 1e6, 1)  # noqa: E731
+    return {"mean_us": us(sum(latencies) / len(latencies)), "p50_us": us(latencies[len(latencies) // 2]),
+            "p99_us": us(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)])}
+
+
+def run(args, checkpoint_every: int, histories: list, directory: Path) -> dict:
+    revisions = len(histories) * args.edits
+    text_bytes = sum(len(text) for texts in histories for text in texts)
+    rng = random.Random(checkpoint_every)
+    random_number = lambda n: rng.randint(1, args.edits)  # noqa: E731
+    latest_number = lambda n: args.edits  # noqa: E731
+
+    gc.collect()
+    tracemalloc.start()
+    store = RevisionStore()
+    history = RevisionHistory(store, checkpoint_every=checkpoint_every)
+    will_ids, record_s = record_all(history, histories)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Check every revision once before timing
+    for will_id, texts in zip(will_ids, histories):
+        for number, text in enumerate(texts, 1):
+            assert history.get(will_id, number)["content"] == text
+    result = {
+        "checkpoint_every": checkpoint_every,
+        "checkpoints": sum(1 for texts in store._by_will.values() for revision in texts if "content" in revision),
+        "memory": {
+            "bytes_per_revision": round(memory / revisions),
+            "text_bytes_per_revision": round(text_bytes / revisions),
+            "record_us": round(record_s * 1e6, 1),
+            "get_latest": time_gets(history, will_ids, latest_number, args.rounds),
+            "get_random": time_gets(history, will_ids, random_number, args.rounds, histories),
+        },
+    }
+    del store, history
+
+    database = SQLiteDatabase(str(directory / f"revisions-{checkpoint_every}.db"), synchronous="NORMAL")
+    history = RevisionHistory(database.revisions, checkpoint_every=checkpoint_every)
+    will_ids, record_s = record_all(history, histories)
+    data_bytes = database.query("SELECT SUM(LENGTH(data)) FROM revisions")[0][0]
+    result["sqlite"] = {
+        "bytes_per_revision": round(data_bytes / revisions),
+        "record_us": round(record_s * 1e6, 1),
+        "get_latest": time_gets(history, will_ids, latest_number, args.rounds),
+        "get_random": time_gets(history, will_ids, random_number, args.rounds, histories),
+    }
+    database.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark will revision storage")
+    parser.add_argument("--wills", type=int, default=10)
+    parser.add_argument("--edits", type=int, default=500, help="revisions per will")
+    parser.add_argument("--content-size", type=int, default=8000, help="characters of will text to start from")
+    parser.add_argument("--checkpoints", default="1,8,32,128",
+                        help="checkpoint_every values to compare; 1 stores every revision in full")
+    parser.add_argument("--rounds", type=int, default=2000, help="revision rebuilds to time per case")
+    parser.add_argument("--dir", help="where to put the SQLite databases (defaults to the system temp directory)")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    histories = generate(args.wills, args.edits, args.content_size)
+    report = {"wills": args.wills, "edits": args.edits, "content_size": args.content_size, "runs": []}
+    with tempfile.TemporaryDirectory(prefix="revisions-bench-", dir=args.dir) as directory:
+        for checkpoint_every in (int(value) for value in args.checkpoints.split(",")):
+            result = run(args, checkpoint_every, histories, Path(directory))
+            report["runs"].append(result)
+            memory, sqlite = result["memory"], result["sqlite"]
+            print(f"checkpoint every {checkpoint_every:<4} ({result['checkpoints']} checkpoints)")
+            print(f"  memory  {memory['bytes_per_revision']:>8} B/revision (text {memory['text_bytes_per_revision']} B)"
+                  f"  record {memory['record_us']} us  get latest p50 {memory['get_latest']['p50_us']} us"
+                  f"  get random p50 {memory['get_random']['p50_us']} us, p99 {memory['get_random']['p99_us']} us")
+            print(f"  sqlite  {sqlite['bytes_per_revision']:>8} B/revision"
+                  f"  record {sqlite['record_us']} us  get latest p50 {sqlite['get_latest']['p50_us']} us"
+                  f"  get random p50 {sqlite['get_random']['p50_us']} us, p99 {sqlite['get_random']['p99_us']} us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other flat, as when the server runs from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture(scope="session")
+def server_dir(tmp_path_factory):
+    """Working directory of the imported server; its upload and user_data paths are relative to it."""
+    return tmp_path_factory.mktemp("server")
+
+
+@pytest.fixture(scope="session")
+def server(server_dir):
+    # server creates its data directories in the working directory at import
+    cwd = os.getcwd()
+    os.chdir(server_dir)
+    os.environ["DATA_DIR"] = str(server_dir / "data")
+    try:
+        module = importlib.import_module("server")
+    finally:
+        os.chdir(cwd)
+        del os.environ["DATA_DIR"]
+    yield module
+    if module.journal is not None:
+        module.journal.close()
+
+
+@pytest.fixture
+def server_cwd(server, server_dir, monkeypatch):
+    """The server, with the working directory its relative storage paths expect."""
+    monkeypatch.chdir(server_dir)
+    return server
@@ -0,0 +1,218 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import ai_client
+from ai_client import AIClient, AIError, ResponseCache
+
+
+class SlowBackend:
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def send(self, system_message, text):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return f"reply to {text}"
+
+
+def test_call_times_out():
+    client = AIClient(SlowBackend(1.0), timeout=0.05)
+    with pytest.raises(AIError, match="timed out"):
+        asyncio.run(client.complete("q", "english"))
+
+
+def test_concurrency_is_bounded():
+    backend = SlowBackend(0.02)
+    client = AIClient(backend, max_concurrency=3)
+
+    async def run():
+        return await asyncio.gather(*(client.complete(f"q{n}", "english") for n in range(10)))
+
+    replies = asyncio.run(run())
+    assert replies == [f"reply to q{n}" for n in range(10)]
+    assert backend.peak == 3
+
+
+def test_waiting_for_a_slot_does_not_count_towards_the_timeout():
+    # Each call takes 60% of the timeout; queued behind a busy slot, a call
+    # waits longer than the timeout in total but must still succeed
+    backend = SlowBackend(0.06)
+    client = AIClient(backend, timeout=0.1, max_concurrency=1)
+
+    async def run():
+        return await asyncio.gather(*(client.complete(f"q{n}", "english") for n in range(3)))
+
+    assert len(asyncio.run(run())) == 3
+
+
+def test_identical_calls_share_one_upstream_call():
+    backend = SlowBackend(0.02)
+    client = AIClient(backend, cache=ResponseCache())
+
+    async def run():
+        return await asyncio.gather(*(client.complete("same", "hindi") for _ in range(5)))
+
+    assert len(set(asyncio.run(run()))) == 1
+    assert backend.calls == 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+def test_cache_evicts_the_least_recently_used_reply():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "reply a")
+    cache.put("b", "reply b")
+    assert cache.get("a") == "reply a"
+    cache.put("c", "reply c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "reply a" and cache.get("c") == "reply c"
+    assert len(cache) == 2
+
+
+def test_cached_reply_expires_after_the_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ai_client, "time", clock)
+    backend = SlowBackend(0)
+    client = AIClient(backend, cache=ResponseCache(ttl=60))
+
+    assert asyncio.run(client.complete("q", "english")) == "reply to q"
+    clock.now += 59
+    asyncio.run(client.complete("q", "english"))
+    assert backend.calls == 1
+
+    clock.now += 2
+    assert client.cache.get(ai_client.cache_key("english", ai_client.system_message_for("english"), "q", "")) is None
+    asyncio.run(client.complete("q", "english"))
+    assert backend.calls == 2
+    assert client.cache.stats()["hits"] == 1
+
+class ChunkedBackend:
+    """Streams a reply in chunks, waiting ``delay`` before each; ``stall_after`` chunks then hangs."""
+
+    def __init__(self, chunks, delay=0.01, stall_after=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.stall_after = stall_after
+        self.opened = 0
+        self.closed = 0
+
+    async def send(self, system_message, text):
+        return "".join(self.chunks)
+
+    async def stream(self, system_message, text):
+        self.opened += 1
+        try:
+            for n, chunk in enumerate(self.chunks):
+                if n == self.stall_after:
+                    await asyncio.sleep(3600)
+                await asyncio.sleep(self.delay)
+                yield chunk
+        finally:
+            self.closed += 1
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_stream_yields_chunks_in_order_and_caches_the_reply():
+    backend = ChunkedBackend(["My ", "house ", "to ", "my ", "son."])
+    client = AIClient(backend, cache=ResponseCache())
+
+    assert asyncio.run(collect(client.stream("q", "english"))) == ["My ", "house ", "to ", "my ", "son."]
+    assert asyncio.run(collect(client.stream("q", "english"))) == ["My house to my son."]
+    assert backend.opened == backend.closed == 1
+
+
+def test_stalled_stream_times_out_after_the_chunks_it_sent():
+    backend = ChunkedBackend(["a", "b", "c"], stall_after=2)
+    client = AIClient(backend, timeout=0.1, cache=ResponseCache())
+    received = []
+
+    async def run():
+        async for chunk in client.stream("q", "english"):
+            received.append(chunk)
+
+    with pytest.raises(AIError, match="stalled"):
+        asyncio.run(run())
+    assert received == ["a", "b"]
+    assert backend.closed == 1
+    assert len(client.cache) == 0
+
+
+def test_consumer_going_away_closes_upstream_and_frees_the_slot():
+    backend = ChunkedBackend(["a"] * 100, delay=0.01)
+    client = AIClient(backend, max_concurrency=1)
+
+    async def run():
+        stream = client.stream("q", "english")
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        # The slot is free again, so this call does not wait behind the abandoned stream
+        return await asyncio.wait_for(client.complete("other", "english"), 0.5)
+
+    assert asyncio.run(run()) == "a" * 100
+    assert backend.closed == 1
+
+
+def test_slow_consumer_does_not_hold_the_slot():
+    backend = ChunkedBackend(["a", "b", "c"], delay=0.01)
+    client = AIClient(backend, max_concurrency=1)
+
+    async def run():
+        stream = client.stream("q", "english")
+        assert await stream.__anext__() == "a"
+        # Upstream finishes while the reader sits on its first chunk
+        other = await asyncio.wait_for(client.complete("other", "english"), 0.5)
+        rest = await collect(stream)
+        return other, rest
+
+    assert asyncio.run(run()) == ("abc", ["b", "c"])
+
+
+def sse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+@pytest.mark.parametrize("stall_after, last_event", [(None, "done"), (1, "error")])
+def test_stream_endpoint_sends_server_sent_events(server, monkeypatch, stall_after, last_event):
+    monkeypatch.setattr(server, "ai_client", AIClient(ChunkedBackend(["నా ", "ఆస్తి"], stall_after=stall_after),
+                                                      timeout=0.1))
+    monkeypatch.setitem(server.app.dependency_overrides, server.get_current_user, lambda: "u1")
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/ai/assist/stream",
+                                     json={"query": "q", "language": "telugu", "will_context": ""})
+
+    response = asyncio.run(run())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    deltas = [data["delta"] for event, data in events if event == "message"]
+    assert deltas == ["నా ", "ఆస్తి"][:stall_after]
+    assert events[-1][0] == last_event
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import uuid
+
+import pytest
+
+from sqlite_store import SQLiteDatabase
+from store import FileStore
+
+
+def file_record(file_id, sha256, path=None):
+    if path is None:
+        path = f"user_data/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}" if sha256 else "user_data/u1/documents/a.bin"
+    return {"id": file_id, "user_id": "u1", "will_id": "w1", "filename": "a.bin", "stored_filename": "a.bin",
+            "file_type": "documents", "file_path": path, "size": 4, "sha256": sha256,
+            "created_at": "2025-01-01T00:00:00"}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def files(request, tmp_path):
+    if request.param == "memory":
+        yield FileStore()
+        return
+    db = SQLiteDatabase(str(tmp_path / "store.db"))
+    yield db.files
+    db.close()
+
+
+def test_sha256_count_follows_adds_and_removes(files):
+    files.add(file_record("f1", "aa" * 32))
+    files.add(file_record("f2", "aa" * 32))
+    files.add(file_record("f3", "bb" * 32))
+    files.add(file_record("f4", None))
+    assert files.count_by_sha256("aa" * 32) == 2
+    assert files.count_by_sha256("bb" * 32) == 1
+
+    files.remove("f1")
+    assert files.count_by_sha256("aa" * 32) == 1
+    files.remove("f2")
+    files.remove("f3")
+    assert files.count_by_sha256("aa" * 32) == 0
+    assert files.count_by_sha256("bb" * 32) == 0
+    # Removing an unknown file changes nothing
+    assert files.remove("f1") is None
+    assert files.count_by_sha256("aa" * 32) == 0
+
+
+def test_private_copies_do_not_count_as_blob_references(files):
+    files.add(file_record("f1", "aa" * 32))
+    files.add(file_record("f2", "aa" * 32, "user_data/u1/documents/0b4e.bin"))
+    assert files.count_by_sha256("aa" * 32) == 1
+
+    files.remove("f1")
+    assert files.count_by_sha256("aa" * 32) == 0
+    files.remove("f2")
+    assert files.count_by_sha256("aa" * 32) == 0
+
+
+def test_moving_a_record_onto_its_blob_adds_a_reference():
+    files = FileStore()
+    files.add(file_record("f1", "aa" * 32, "user_data/u1/documents/0b4e.bin"))
+    assert files.count_by_sha256("aa" * 32) == 0
+    files.update("f1", {"file_path": file_record("f1", "aa" * 32)["file_path"]})
+    assert files.count_by_sha256("aa" * 32) == 1
+    files.update("f1", {"file_path": "user_data/u1/documents/0b4e.bin"})
+    assert files.count_by_sha256("aa" * 32) == 0
+
+
+def upload(server, data, user_id="u1"):
+    tmp_path = server.blob_store.new_tmp_path()
+    tmp_path.write_bytes(data)
+    sha256 = hashlib.sha256(data).hexdigest()
+    return asyncio.run(server.store_file(user_id, "w1", "a.bin", "documents", tmp_path, len(data), sha256))
+
+
+def delete(server, file_info):
+    return asyncio.run(server.delete_file(file_info["id"], current_user=file_info["user_id"]))
+
+
+def test_last_reference_removes_the_blob(server_cwd):
+    file_info = upload(server_cwd, b"only copy " + uuid.uuid4().bytes)
+    blob = server_cwd.blob_store.path_for(file_info["sha256"])
+    assert blob.exists()
+
+    delete(server_cwd, file_info)
+    assert not blob.exists()
+    assert server_cwd.files_db.count_by_sha256(file_info["sha256"]) == 0
+
+
+def test_shared_blob_survives_until_its_last_file_is_deleted(server_cwd):
+    data = b"shared " + uuid.uuid4().bytes
+    first, second = upload(server_cwd, data), upload(server_cwd, data, user_id="u2")
+    assert first["file_path"] == second["file_path"]
+    blob = server_cwd.blob_store.path_for(first["sha256"])
+
+    delete(server_cwd, first)
+    assert blob.read_bytes() == data
+    assert server_cwd.files_db.count_by_sha256(first["sha256"]) == 1
+
+    delete(server_cwd, second)
+    assert not blob.exists()
+
+
+def test_legacy_private_copy_is_deleted_without_touching_the_blob(server_cwd):
+    data = b"legacy " + uuid.uuid4().bytes
+    shared = upload(server_cwd, data)
+    blob = server_cwd.blob_store.path_for(shared["sha256"])
+
+    # Stored before the blob store: a private copy in the user's directory
+    user_dir = server_cwd.storage_layout.ensure_user_dir("u1")
+    private = user_dir / "documents" / f"{uuid.uuid4()}.bin"
+    private.write_bytes(data)
+    legacy = server_cwd.files_db.add(file_record(str(uuid.uuid4()), shared["sha256"], str(private)))
+    assert server_cwd.files_db.count_by_sha256(shared["sha256"]) == 1
+
+    delete(server_cwd, legacy)
+    assert not private.exists()
+    assert blob.read_bytes() == data
+    assert server_cwd.files_db.count_by_sha256(shared["sha256"]) == 1
+
+    delete(server_cwd, shared)
+    assert not blob.exists()
+
+
+def test_legacy_private_copy_does_not_keep_the_blob_alive(server_cwd):
+    data = b"legacy " + uuid.uuid4().bytes
+    shared = upload(server_cwd, data)
+    blob = server_cwd.blob_store.path_for(shared["sha256"])
+    user_dir = server_cwd.storage_layout.ensure_user_dir("u1")
+    private = user_dir / "documents" / f"{uuid.uuid4()}.bin"
+    private.write_bytes(data)
+    legacy = server_cwd.files_db.add(file_record(str(uuid.uuid4()), shared["sha256"], str(private)))
+
+    delete(server_cwd, shared)
+    assert not blob.exists()
+    assert private.read_bytes() == data
+
+    delete(server_cwd, legacy)
+    assert not private.exists()
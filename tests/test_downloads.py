@@ -0,0 +1,43 @@
+import pytest
+
+from downloads import MAX_RANGES, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=990-5000", [(990, 999)]),
+    ("BYTES = 0-0", [(0, 0)]),
+    ("bytes=0-9, 5-19, 20-29", [(0, 29)]),
+    ("bytes=50-59,0-9", [(0, 9), (50, 59)]),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    assert parse_range(header, 1000) == []
+
+
+@pytest.mark.parametrize("header", [
+    "items=0-9",
+    "bytes=",
+    "bytes=abc-",
+    "bytes=5",
+    "bytes=9-0",
+    "bytes=--5",
+])
+def test_malformed_headers_are_ignored(header):
+    assert parse_range(header, 1000) is None
+
+
+def test_too_many_ranges_are_ignored():
+    header = "bytes=" + ",".join(f"{n * 10}-{n * 10}" for n in range(MAX_RANGES + 1))
+    assert parse_range(header, 100000) is None
+
+
+def test_empty_file_has_nothing_satisfiable():
+    assert parse_range("bytes=0-", 0) == []
@@ -0,0 +1,72 @@
+import asyncio
+import io
+import json
+import zipfile
+
+from exports import will_archive
+
+WILL = {"id": "w1", "user_id": "u1", "title": "My will", "language": "telugu",
+        "content": "నా ఆస్తి నా భార్యకు\nHouse to my son\n", "created_at": "2025-01-01T00:00:00",
+        "updated_at": "2025-01-02T00:00:00"}
+
+
+def file_record(n, path, filename, file_type="documents"):
+    return {"id": f"f{n}", "user_id": "u1", "will_id": "w1", "filename": filename, "file_type": file_type,
+            "file_path": str(path), "size": 0, "sha256": None, "created_at": "2025-01-01T00:00:00"}
+
+
+def export(will, files):
+    async def run():
+        return b"".join([chunk async for chunk in will_archive(will, files)])
+
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(run())))
+
+
+def test_archive_holds_the_will_and_every_file(tmp_path):
+    recording = bytes(range(256)) * 4000
+    (tmp_path / "a").write_bytes(recording)
+    (tmp_path / "b").write_text("deed of the house\n" * 1000)
+    (tmp_path / "c").write_text("second deed\n")
+    files = [
+        file_record(1, tmp_path / "a", "statement.webm", "audio"),
+        file_record(2, tmp_path / "b", "deed.txt"),
+        # Same name as the last one, and a client-supplied path to strip
+        file_record(3, tmp_path / "c", "../../etc/deed.txt"),
+    ]
+    archive = export(WILL, files)
+
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == [
+        "files/audio/statement.webm", "files/documents/deed (2).txt", "files/documents/deed.txt",
+        "metadata.json", "will.txt",
+    ]
+    assert archive.read("will.txt").decode("utf-8") == WILL["content"]
+    assert archive.read("files/audio/statement.webm") == recording
+    assert archive.read("files/documents/deed.txt") == (tmp_path / "b").read_bytes()
+    assert archive.read("files/documents/deed (2).txt") == b"second deed\n"
+    assert archive.getinfo("files/audio/statement.webm").compress_type == zipfile.ZIP_STORED
+    assert archive.getinfo("files/documents/deed.txt").compress_type == zipfile.ZIP_DEFLATED
+
+    metadata = json.loads(archive.read("metadata.json"))
+    assert metadata["will"]["title"] == "My will" and "content" not in metadata["will"]
+    assert [f["path"] for f in metadata["files"]] == [
+        "files/audio/statement.webm", "files/documents/deed.txt", "files/documents/deed (2).txt",
+    ]
+    assert metadata["missing_files"] == []
+
+
+def test_missing_files_are_listed_not_fatal(tmp_path):
+    (tmp_path / "a").write_bytes(b"present")
+    files = [file_record(1, tmp_path / "a", "a.pdf"), file_record(2, tmp_path / "gone", "gone.pdf")]
+    archive = export(WILL, files)
+
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == ["files/documents/a.pdf", "metadata.json", "will.txt"]
+    metadata = json.loads(archive.read("metadata.json"))
+    assert metadata["missing_files"] == [{"id": "f2", "filename": "gone.pdf"}]
+
+
+def test_will_without_files_or_content():
+    archive = export({**WILL, "content": None}, [])
+    assert archive.namelist() == ["will.txt", "metadata.json"]
+    assert archive.read("will.txt") == b""
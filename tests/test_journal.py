@@ -0,0 +1,57 @@
+import asyncio
+import gc
+
+from journal import Journal
+from store import UserStore, WillStore
+
+
+def user(n):
+    return {"id": f"u{n}", "email": f"u{n}@example.com", "mobile": str(n), "password": "x",
+            "created_at": "2025-01-01T00:00:00"}
+
+
+def open_journal(directory):
+    users, wills = UserStore(), WillStore()
+    journal = Journal(directory, [users, wills])
+    replayed = journal.open()
+    return journal, users, replayed
+
+
+def test_replay_restores_acknowledged_writes(tmp_path):
+    journal, users, _ = open_journal(tmp_path)
+    for n in range(3):
+        users.add(user(n))
+    asyncio.run(journal.sync())
+    journal.close()
+
+    journal, users, replayed = open_journal(tmp_path)
+    journal.close()
+    assert replayed == 3
+    # Collection is paused only while replaying
+    assert gc.isenabled()
+    assert [users.get(f"u{n}")["email"] for n in range(3)] == ["u0@example.com", "u1@example.com", "u2@example.com"]
+
+
+def test_replay_stops_at_torn_last_line(tmp_path):
+    journal, users, _ = open_journal(tmp_path)
+    users.add(user(1))
+    users.add(user(2))
+    asyncio.run(journal.sync())
+    journal.close()
+
+    # A crash in the middle of a write leaves half a line at the end
+    segment = sorted(tmp_path.glob("journal-*.jsonl"))[-1]
+    with open(segment, "ab") as f:
+        f.write(b'["user.add",{"id":"u3","email":"u3@exa')
+
+    journal, users, replayed = open_journal(tmp_path)
+    assert replayed == 2
+    assert users.get("u2") is not None and users.get("u3") is None
+
+    # The journal keeps working after the torn entry
+    users.add(user(4))
+    asyncio.run(journal.sync())
+    journal.close()
+    journal, users, _ = open_journal(tmp_path)
+    journal.close()
+    assert users.get("u4") is not None
@@ -0,0 +1,135 @@
+import asyncio
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import uvicorn
+
+from delivery_standin import DeliveryStandIn
+from outbox import FAILED, PENDING, SENDING, SENT, HTTPGatewaySender, Outbox, SMTPSender
+from store import MessageStore
+
+
+@asynccontextmanager
+async def standin_senders(fail_rate=0.0):
+    """The stand-in's SMTP server and gateway on free ports, with senders for both."""
+    standin = DeliveryStandIn(fail_rate)
+    smtp = await asyncio.start_server(standin.handle_smtp, "127.0.0.1", 0)
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    http = uvicorn.Server(uvicorn.Config(standin.gateway(), log_level="warning"))
+    serving = asyncio.create_task(http.serve(sockets=[sock]))
+    while not http.started:
+        await asyncio.sleep(0.01)
+    url = f"http://127.0.0.1:{sock.getsockname()[1]}/send"
+    senders = {
+        "email": SMTPSender("127.0.0.1", smtp.sockets[0].getsockname()[1]),
+        "whatsapp": HTTPGatewaySender(url, "whatsapp"),
+    }
+    try:
+        yield standin, senders
+    finally:
+        http.should_exit = True
+        await serving
+        smtp.close()
+        await smtp.wait_closed()
+
+
+def message(n, channel):
+    return {"id": f"m{n}", "sender_id": "u1", "recipient_name": f"Recipient {n}",
+            "recipient_email": f"r{n}@example.com", "recipient_phone": f"+91{n:010d}",
+            "message_text": f"Message {n}", "preference": channel, "will_id": "w1", "channel": channel}
+
+
+def test_batches_are_per_channel():
+    async def run():
+        async with standin_senders() as (standin, senders):
+            store = MessageStore()
+            outbox = Outbox(store, senders, batch_size=2)
+            for n in range(3):
+                outbox.submit(message(n, "email"))
+            for n in range(3, 8):
+                outbox.submit(message(n, "whatsapp"))
+
+            batches = [await outbox.deliver("whatsapp") for _ in range(4)]
+            assert batches == [2, 2, 1, 0]
+            assert {d["channel"] for d in standin.delivered} == {"whatsapp"}
+
+            assert [await outbox.deliver("email") for _ in range(3)] == [2, 1, 0]
+            return standin, store
+
+    standin, store = asyncio.run(run())
+    assert sorted(d["channel"] for d in standin.delivered) == ["email"] * 3 + ["whatsapp"] * 5
+    for n in range(8):
+        assert store.get(f"m{n}")["status"] == SENT
+        assert store.get(f"m{n}")["delivered_at"] is not None
+
+
+def test_expired_lease_is_claimed_again():
+    async def run():
+        async with standin_senders() as (standin, senders):
+            store = MessageStore()
+            outbox = Outbox(store, senders)
+            outbox.submit(message(1, "email"))
+            # A worker claims the message and dies before delivering it
+            now = time.time()
+            assert len(store.claim("email", now, now + 0.2, 10)) == 1
+            assert store.get("m1")["status"] == SENDING
+
+            assert await outbox.deliver("email") == 0
+            await asyncio.sleep(0.3)
+            assert await outbox.deliver("email") == 1
+            return standin, store
+
+    standin, store = asyncio.run(run())
+    assert [d["id"] for d in standin.delivered] == ["<m1@willwriting>"]
+    assert store.get("m1")["status"] == SENT
+    assert store.get("m1")["attempts"] == 2
+
+
+def test_failures_back_off_exponentially_then_fail():
+    async def run():
+        async with standin_senders(fail_rate=1.0) as (standin, senders):
+            store = MessageStore()
+            outbox = Outbox(store, senders, max_attempts=3, retry_delay=10)
+            outbox.submit(message(1, "whatsapp"))
+            delays = []
+            for _ in range(3):
+                started = time.time()
+                assert await outbox.deliver("whatsapp") == 1
+                delays.append(store.get("m1")["next_attempt_at"] - started)
+                # Not due until the backoff has passed
+                assert await outbox.deliver("whatsapp") == 0
+                if store.get("m1")["status"] == PENDING:
+                    store.update("m1", {"next_attempt_at": 0})
+            return standin, store, delays
+
+    standin, store, delays = asyncio.run(run())
+    assert 8 <= delays[0] <= 12.5
+    assert 16 <= delays[1] <= 24.5
+    assert standin.delivered == [] and standin.rejected == 3
+    final = store.get("m1")
+    assert final["status"] == FAILED and final["attempts"] == 3
+    assert final["last_error"] == "stand-in failure"
+    assert store.claim("whatsapp", time.time() + 10 ** 6, 0, 10) == []
+
+
+def test_failed_email_is_retried_and_delivered():
+    async def run():
+        async with standin_senders(fail_rate=1.0) as (standin, senders):
+            store = MessageStore()
+            outbox = Outbox(store, senders, retry_delay=10)
+            outbox.submit(message(1, "email"))
+            assert await outbox.deliver("email") == 1
+            assert store.get("m1")["status"] == PENDING
+            assert "550" in store.get("m1")["last_error"]
+
+            standin.fail_rate = 0.0
+            store.update("m1", {"next_attempt_at": 0})
+            assert await outbox.deliver("email") == 1
+            return standin, store
+
+    standin, store = asyncio.run(run())
+    assert len(standin.delivered) == 1
+    assert store.get("m1")["status"] == SENT
+    assert store.get("m1")["last_error"] is None
@@ -0,0 +1,50 @@
+import pytest
+from fastapi import HTTPException
+
+from store import WillStore
+
+
+def will(n, updated_at):
+    return {"id": f"w{n:02d}", "user_id": "owner", "title": f"Will {n}", "content": "",
+            "created_at": updated_at, "updated_at": updated_at}
+
+
+@pytest.mark.parametrize("sort_value, record_id", [
+    ("2025-01-02T03:04:05.123456", "6be5b43a-28da-4ba4-94d9-1ccca3a6cfca"),
+    ("2025-01-02T03:04:05", "x"),
+    ("2025-01-02T03:04:05+05:30", "id with spaces/and?symbols"),
+    ("", ""),
+])
+def test_cursor_round_trip(server, sort_value, record_id):
+    cursor = server.encode_cursor({"updated_at": sort_value, "id": record_id}, "updated_at")
+    assert "=" not in cursor
+    assert server.decode_cursor(cursor) == (sort_value, record_id)
+
+
+def test_no_cursor_is_the_first_page(server):
+    assert server.decode_cursor(None) is None
+    assert server.decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24", "WzFd", "e30"])
+def test_invalid_cursor_is_a_400(server, cursor):
+    with pytest.raises(HTTPException) as raised:
+        server.decode_cursor(cursor)
+    assert raised.value.status_code == 400
+
+
+def test_pages_resume_after_the_cursor(server):
+    wills = WillStore()
+    # Pairs share a timestamp, so the id has to break ties across page ends
+    for n in range(25):
+        wills.add(will(n, f"2025-01-01T00:00:{n // 2:02d}"))
+    seen, cursor = [], None
+    while True:
+        page = wills.page_for_owner("owner", 4, server.decode_cursor(cursor))
+        seen += [record["id"] for record in page]
+        if len(page) < 4:
+            break
+        cursor = server.encode_cursor(page[-1], "updated_at")
+    expected = [record["id"] for record in sorted(wills.list_for_owner("owner"),
+                                                 key=lambda r: (r["updated_at"], r["id"]), reverse=True)]
+    assert seen == expected
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+import time
+
+from layout import StorageLayout
+from reconciler import StorageReconciler
+from store import FileStore
+
+HOUR = 3600
+DAY = 86400
+
+
+def make_reconciler(tmp_path):
+    layout = StorageLayout(tmp_path / "user_data")
+    files = FileStore()
+    reconciler = StorageReconciler(layout, files, tmp_path / "reconciler.lock", io_budget=10000,
+                                   grace=HOUR, retention=7 * DAY)
+    return reconciler, layout, files
+
+
+def write(path, data=b"data", age=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    moment = time.time() - age
+    os.utime(path, (moment, moment))
+    return path
+
+
+def write_blob(layout, data, age=0):
+    sha256 = hashlib.sha256(data).hexdigest()
+    return write(layout.blob_path(sha256), data, age), sha256
+
+
+def file_record(n, path, sha256=None):
+    return {"id": f"f{n}", "user_id": "u1", "will_id": "w1", "filename": f"{n}.bin",
+            "stored_filename": path.name, "file_type": "documents", "file_path": str(path),
+            "size": 4, "sha256": sha256, "created_at": "2025-01-01T00:00:00"}
+
+
+def run_pass(reconciler):
+    return asyncio.run(reconciler.run_pass())
+
+
+def test_orphans_inside_the_grace_period_are_left_alone(tmp_path):
+    reconciler, layout, _ = make_reconciler(tmp_path)
+    blob, _ = write_blob(layout, b"fresh blob", age=HOUR / 2)
+    user_file = write(layout.user_dir("u1") / "documents" / "fresh.bin", age=HOUR / 2)
+    tmp_file = write(layout.blobs_root / "tmp" / "upload", age=HOUR / 2)
+
+    report = run_pass(reconciler)
+    assert report["quarantined"] == 0
+    assert blob.exists() and user_file.exists() and tmp_file.exists()
+
+
+def test_orphan_is_quarantined_and_restored_once_referenced_again(tmp_path):
+    reconciler, layout, files = make_reconciler(tmp_path)
+    user_file = write(layout.user_dir("u1") / "documents" / "old.bin", age=2 * HOUR)
+    blob, sha256 = write_blob(layout, b"old blob", age=2 * HOUR)
+
+    report = run_pass(reconciler)
+    assert report["quarantined"] == 2
+    assert not user_file.exists() and not blob.exists()
+    assert (layout.quarantine_root / user_file.relative_to(layout.root)).exists()
+    assert (layout.quarantine_root / blob.relative_to(layout.root)).exists()
+
+    files.add(file_record(1, user_file))
+    files.add(file_record(2, blob, sha256))
+    report = run_pass(reconciler)
+    assert report["restored"] == 2 and report["missing_count"] == 0
+    assert user_file.read_bytes() == b"data" and blob.read_bytes() == b"old blob"
+
+
+def test_blob_referenced_only_by_a_file_record_is_kept(tmp_path):
+    reconciler, layout, files = make_reconciler(tmp_path)
+    blob, sha256 = write_blob(layout, b"shared", age=2 * DAY)
+    # The record is the blob's only reference; no per-user copy exists
+    files.add(file_record(1, blob, sha256))
+
+    report = run_pass(reconciler)
+    assert report["quarantined"] == 0 and report["missing_count"] == 0
+    assert blob.exists()
+
+
+def test_blob_shared_only_with_a_private_copy_is_quarantined(tmp_path):
+    reconciler, layout, files = make_reconciler(tmp_path)
+    blob, sha256 = write_blob(layout, b"legacy", age=2 * DAY)
+    # A legacy record with the same content points at its own copy, not the blob
+    private = write(layout.user_dir("u1") / "documents" / "legacy.bin", b"legacy", age=2 * DAY)
+    files.add(file_record(1, private, sha256))
+
+    report = run_pass(reconciler)
+    assert report["quarantined"] == 1
+    assert not blob.exists() and private.exists()
+
+
+def test_quarantined_files_are_deleted_only_after_retention(tmp_path):
+    reconciler, layout, _ = make_reconciler(tmp_path)
+    user_file = write(layout.user_dir("u1") / "audio" / "old.webm", age=30 * DAY)
+    quarantined = layout.quarantine_root / user_file.relative_to(layout.root)
+
+    assert run_pass(reconciler)["quarantined"] == 1
+    # Quarantine restarts the clock, however old the file itself was
+    report = run_pass(reconciler)
+    assert report["deleted"] == 0 and quarantined.exists()
+
+    moment = time.time() - 6 * DAY
+    os.utime(quarantined, (moment, moment))
+    assert run_pass(reconciler)["deleted"] == 0 and quarantined.exists()
+
+    moment = time.time() - 8 * DAY
+    os.utime(quarantined, (moment, moment))
+    report = run_pass(reconciler)
+    assert report["deleted"] == 1
+    assert not quarantined.exists() and not user_file.exists()
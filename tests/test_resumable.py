@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+
+import httpx
+import pytest
+
+from resumable import ResumableUploads, merge_ranges, missing_ranges
+
+DATA = bytes(range(256)) * 40
+
+
+def test_merge_ranges_out_of_order_and_overlapping():
+    ranges = []
+    for start, end in [(800, 1000), (0, 100), (50, 300), (300, 400), (900, 950), (600, 700)]:
+        ranges = merge_ranges(ranges, start, end)
+    assert ranges == [[0, 400], [600, 700], [800, 1000]]
+    assert missing_ranges(ranges, 1200) == [[400, 600], [700, 800], [1000, 1200]]
+    assert merge_ranges(ranges, 350, 850) == [[0, 1000]]
+
+
+def test_out_of_order_and_overlapping_chunks_assemble_the_file(tmp_path):
+    uploads = ResumableUploads(tmp_path / "sessions")
+    meta = uploads.create("u1", "w1", "a.webm", "audio", len(DATA))
+    for start, end in [(8000, len(DATA)), (0, 3000), (2000, 6000), (5000, 9000)]:
+        meta = uploads.write_chunk(meta["id"], start, DATA[start:end])
+    assert meta["ranges"] == [[0, len(DATA)]]
+
+    destination = tmp_path / "assembled"
+    size, sha256 = uploads.finalize(meta["id"], destination)
+    assert size == len(DATA)
+    assert sha256 == hashlib.sha256(DATA).hexdigest()
+    assert destination.read_bytes() == DATA
+    assert uploads.load(meta["id"]) is None
+    assert uploads.write_chunk(meta["id"], 0, b"late") is None
+
+
+def test_expired_sessions_are_collected(tmp_path):
+    uploads = ResumableUploads(tmp_path / "sessions", ttl=3600)
+    idle = uploads.create("u1", "w1", "a.webm", "audio", 100)
+    active = uploads.create("u1", "w1", "b.webm", "audio", 100)
+    uploads.write_chunk(active["id"], 0, b"x" * 10)
+    moment = time.time() - 7200
+    os.utime(tmp_path / "sessions" / idle["id"] / "meta.json", (moment, moment))
+
+    assert uploads.collect_expired() == 1
+    assert uploads.load(idle["id"]) is None
+    assert uploads.load(active["id"])["ranges"] == [[0, 10]]
+    # Everything is idle once the clock passes the TTL
+    assert uploads.collect_expired(now=time.time() + 7200) == 1
+
+
+@pytest.fixture
+def api(server_cwd):
+    server = server_cwd
+    will_id = str(uuid.uuid4())
+    server.wills_db.add({"id": will_id, "user_id": "u1", "title": "Will", "language": "english", "content": "",
+                         "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00"})
+    server.app.dependency_overrides[server.get_current_user] = lambda: "u1"
+    yield server, will_id
+    server.app.dependency_overrides.clear()
+
+
+async def request(server, method, path, **kwargs):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.request(method, path, **kwargs)
+
+
+def test_chunks_outside_the_declared_size_are_refused(api):
+    server, will_id = api
+
+    async def run():
+        created = await request(server, "POST", f"/api/files/resumable/{will_id}",
+                                json={"filename": "a.webm", "file_type": "audio", "size": 1000})
+        upload_id = created.json()["upload_id"]
+        responses = [
+            await request(server, "PUT", f"/api/files/resumable/{upload_id}", params={"offset": offset},
+                          content=b"x" * length)
+            for offset, length in [(1000, 1), (990, 20), (-1, 1), (5000, 0)]
+        ]
+        status = await request(server, "GET", f"/api/files/resumable/{upload_id}")
+        return responses, status
+
+    responses, status = asyncio.run(run())
+    assert [response.status_code for response in responses] == [416, 416, 416, 416]
+    assert status.json()["received"] == 0
+
+
+def test_finalize_with_missing_ranges_is_refused(api):
+    server, will_id = api
+
+    async def run():
+        created = await request(server, "POST", f"/api/files/resumable/{will_id}",
+                                json={"filename": "a.webm", "file_type": "audio", "size": len(DATA)})
+        upload_id = created.json()["upload_id"]
+        path = f"/api/files/resumable/{upload_id}"
+        await request(server, "PUT", path, params={"offset": 0}, content=DATA[:4000])
+        await request(server, "PUT", path, params={"offset": 6000}, content=DATA[6000:])
+        incomplete = await request(server, "POST", f"{path}/finalize")
+        status = await request(server, "GET", path)
+        await request(server, "PUT", path, params={"offset": 3500}, content=DATA[3500:6500])
+        complete = await request(server, "POST", f"{path}/finalize")
+        return incomplete, status, complete
+
+    incomplete, status, complete = asyncio.run(run())
+    assert incomplete.status_code == 409
+    assert status.json()["missing"] == [[4000, 6000]]
+    assert complete.status_code == 200
+    file_info = server.files_db.get(complete.json()["file_id"])
+    assert file_info["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert open(file_info["file_path"], "rb").read() == DATA
@@ -0,0 +1,98 @@
+import subprocess
+
+import pytest
+
+from revisions import RevisionHistory, StaleRevisionError, apply_delta, make_delta, unified_diff
+from sqlite_store import SQLiteDatabase
+from store import RevisionStore
+
+TEXTS = [
+    "",
+    "hello world",
+    "hello there world",
+    "line 1\nline 2\nline 3\n",
+    "line 1\nline two\nline 3\nline 4",
+    "ఆస్తి వీలునామా\nमेरी संपत्ति\n",
+    "a\r\nb\rc\n",
+]
+
+
+@pytest.mark.parametrize("old", TEXTS)
+@pytest.mark.parametrize("new", TEXTS)
+def test_delta_round_trip(old, new):
+    assert apply_delta(old, make_delta(old, new)) == new
+
+
+def test_delta_copies_unchanged_text():
+    old = "".join(f"clause {n}\n" for n in range(1000))
+    new = old.replace("clause 500\n", "clause 500 (amended)\n")
+    delta = make_delta(old, new)
+    assert apply_delta(old, delta) == new
+    assert sum(len(item) for item in delta if isinstance(item, str)) < 100
+
+
+def test_diff_marks_missing_final_newline():
+    diff = unified_diff("hello world", "hello there world", "a", "b")
+    assert diff.splitlines() == [
+        "--- a",
+        "+++ b",
+        "@@ -1 +1 @@",
+        "-hello world",
+        "\\ No newline at end of file",
+        "+hello there world",
+        "\\ No newline at end of file",
+    ]
+
+
+def test_diff_of_added_final_newline():
+    diff = unified_diff("a\nb", "a\nb\n", "a", "b")
+    assert diff.endswith("-b\n\\ No newline at end of file\n+b\n")
+
+
+@pytest.mark.parametrize("old, new", [
+    ("hello world", "hello there world"),
+    ("a\nb", "a\nb\n"),
+    ("a\nb\n", "a\nc"),
+    ("", "new"),
+    ("p\rq\nr", "p\rq\nr\r"),
+])
+def test_diff_applies_with_patch(tmp_path, old, new):
+    if subprocess.run(["which", "patch"], capture_output=True).returncode:
+        pytest.skip("patch(1) is not installed")
+    target = tmp_path / "will.txt"
+    target.write_bytes(old.encode())
+    patch = tmp_path / "will.diff"
+    patch.write_bytes(unified_diff(old, new, "a", "b").encode())
+    subprocess.run(["patch", "-s", str(target), str(patch)], check=True)
+    assert target.read_bytes() == new.encode()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def revisions(request, tmp_path):
+    if request.param == "memory":
+        yield RevisionStore()
+        return
+    db = SQLiteDatabase(str(tmp_path / "store.db"))
+    yield db.revisions
+    db.close()
+
+
+def test_interleaved_updates_do_not_corrupt_history(revisions):
+    history = RevisionHistory(revisions)
+    text = "".join(f"clause {n}\n" for n in range(100))
+    will = {"id": "w1", "title": "Will", "language": "english", "content": text,
+            "updated_at": "2025-01-01T00:00:00"}
+    history.record(will)
+
+    # Two saves read the same version; the first one to record wins
+    first = {**will, "content": text.replace("clause 10\n", "clause ten\n"), "updated_at": "2025-01-01T00:00:01"}
+    second = {**will, "content": text.replace("clause 90\n", "clause ninety\n"),
+              "updated_at": "2025-01-01T00:00:02"}
+    assert history.record(first, previous=will)["number"] == 2
+    with pytest.raises(StaleRevisionError):
+        history.record(second, previous=will)
+
+    # Retried against what is stored now, the second save applies cleanly
+    retried = {**second, "content": first["content"].replace("clause 90\n", "clause ninety\n")}
+    assert history.record(retried, previous=first)["number"] == 3
+    assert [history.get("w1", n)["content"] for n in (1, 2, 3)] == [text, first["content"], retried["content"]]
@@ -0,0 +1,44 @@
+from search import SearchIndex, parse_query, search, tokenize
+from store import WillStore
+
+
+def test_tokenize_folds_case_and_keeps_accents():
+    assert tokenize("Café NAÏVE Straße") == ["café", "naïve", "strasse"]
+
+
+def test_tokenize_normalizes_decomposed_accents():
+    assert tokenize("Café") == tokenize("Café") == ["café"]
+
+
+def test_tokenize_cjk():
+    assert tokenize("遗嘱 财产，给我的女儿。") == ["遗嘱", "财产", "给我的女儿"]
+    assert tokenize("遺言書と財産") == ["遺言書と財産"]
+
+
+def test_tokenize_indic_scripts_keep_vowel_signs():
+    assert tokenize("నా ఆస్తిని నా భార్యకు।") == ["నా", "ఆస్తిని", "నా", "భార్యకు"]
+    assert tokenize("मेरी संपत्ति॥") == ["मेरी", "संपत्ति"]
+
+
+def test_tokenize_drops_zero_width_joiners():
+    assert tokenize("क्‍ष") == tokenize("क्ष")
+
+
+def test_parse_query_prefix():
+    assert parse_query("hou* son") == [("hou", True), ("son", False)]
+
+
+def test_user_index_is_built_on_first_search():
+    wills = WillStore()
+    index = SearchIndex(load=wills.list_for_owner)
+    wills.add({"id": "w1", "user_id": "a", "title": "House", "content": "my house to my son",
+               "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00"})
+    wills.add({"id": "w2", "user_id": "b", "title": "Flat", "content": "house",
+               "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00"})
+    assert len(index) == 0
+    assert [will_id for will_id, _ in search(index, "a", "house")] == ["w1"]
+    assert len(index) == 1
+
+    index.update(wills.update("w1", {"content": "my flat to my daughter", "title": "Flat"}))
+    assert search(index, "a", "house") == []
+    assert [will_id for will_id, _ in search(index, "a", "daughter")] == ["w1"]
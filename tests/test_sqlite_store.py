@@ -0,0 +1,37 @@
+import os
+import time
+
+from sqlite_store import SQLiteDatabase
+
+
+def user(n):
+    return {"id": f"u{n}", "email": f"{n}@example.com", "mobile": f"{n:010d}", "full_name": "x" * 200}
+
+
+def test_commits_leave_checkpoints_to_the_background_thread(tmp_path):
+    path = str(tmp_path / "store.db")
+    db = SQLiteDatabase(path, checkpoint_interval=0.05)
+    try:
+        assert db.query("PRAGMA synchronous")[0][0] == 1  # NORMAL
+        assert db.query("PRAGMA wal_autocheckpoint")[0][0] == 0
+        size = os.path.getsize(path)
+        for n in range(500):
+            db.users.add(user(n))
+        deadline = time.monotonic() + 5
+        while os.path.getsize(path) == size and time.monotonic() < deadline:
+            time.sleep(0.02)
+        # The rows reached the database file without any commit checkpointing
+        assert os.path.getsize(path) > size
+    finally:
+        db.close()
+    assert not db._checkpointer.is_alive()
+
+
+def test_checkpoint_thread_can_be_disabled(tmp_path):
+    db = SQLiteDatabase(str(tmp_path / "store.db"), synchronous="FULL", checkpoint_interval=0)
+    try:
+        assert db.query("PRAGMA synchronous")[0][0] == 2  # FULL
+        assert db.query("PRAGMA wal_autocheckpoint")[0][0] == 1000
+        assert db._checkpointer is None
+    finally:
+        db.close()
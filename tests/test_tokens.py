@@ -0,0 +1,100 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from sqlite_store import SQLiteDatabase
+from store import RevocationStore
+from tokens import TokenCache
+
+
+def test_entry_expires_at_the_token_exp():
+    cache = TokenCache()
+    cache.put("a", "u1", "j1", time.time() + 0.05)
+    cache.put("b", "u1", "j2", time.time() - 1)
+    assert cache.get("a") == ("u1", "j1")
+    assert cache.get("b") is None
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TokenCache(max_entries=2)
+    exp = time.time() + 60
+    cache.put("a", "u1", "j1", exp)
+    cache.put("b", "u2", "j2", exp)
+    cache.get("a")
+    cache.put("c", "u3", "j3", exp)
+    assert cache.get("b") is None
+    assert cache.get("a") == ("u1", "j1") and cache.get("c") == ("u3", "j3")
+
+
+def test_revocation_is_by_jti():
+    cache = TokenCache()
+    exp = time.time() + 60
+    cache.put("a", "u1", "j1", exp)
+    cache.put("b", "u1", "j2", exp)
+    cache.revoke("j1", exp)
+    assert cache.is_revoked("j1")
+    assert not cache.is_revoked("j2")
+    # An expired token needs no revocation entry
+    cache.revoke("j3", time.time() - 1)
+    assert not cache.is_revoked("j3")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def revocations(request, tmp_path):
+    if request.param == "memory":
+        yield RevocationStore()
+        return
+    db = SQLiteDatabase(str(tmp_path / "store.db"))
+    yield db.revocations
+    db.close()
+
+
+def test_revocation_is_shared_through_the_store(revocations):
+    # Two worker processes, each with its own cache over the shared store
+    first, second = TokenCache(revocations=revocations), TokenCache(revocations=revocations)
+    exp = time.time() + 60
+    second.put("a", "u1", "j1", exp)
+    assert not second.is_revoked("j1")
+
+    first.revoke("j1", exp)
+    assert second.is_revoked("j1")
+    assert not second.is_revoked("j2")
+    assert revocations.get("j1")["exp"] == exp
+
+
+def authenticate(server, token):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return asyncio.run(server.get_current_user(credentials))
+
+
+def test_token_without_jti_is_rejected(server):
+    exp = datetime.utcnow() + timedelta(hours=1)
+    token = jwt.encode({"sub": "u1", "exp": exp}, server.SECRET_KEY, algorithm=server.ALGORITHM)
+    with pytest.raises(HTTPException) as raised:
+        authenticate(server, token)
+    assert raised.value.status_code == 401
+
+
+def test_logout_revokes_only_its_own_login(server):
+    # Two logins by one user in the same second used to yield the same token
+    first = server.create_access_token({"sub": "u1"})
+    second = server.create_access_token({"sub": "u1"})
+    assert first != second
+    assert authenticate(server, first) == authenticate(server, second) == "u1"
+
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=first)
+    asyncio.run(server.logout(credentials, current_user="u1"))
+    with pytest.raises(HTTPException):
+        authenticate(server, first)
+    assert authenticate(server, second) == "u1"
+
+    # A login after the logout gets a token that is not already revoked
+    assert authenticate(server, server.create_access_token({"sub": "u1"})) == "u1"
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+from uploads import UploadLimitMiddleware
+
+LIMIT = 64 * 1024
+DOCUMENT_LIMIT = 16 * 1024
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, prefix="/upload/", max_bytes=LIMIT,
+                       limits={"documents": DOCUMENT_LIMIT, "video": LIMIT})
+    seen = []
+
+    @app.post("/upload/{name}")
+    async def upload(name: str, file: UploadFile = File(...)):
+        data = await file.read()
+        seen.append(len(data))
+        return {"size": len(data)}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return app, seen
+
+
+async def post(app, path, **kwargs):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, **kwargs)
+
+
+def test_upload_under_the_limit_passes():
+    app, seen = make_app()
+    response = asyncio.run(post(app, "/upload/a", files={"file": ("a.bin", b"x" * 1000)}))
+    assert response.status_code == 200
+    assert seen == [1000]
+
+
+def test_declared_length_over_the_limit_is_refused_unread():
+    app, seen = make_app()
+
+    async def body():
+        raise AssertionError("the body should not be read")
+        yield b""
+
+    response = asyncio.run(post(app, "/upload/a", content=body(),
+                                headers={"content-length": str(LIMIT + 1), "content-type": "multipart/form-data"}))
+    assert response.status_code == 413
+    assert seen == []
+
+
+def test_body_over_the_limit_is_cut_off():
+    app, seen = make_app()
+    chunks = []
+
+    async def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n'
+        for _ in range(8):
+            chunks.append(16 * 1024)
+            yield b"x" * (16 * 1024)
+
+    # Streamed without a Content-Length, so only the counter can catch it
+    response = asyncio.run(post(app, "/upload/a", content=body(),
+                                headers={"content-type": "multipart/form-data; boundary=b"}))
+    assert response.status_code == 413
+    assert seen == []
+    assert sum(chunks) <= LIMIT + 2 * 16 * 1024
+
+
+def test_other_paths_are_not_limited():
+    app, _ = make_app()
+    response = asyncio.run(post(app, "/other", files={"file": ("a.bin", b"x" * (LIMIT * 2))}))
+    assert response.status_code == 200
+
+
+def streamed_form(chunks, count, size=4 * 1024):
+    async def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.pdf"\r\n\r\n'
+        for _ in range(count):
+            chunks.append(size)
+            yield b"x" * size
+        yield b'\r\n--b--\r\n'
+
+    return body()
+
+
+def test_document_over_its_type_limit_is_cut_off_mid_stream():
+    app, seen = make_app()
+    chunks = []
+    # 40 kB is under the overall limit but over the documents limit
+    response = asyncio.run(post(app, "/upload/a", params={"file_type": "documents"}, content=streamed_form(chunks, 10),
+                                headers={"content-type": "multipart/form-data; boundary=b"}))
+    assert response.status_code == 413
+    assert seen == []
+    # Stopped once the documents limit was crossed, not after the whole body
+    assert sum(chunks) <= DOCUMENT_LIMIT + 2 * 4 * 1024 < 40 * 1024
+
+
+def test_type_limit_applies_only_to_that_type():
+    app, seen = make_app()
+    chunks = []
+    response = asyncio.run(post(app, "/upload/a", params={"file_type": "video"}, content=streamed_form(chunks, 10),
+                                headers={"content-type": "multipart/form-data; boundary=b"}))
+    assert response.status_code == 200
+    assert seen == [40 * 1024]
+
+
+def test_declared_length_over_the_type_limit_is_refused_unread():
+    app, seen = make_app()
+    response = asyncio.run(post(app, "/upload/a", params={"file_type": "documents"},
+                                files={"file": ("a.pdf", b"x" * (DOCUMENT_LIMIT + 1))}))
+    assert response.status_code == 413
+    assert seen == []
+
+
+def test_server_cuts_off_an_oversized_document(server_cwd, monkeypatch):
+    server = server_cwd
+    monkeypatch.setitem(server.app.dependency_overrides, server.get_current_user, lambda: "u1")
+    chunks = []
+    # Well under the video limit, so only the documents limit can stop it
+    body = streamed_form(chunks, 100, size=1024 * 1024)
+    response = asyncio.run(post(server.app, "/api/files/upload/w1", params={"file_type": "documents"}, content=body,
+                                headers={"content-type": "multipart/form-data; boundary=b"}))
+    assert response.status_code == 413
+    assert sum(chunks) <= server.MAX_UPLOAD_BYTES["documents"] + 2 * 1024 * 1024